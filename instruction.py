@@ -14,27 +14,17 @@ import sys
 # There must be a better way to do this, but I don't know what it is.
 sys.path.append('/Users/xyzzy/LLVM_PLY/ply-3.11')
 import llvm_instruction_parser as parser
+import llvm_graph
+import llvm_testdata
 
 ############################################################
 # All types of possible ValueInstruction (common ones moved to the front).
 ############################################################
 
-value_instruction_types = [
-    "CallInst",           # Call ... a type of ValueInstruction
-    "AllocaInst",         # %4 = alloca ... a type of ValueInstruction
-    "GetElementPtrInst",
-    "ICmpInst",           # Compare integers
-
-    "AddInst", "FAddInst", "SubInst", "FSubInst", "MulInst", "FMulInst", "UDivInst", "SDivInst", "FDivInst",
-    "URemInst", "SRemInst", "FRemInst", "ShlInst", "LShrInst", "AShrInst", "AndInst", "OrInst", "XorInst",
-    "ExtractElementInst", "InsertElementInst", "ShuffleVectorInst", "ExtractValueInst", "InsertValueInst",
-    "LoadInst", "TruncInst", "ZExtInst", "SExtInst", "FPTruncInst", "FPExtInst", "FPToUIInst", "FPToSIInst",
-    "UIToFPInst", "SIToFPInst", "PtrToIntInst", "IntToPtrInst", "BitCastInst", "AddrSpaceCastInst",
-    "FCmpInst", "PhiInst", "SelectInst", "VAArgInst", "LandingPadInst", "CatchPadInst", "CleanupPadInst",
-    "CmpXchgInst", "AtomicRMWInst"
-    ]
-
-other_instruction_types = [ "StoreInst", "FenceInst" ]
+# (These live in the parser now, so that tools like llvm_stats can
+# use them without running all of this.)
+value_instruction_types = parser.value_instruction_types
+other_instruction_types = parser.other_instruction_types
 
 ############################################################
 #
@@ -53,11 +43,10 @@ class Instruction:
     # Constructor
     ############################################################
     def __init__( self, instruction_string ):
-        # Reset the node numbers for each instruction in case we graph it.
+        # Each parse numbers its nodes from 0, in case we graph it.
         # For debugging we can look at the graph and print the node
         # serial numbers so we cansee if things are right.
-        parser._Node__serial_number = 0
-        self.root = parser.inst_parse( t )
+        self.root = parser.inst_parse( instruction_string )
         if ( self.root == None ):
             print( "The instruction did not parse correctly:" )
             print( instruction_string )
@@ -169,65 +158,35 @@ class Instruction:
 
 ############################################################
 #
-# Let's run some tests. These make no sense because I just copy/pasted
-# them out of all sorts of places.
+# Let's run some tests (see llvm_testdata for where they came from).
 #
 ############################################################
 
 if True:
-    testdata = [
-        '%buf.i.i = alloca [250 x i8], align 16',
-        '%yymsgbuf = alloca [128 x i8], align 16',
-        '%yyvsa = alloca [200 x i8*], align 16',
-        '%ref.tmp = alloca %"class.std::__cxx11::basic_string", align 8',
-        '%0 = getelementptr inbounds [128 x i8], [128 x i8]* %yymsgbuf, i64 0, i64 0',
-        'call void @llvm.lifetime.start.p0i8(i64 128, i8* nonnull %0) #13',
-        '%1 = bitcast [200 x i16]* %yyssa to i8*',
-        '%arraydecay1 = getelementptr inbounds [200 x i16], [200 x i16]* %yyssa, i64 0, i64 0',
-        '%2 = bitcast [200 x i8*]* %yyvsa to i8*',
-        '%arraydecay2 = getelementptr inbounds [200 x i8*], [200 x i8*]* %yyvsa, i64 0, i64 0',
-        '%3 = load i32, i32* @expressionyydebug, align 4, !tbaa !2',
-        '%tobool = icmp eq i32 %3, 0',
-        '%_IO_read_ptr = getelementptr inbounds %struct._IO_FILE, %struct._IO_FILE* %__fp, i64 0, i32 1',
-        '%0 = load i8*, i8** %_IO_read_ptr, align 8, !tbaa !6',
-        '%_IO_read_end = getelementptr inbounds %struct._IO_FILE, %struct._IO_FILE* %__fp, i64 0, i32 2',
-        '%1 = load i8*, i8** %_IO_read_end, align 8, !tbaa !11',
-        '%cmp = icmp ult i8* %0, %1',
-        '%call9 = call i32 (%struct._IO_FILE*, i8*, ...) @fprintf(%struct._IO_FILE* %9, i8* getelementptr inbounds ([19 x i8], [19 x i8]* @.str.1, i64 0, i64 0), i32 %yystate.1832) #14'
-    ]
+    testdata = llvm_testdata.testdata
 
-# These are from the compiler explorer web site, the "sander" little
-# function, with instructions that are syntactically identical
-# removed.
+# The "sander" little function from the compiler explorer web site.
 
 if False:
-    testdata = [
-        "%3 = alloca i32, align 4",
-        # Both the old kind (pre version 15) and the new kind:
-        "store i32 %0, i32* %3, align 4",
-        "store i32 %0, ptr %3, align 4",
-        # Both the old kind (pre version 15) and the new kind:
-        "%6 = load i32, i32* %3, align 4",
-        "%6 = load i32, ptr %3, align 4",
-        "%8 = icmp slt i32 %6, %7",
-        "%10 = load i32, i32* %3, align 4",
-        "%14 = phi i32 [ %10, %9 ], [ %12, %11 ]",
-        "store i32 %14, i32* %5, align 4",
-        "%16 = shl i32 %15, 2",
-  ]
+    testdata = llvm_testdata.sander
+
+############################################################
+# The checks of the parser and the tools around it (blocks, the
+# fast path, the modes, metrics, caches, ...) are under tests/; run
+# them with "python -m pytest".
+############################################################
 
 ############################################################
 # Main test code
 ############################################################
 
-i = 1
+graphs = []
 for t in testdata:
 
     print( t )
     inst = Instruction( t )
     tree = inst.root
-    tree.graph( "testdata_" + str( i ) + ".dot", True )
-    i = i + 1 # next graph file
+    graphs.append( tree )
 
     which = inst.instruction_type()
     if ( which == None ):
@@ -274,3 +233,6 @@ for t in testdata:
                     p = a.children[ 2 ].locate_tree_node( "Constant" )
                     if ( p != None ):
                         print( '    One of them is a constant' )
+
+# All of the graphs, one cluster per instruction.
+llvm_graph.write_dot( graphs, "testdata.dot", labels = testdata )
@@ -0,0 +1,179 @@
+# ============================================================
+#
+# Benchmarks: how long the parses take, measured rather than guessed.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# Each benchmark parses the same instructions more than one way and
+# prints the time per line for each. The times are the best of
+# several runs, with the garbage collector off during each run (and
+# a full collection before it), so one run doesn't pay for the last
+# one's garbage; the gc benchmark is the exception, since the
+# collector is what it measures.
+#
+#    block   block_parse on the whole lot versus a parse per line
+#    modes   a parse per line in each ParseContext mode that changes
+#            how the trees are built
+#    gc      the collector's share: every tree kept (as when a whole
+#            module is loaded), and each bufferful dropped before the
+#            next (as llvm_stats does), each with and without
+#            bulk_parsing and weak parents. Kept trees add up (100,000
+#            of the sample took about 1.5G), so mind --lines; gc-keep
+#            and gc-stream run just the one half.
+#
+# Run "python llvm_benchmark.py [--repeat N] [--lines N] benchmark
+# [corpus.ll ...]". Without a corpus it uses the instructions
+# instruction.py tests with (llvm_testdata), over and over. Lines of a
+# corpus that don't parse are left out, so every way of parsing has
+# the same work to do.
+#
+# ============================================================
+
+import gc
+import sys
+import time
+
+import llvm_instruction_parser as parser
+import llvm_testdata
+
+sample = llvm_testdata.testdata + llvm_testdata.sander
+
+############################################################
+# The best time of "repeat" runs of each of "runs", in seconds. The
+# runs take turns, so whatever else the machine is up to slows them
+# all down alike.
+############################################################
+def best_times( runs, repeat = 5, collector = False ):
+    times = [ [] for run in runs ]
+    for i in range( 0, repeat ):
+        for run, taken in zip( runs, times ):
+            gc.collect()
+            enabled = gc.isenabled()
+            if ( not collector ):
+                gc.disable()
+            try:
+                started = time.perf_counter()
+                result = run()
+                taken.append( time.perf_counter() - started )
+                # (Freeing what it made isn't part of the time.)
+                del result
+            finally:
+                if ( enabled ):
+                    gc.enable()
+    return [ min( taken ) for taken in times ]
+
+############################################################
+# The lines of the corpus files that parse, or the sample, repeated
+# (or cut) to "count" lines.
+############################################################
+def corpus_lines( files, count ):
+    lines = []
+    quiet = parser.ParseContext( error_sink = parser.discard_error )
+    for corpus in files:
+        with open( corpus ) as f:
+            for line in f:
+                line = line.strip()
+                if ( line != '' and parser.fragment_parse( 'Instruction', line, context = quiet ) != None ):
+                    lines.append( line )
+    if ( len( lines ) == 0 ):
+        lines = sample
+    return ( lines * ( count // len( lines ) + 1 ) )[ :count ]
+
+def _per_line( lines, **mode ):
+    return [ parser.fragment_parse( 'Instruction', line, context = parser.ParseContext( **mode ) ) for line in lines ]
+
+############################################################
+# block_parse against a parse per line. Microseconds per line.
+############################################################
+def block_benchmark( lines, repeat = 5 ):
+    text = '\n'.join( lines )
+    times = best_times( [ lambda: _per_line( lines ), lambda: parser.block_parse( text ) ], repeat )
+    return [ ( 'parse per line', times[ 0 ] * 1e6 / len( lines ) ),
+             ( 'block_parse', times[ 1 ] * 1e6 / len( lines ) ) ]
+
+############################################################
+# The default parse against the modes. Microseconds per line.
+############################################################
+modes = [ ( 'default', {} ),
+          ( 'flyweights', { 'flyweights' : True } ),
+          ( 'ast', { 'ast' : True } ),
+          ( 'ast and flyweights', { 'ast' : True, 'flyweights' : True } ) ]
+
+def modes_benchmark( lines, repeat = 5 ):
+    runs = []
+    for name, mode in modes:
+        # The first parse in a mode makes its actions.
+        _per_line( lines[ :1 ], **mode )
+        runs.append( lambda mode = mode: _per_line( lines, **mode ) )
+    times = best_times( runs, repeat )
+    return [ ( name, taken * 1e6 / len( lines ) ) for ( name, mode ), taken in zip( modes, times ) ]
+
+############################################################
+# The collector, with and without bulk_parsing and weak parents.
+# Microseconds per line.
+############################################################
+def _keep_all( lines, bulk, weak ):
+    parse = lambda line: parser.fragment_parse( 'Instruction', line,
+                                                context = parser.ParseContext( weak_parents = weak ) )
+    if ( bulk ):
+        with parser.bulk_parsing():
+            return parser.parse_many( lines, parse = parse )
+    return parser.parse_many( lines, parse = parse )
+
+def _drop_each( lines, bulk, weak, buffer_lines = 4096 ):
+    context = parser.ParseContext( resync_lines = True, weak_parents = weak )
+    for i in range( 0, len( lines ), buffer_lines ):
+        text = '\n'.join( lines[ i:i + buffer_lines ] )
+        if ( bulk ):
+            with parser.bulk_parsing():
+                parser.block_parse( text, context = context )
+        else:
+            parser.block_parse( text, context = context )
+
+def _gc_ways( name, how, lines, repeat ):
+    ways = [ ( False, False ), ( True, False ), ( False, True ), ( True, True ) ]
+    runs = [ lambda bulk = bulk, weak = weak: how( lines, bulk, weak ) for bulk, weak in ways ]
+    times = best_times( runs, repeat, collector = True )
+    return [ ( name + ( ', bulk_parsing' if bulk else '' ) + ( ', weak parents' if weak else '' ),
+               taken * 1e6 / len( lines ) ) for ( bulk, weak ), taken in zip( ways, times ) ]
+
+def gc_keep_benchmark( lines, repeat = 5 ):
+    return _gc_ways( 'keep', _keep_all, lines, repeat )
+
+def gc_stream_benchmark( lines, repeat = 5 ):
+    return _gc_ways( 'stream', _drop_each, lines, repeat )
+
+def gc_benchmark( lines, repeat = 5 ):
+    return gc_keep_benchmark( lines, repeat ) + gc_stream_benchmark( lines, repeat )
+
+benchmarks = { 'block' : block_benchmark, 'modes' : modes_benchmark, 'gc' : gc_benchmark,
+               'gc-keep' : gc_keep_benchmark, 'gc-stream' : gc_stream_benchmark }
+
+if __name__ == "__main__":
+    repeat = 5
+    count = 2000
+    which = None
+    files = []
+    args = sys.argv[1:]
+    while ( len( args ) > 0 ):
+        arg = args.pop( 0 )
+        if ( arg == '--repeat' ):
+            repeat = int( args.pop( 0 ) )
+        elif ( arg == '--lines' ):
+            count = int( args.pop( 0 ) )
+        elif ( which == None ):
+            which = arg
+        else:
+            files.append( arg )
+    if ( which not in benchmarks ):
+        print( 'Which benchmark? One of: ' + ', '.join( sorted( benchmarks ) ) )
+        sys.exit( 1 )
+    lines = corpus_lines( files, count )
+    # Build the tables before anything is timed.
+    _per_line( lines[ :1 ] )
+    parser.block_parse( lines[ 0 ] )
+    print( str( len( lines ) ) + ' lines, best of ' + str( repeat ) )
+    for name, us in benchmarks[ which ]( lines, repeat ):
+        print( '%-36s %8.1f us/line' % ( name, us ) )
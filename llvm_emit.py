@@ -0,0 +1,288 @@
+# ============================================================
+#
+# Back to text: LLVM instructions from parse trees.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# Change a tree (rename a value, change an alignment, ...) and then
+#
+#    text = llvm_emit.emit( tree )
+#
+# gives back the instruction the way LLVM 15 prints it. The words are
+# the terminals of the tree, in order; all the work is in the spaces
+# between them. LLVM puts one space between words except
+#
+#    no space before   , ) * >   (and : is part of its token)
+#    no space after    ( < !
+#    no space before ( unless it opens a function type's parameters
+#                      or a constant expression: "i32 (i8*, ...)",
+#                      "bitcast (", but "@f(", "addrspace(1)"
+#    [ ] and { } are  tight, "[4 x i32]" and "!{!1}", except that
+#                      phi incomings, structs and operand bundles get
+#                      spaces inside: "[ %a, %b ]", "{ i32, i1 }"
+#                      (an empty one is still "{}")
+#    c"..."            the c of a character array is stuck to its
+#                      string
+#
+# Comments are thrown away by the lexer so they are gone. A LazyNode
+# that was never looked at (see lazy_inst_parse) is written just as
+# it was cut from the input.
+#
+# Trees from AST mode have lost their punctuation, and the empty
+# children, so for those we put it back: the children of a node are
+# matched up against the productions for its nodetype (see _layout)
+# and the punctuation goes back in where the production has it. A
+# node whose children don't fit any production gets a ValueError
+# rather than some text that isn't what was parsed.
+#
+# The tree is walked with a stack (no recursion) and the words are
+# joined once at the end. emit_many() writes lots of them to a file,
+# a line each, through a buffer.
+#
+# Run "python llvm_emit.py corpus.ll" for the round trip test on a
+# file of instructions.
+#
+# ============================================================
+
+import sys
+
+import llvm_instruction_parser as parser
+
+_tight_before = frozenset( [ ',', ')', '*', '>' ] )
+_tight_after = frozenset( [ '(', '<', '!' ] )
+_closing = frozenset( [ ']', '}' ] )
+_opening = frozenset( [ '[', '{' ] )
+
+# Whose brackets get spaces inside.
+_spaced = frozenset( [ 'Inc', 'StructType', 'StructConst', 'OperandBundles' ] )
+
+############################################################
+# Does a '(' belonging to "owner" get a space in front?
+############################################################
+def _spaced_paren( owner ):
+    return owner == 'FuncType' or owner.endswith( 'Expr' )
+
+# The grammar, from the parser (see _layout), and the nodetypes with
+# some punctuation in them; the others are written as they are.
+_rules = None
+_nullable = None
+_punctuated = None
+_keywords = frozenset( parser.reserved.values() )
+_literals = frozenset( parser.literals )
+
+# The nodes that aren't named after their grammar symbol (select has
+# its own name, and the fields of a DIGlobalVariableExpression share
+# its name).
+_aliases = { '_SelectInst' : ( 'SelectInst', ),
+             'DIGlobalVariableExpression' : ( 'DIGlobalVariableExpression',
+                                              'DIGlobalVariableExpressionField' ) }
+
+# What children ( nodetype, labels ) have, in the order they are
+# written out: None when they are exactly a production's right hand
+# side, or a list of child numbers and punctuation to put between.
+_layouts = {}
+
+############################################################
+# What a child is, as far as matching it to a grammar symbol goes:
+# its nodetype for a nonterminal, and for a terminal the token type
+# when we know it from the text (keywords and literals), else None.
+############################################################
+def _label( node ):
+    if ( not node.was_terminal ):
+        return node.nodetype
+    text = node.nodetype
+    if ( node.is_epsilon ):
+        return 'empty'
+    if ( text in _literals ):
+        return text
+    return parser.reserved.get( text )
+
+def _fits( symbol, label ):
+    if ( label == None ):
+        return symbol not in _rules and symbol not in _keywords and symbol not in _literals
+    if ( label in _aliases ):
+        return symbol in _aliases[ label ]
+    return symbol == label
+
+############################################################
+# Match "labels" (AST children) against "rhs" from position "at",
+# skipping the punctuation and the symbols that can be empty.
+# Returns the layout (see _layouts) or None.
+############################################################
+def _match( rhs, at, labels, used ):
+    if ( at == len( rhs ) ):
+        if ( used == len( labels ) ):
+            return []
+        return None
+    symbol = rhs[ at ]
+    if ( symbol in parser.ast_punctuation ):
+        rest = _match( rhs, at + 1, labels, used )
+        if ( rest == None ):
+            return None
+        return [ symbol ] + rest
+    if ( used < len( labels ) and _fits( symbol, labels[ used ] ) ):
+        rest = _match( rhs, at + 1, labels, used + 1 )
+        if ( rest != None ):
+            return [ used ] + rest
+    if ( symbol in _nullable ):
+        return _match( rhs, at + 1, labels, used )
+    return None
+
+def _grammar():
+    global _rules, _nullable, _punctuated
+    _rules, _nullable = parser._grammar()
+    _punctuated = set()
+    for symbol, productions in _rules.items():
+        if ( any( [ x in parser.ast_punctuation for rhs in productions for x in rhs ] ) ):
+            _punctuated.add( symbol )
+    for nodetype, symbols in _aliases.items():
+        if ( any( [ x in _punctuated for x in symbols ] ) ):
+            _punctuated.add( nodetype )
+
+def _layout( nodetype, labels ):
+    productions = []
+    for symbol in _aliases.get( nodetype, ( nodetype, ) ):
+        productions.extend( _rules.get( symbol, [] ) )
+    for rhs in productions:
+        if ( len( rhs ) == len( labels ) and
+             all( [ _fits( symbol, label ) for symbol, label in zip( rhs, labels ) ] ) ):
+            return None
+    for rhs in productions:
+        found = _match( rhs, 0, labels, 0 )
+        if ( found != None ):
+            return found
+    raise ValueError( 'Can not write out ' + nodetype + ' with children ' + str( labels ) )
+
+############################################################
+# The children of "node" to write out, with any punctuation AST mode
+# took away put back (as strings).
+############################################################
+def _written_children( node ):
+    kids = node.children
+    if ( _punctuated == None ):
+        _grammar()
+    if ( node.nodetype not in _punctuated ):
+        return kids
+    labels = tuple( [ _label( x ) for x in kids ] )
+    key = ( node.nodetype, labels )
+    if ( key in _layouts ):
+        layout = _layouts[ key ]
+    else:
+        layout = _layout( node.nodetype, labels )
+        _layouts[ key ] = layout
+    if ( layout == None ):
+        return kids
+    return [ kids[ x ] if type( x ) is int else x for x in layout ]
+
+def emit( tree ):
+    words = []
+    # No space before the next word?
+    tight = True
+    previous = None
+    # Each entry is ( children, where we are in them, whose they are ).
+    # Terminals are done right where they are found; we only stack
+    # up when going down into a nonterminal.
+    work = [ ( [ tree ], 0, None ) ]
+    while ( len( work ) > 0 ):
+        kids, i, owner = work.pop()
+        count = len( kids )
+        while ( i < count ):
+            node = kids[ i ]
+            i = i + 1
+            if ( type( node ) is str ):
+                # Punctuation put back into an AST mode tree.
+                text = node
+            elif ( node.is_epsilon ):
+                continue
+            elif ( not node.was_terminal ):
+                if ( type( node ) is parser.LazyNode and node._source_text != None ):
+                    # Never parsed, so it is still just text.
+                    text = node._source_text.strip()
+                    if ( not tight and text[ 0:1 ] != ',' ):
+                        words.append( ' ' )
+                    words.append( text )
+                    tight = False
+                    previous = None
+                    continue
+                work.append( ( kids, i, owner ) )
+                work.append( ( _written_children( node ), 0, node.nodetype ) )
+                break
+            else:
+                text = node.nodetype
+            if ( tight or text in _tight_before ):
+                pass
+            elif ( text in _closing ):
+                if ( owner in _spaced and previous not in _opening ):
+                    words.append( ' ' )
+            elif ( text == '(' ):
+                if ( _spaced_paren( owner ) ):
+                    words.append( ' ' )
+            else:
+                words.append( ' ' )
+            words.append( text )
+            tight = ( text in _tight_after or ( text in _opening and owner not in _spaced ) or
+                      owner == 'CharArrayConst' )
+            previous = text
+    return ''.join( words )
+
+############################################################
+# Lots of trees to a file (or anything with write()), one line each.
+# A None tree (it didn't parse) is written as "none_text".
+############################################################
+def emit_many( trees, file, none_text = '', buffer_size = 1 << 20 ):
+    out = []
+    size = 0
+    for tree in trees:
+        text = none_text if tree == None else emit( tree )
+        out.append( text )
+        size = size + len( text ) + 1
+        if ( size >= buffer_size ):
+            out.append( '' )
+            file.write( '\n'.join( out ) )
+            out = []
+            size = 0
+    if ( len( out ) > 0 ):
+        out.append( '' )
+        file.write( '\n'.join( out ) )
+
+############################################################
+#
+# The round trip test: parse(emit(parse(x))) == parse(x) for every
+# line that parses at all, and the AST mode tree of the line has to
+# come out as the same text. Returns how many lines went round and how
+# many of those came back as exactly the text we started from (which
+# they all should, for a file straight out of LLVM).
+#
+############################################################
+
+def round_trip_test( lines ):
+    checked = 0
+    same_text = 0
+    context = parser.ParseContext( error_sink = parser.discard_error )
+    ast_context = parser.ParseContext( error_sink = parser.discard_error, ast = True )
+    for line in lines:
+        line = line.strip()
+        if ( line == '' or line[0] == ';' ):
+            continue
+        first = parser.fragment_parse( 'Instruction', line, context = context )
+        if ( first == None ):
+            continue
+        text = emit( first )
+        second = parser.fragment_parse( 'Instruction', text, context = context )
+        assert second != None, "Emitted text does not parse: " + text
+        assert second.tree_as_string() == first.tree_as_string(), \
+            "Round trip changed the tree: " + line + " -> " + text
+        ast_text = emit( parser.fragment_parse( 'Instruction', line, context = ast_context ) )
+        assert ast_text == text, "AST mode tree came out different: " + line + " -> " + ast_text
+        checked = checked + 1
+        if ( text == line ):
+            same_text = same_text + 1
+    return checked, same_text
+
+if __name__ == "__main__":
+    for corpus in sys.argv[1:]:
+        with open( corpus ) as f:
+            checked, same_text = round_trip_test( f )
+        print( corpus + ': ' + str( checked ) + ' round trips, ' + str( same_text ) + ' exactly as written' )
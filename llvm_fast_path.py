@@ -0,0 +1,534 @@
+# ============================================================
+#
+# Fast path for the most common LLVM instruction shapes.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# Almost every line in the SPEC module dumps is one of a handful of
+# very regular things: alloca, load, store, getelementptr, icmp,
+# bitcast and the simple binary operators. For these we do not need
+# the whole LALR machinery. This is a small hand-written recursive
+# descent recognizer that handles just those shapes, and it builds
+# the tree by calling the very same actions the PLY parser would (the
+# generated straight line ones, mostly, see below), in the very same
+# (bottom up) order. So the tree is identical, right down to the node
+# serial numbers.
+#
+# Anything at all unusual (constant expressions, atomics, struct or
+# function types, address spaces, floating point literals, metadata
+# tuples, ...) is handed back to the full parser. The rule here is:
+# when in doubt, bail out.
+#
+# ============================================================
+
+import re
+import sys
+
+import llvm_instruction_parser as parser
+
+# ============================================================
+# The scanner. Every "word-like" token must be followed by a
+# delimiter, otherwise PLY might split it differently than we would
+# (for example "i8x" is int_type "i8" and then name "x" to PLY). If
+# we can't match something we give up and let PLY have it.
+# ============================================================
+
+_delimiter = r'(?=[ \t\r\n,=*\[\]]|$)'
+
+_token_re = re.compile(
+    r'[ \t\r\n]*(?:' +
+    r'(?P<ident>[%@](?:[0-9]+|[-a-zA-Z$._][-a-zA-Z$._0-9]*|"[^"]*"))' + _delimiter +
+    r'|(?P<mdid>![0-9]+)' + _delimiter +
+    r'|(?P<mdname>![-a-zA-Z$._\\][-a-zA-Z$._\\]*)' + _delimiter +
+    r'|(?P<number>-?[0-9]+)' + _delimiter +
+    r'|(?P<word>[-a-zA-Z$._][-a-zA-Z$._0-9]*)' + _delimiter +
+    r'|(?P<punct>[,=*\[\]])' +
+    r')' )
+
+_int_type_re = re.compile( r'i[0-9]+' )
+
+# These prefixes are scanned by the dwarf rules before names are.
+_dwarf_prefixes = ( 'DW_', 'DIFlag', 'CSK_' )
+
+class _Unusual( Exception ):
+    pass
+
+def _tokenize( inputstring ):
+    toks = []
+    pos = 0
+    end = len( inputstring.rstrip( ' \t\r\n' ) )
+    while ( pos < end ):
+        m = _token_re.match( inputstring, pos )
+        if ( m == None ):
+            raise _Unusual
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group( kind )
+        if ( kind == 'ident' ):
+            if ( value[0] == '%' ):
+                toks.append( ( 'local_ident', value ) )
+            else:
+                toks.append( ( 'global_ident', value ) )
+        elif ( kind == 'mdid' ):
+            toks.append( ( 'metadata_id', value ) )
+        elif ( kind == 'mdname' ):
+            # !DILocation and friends are keywords.
+            if ( parser.reserved.get( value ) != None ):
+                raise _Unusual
+            toks.append( ( 'metadata_name', value ) )
+        elif ( kind == 'number' ):
+            toks.append( ( 'decimals', value ) )
+        elif ( kind == 'word' ):
+            if ( _int_type_re.fullmatch( value ) ):
+                toks.append( ( 'int_type', value ) )
+            elif ( _int_type_re.match( value ) or value.startswith( _dwarf_prefixes ) ):
+                raise _Unusual
+            else:
+                toks.append( ( parser.reserved.get( value, 'name' ), value ) )
+        else:
+            # Literals have the same type as value, just like PLY.
+            toks.append( ( value, value ) )
+    return toks
+
+# ============================================================
+# Which flags go with which binary operator. See p_AddInst and
+# friends in the parser.
+# ============================================================
+
+_binary_ops = {
+    'add'    : ( parser.p_AddInst, 'OverflowFlags' ),
+    'sub'    : ( parser.p_SubInst, 'OverflowFlags' ),
+    'mul'    : ( parser.p_MulInst, 'OverflowFlags' ),
+    'shl'    : ( parser.p_ShlInst, 'OverflowFlags' ),
+    'fadd'   : ( parser.p_FAddInst, 'FastMathFlags' ),
+    'fsub'   : ( parser.p_FSubInst, 'FastMathFlags' ),
+    'fmul'   : ( parser.p_FMulInst, 'FastMathFlags' ),
+    'fdiv'   : ( parser.p_FDivInst, 'FastMathFlags' ),
+    'frem'   : ( parser.p_FRemInst, 'FastMathFlags' ),
+    'udiv'   : ( parser.p_UDivInst, 'OptExact' ),
+    'sdiv'   : ( parser.p_SDivInst, 'OptExact' ),
+    'lshr'   : ( parser.p_LShrInst, 'OptExact' ),
+    'ashr'   : ( parser.p_AShrInst, 'OptExact' ),
+    'urem'   : ( parser.p_URemInst, None ),
+    'srem'   : ( parser.p_SRemInst, None ),
+    'and_kw' : ( parser.p_AndInst, None ),
+    'or_kw'  : ( parser.p_OrInst, None ),
+    'xor'    : ( parser.p_XorInst, None ),
+    }
+
+_float_kinds = [ 'half', 'float_kw', 'double_kw', 'x86_fp80', 'fp128', 'ppc_fp128' ]
+
+_ipreds = [ 'eq', 'ne', 'sge', 'sgt', 'sle', 'slt', 'uge', 'ugt', 'ule', 'ult' ]
+
+_overflow_flags = [ 'nsw', 'nuw' ]
+
+_fast_math_flags = [ 'afn', 'arcp', 'contract', 'fast', 'ninf', 'nnan', 'nsz', 'reassoc' ]
+
+# ============================================================
+# The fast path builds each node with the very action the parser
+# uses for that production in that mode: a generated straight line
+# one where there is one (see _install_generated_actions and
+# _mode_parser), the p_* function itself where not. Which
+# production a reduction is goes by its p_* function and the shape
+# of what it was handed: None for a nonterminal, and for a terminal
+# its text if that is a literal or a keyword (PLY would have lexed
+# it as just that), '' for any other token. Mostly all of the
+# productions of that length for the p_* function have the same
+# terminals in the same places (a generated action only goes by
+# those), and then the shape need not be worked out at all.
+# ============================================================
+
+_fixed_terminals = frozenset( parser.literals + list( parser.reserved.keys() ) )
+_terminals = frozenset( parser.tokens + parser.literals )
+_keywords = frozenset( parser.reserved.values() )
+
+# ( mode, p_* function, shape ) -> the action to run, and
+# ( mode, p_* function, length ) -> the same if the length is enough
+# to tell, None if not.
+_production_actions = {}
+
+def _fits( rhs, shape ):
+    for symbol, here in zip( rhs, shape ):
+        if ( here == None ):
+            if ( symbol in _terminals ):
+                return False
+        elif ( here == '' ):
+            if ( symbol not in _terminals or symbol in _keywords or symbol in parser.literals ):
+                return False
+        elif ( here != symbol and parser.reserved.get( here ) != symbol ):
+            return False
+    return True
+
+def _production_action( mode, action, shape ):
+    found = action
+    terminals = set()
+    for p in parser._get_parser( 'Instruction', False, mode ).productions:
+        if ( p.func != action.__name__ or p.len != len( shape ) ):
+            continue
+        # (Productions read back from the tables only have the text.)
+        rhs = p.str.split( '->' )[ 1 ].split()
+        if ( rhs == [ '<empty>' ] ):
+            rhs = []
+        terminals.add( tuple( [ x if x in _terminals else None for x in rhs ] ) )
+        if ( found == action and _fits( rhs, shape ) ):
+            found = p.callable
+    _production_actions[ ( mode, action, shape ) ] = found
+    if ( found != action and len( terminals ) == 1 ):
+        _production_actions[ ( mode, action, len( shape ) ) ] = found
+    return found
+
+############################################################
+#
+# The recognizer itself. Each method mirrors one (or a few) of the
+# p_* productions and returns the Node built by that production.
+#
+############################################################
+
+class _FastPath:
+
+    def __init__( self, inputstring, mode = None ):
+        self.toks = _tokenize( inputstring )
+        self.pos = 0
+        self.mode = mode
+
+    ############################################################
+    # Token helpers.
+    ############################################################
+    def peek( self, ahead = 0 ):
+        if ( self.pos + ahead < len( self.toks ) ):
+            return self.toks[ self.pos + ahead ][ 0 ]
+        return None
+
+    def take( self, kind ):
+        if ( self.peek() != kind ):
+            raise _Unusual
+        value = self.toks[ self.pos ][ 1 ]
+        self.pos = self.pos + 1
+        return value
+
+    ############################################################
+    # Run one of the parser's actions on a fake production, exactly
+    # like PLY would have: slot 0 is the result and the rest are the
+    # right hand side (strings for terminals).
+    ############################################################
+    def reduce( self, action, kids ):
+        run = _production_actions.get( ( self.mode, action, len( kids ) ) )
+        if ( run == None ):
+            shape = tuple( [ None if type( x ) is not str else ( x if x in _fixed_terminals else '' ) for x in kids ] )
+            run = _production_actions.get( ( self.mode, action, shape ) )
+            if ( run == None ):
+                run = _production_action( self.mode, action, shape )
+        t = [ None ] + kids
+        run( t )
+        return t[ 0 ]
+
+    def empty( self ):
+        return self.reduce( parser.p_empty, [] )
+
+    # OptVolatile -> empty | volatile_kw, and the like.
+    def optional( self, action, keyword ):
+        if ( self.peek() == keyword ):
+            return self.reduce( action, [ self.take( keyword ) ] )
+        return self.reduce( action, [ self.empty() ] )
+
+    # OverflowFlags -> empty | OverflowFlagList, and FastMathFlags.
+    def flags( self, kind ):
+        if ( kind == 'OverflowFlags' ):
+            allowed = _overflow_flags
+            flag, flag_list, flags = parser.p_OverflowFlag, parser.p_OverflowFlagList, parser.p_OverflowFlags
+        else:
+            allowed = _fast_math_flags
+            flag, flag_list, flags = parser.p_FastMathFlag, parser.p_FastMathFlagList, parser.p_FastMathFlags
+        if ( self.peek() not in allowed ):
+            return self.reduce( flags, [ self.empty() ] )
+        here = self.reduce( flag_list, [ self.reduce( flag, [ self.take( self.peek() ) ] ) ] )
+        while ( self.peek() in allowed ):
+            here = self.reduce( flag_list, [ here, self.reduce( flag, [ self.take( self.peek() ) ] ) ] )
+        return self.reduce( flags, [ here ] )
+
+    def int_lit( self ):
+        here = self.reduce( parser.p_decimal_lit, [ self.take( 'decimals' ) ] )
+        return self.reduce( parser.p_int_lit, [ here ] )
+
+    def alignment( self ):
+        return self.reduce( parser.p_Alignment, [ self.take( 'align' ), self.int_lit() ] )
+
+    ############################################################
+    # Type -> FirstClassType -> ConcreteType -> ..., with pointers
+    # built left recursively on top of that.
+    ############################################################
+    def lift_concrete( self, here ):
+        here = self.reduce( parser.p_ConcreteType, [ here ] )
+        here = self.reduce( parser.p_FirstClassType, [ here ] )
+        return self.reduce( parser.p_Type, [ here ] )
+
+    def type( self ):
+        kind = self.peek()
+        if ( kind == 'int_type' ):
+            here = self.reduce( parser.p_IntType, [ self.take( kind ) ] )
+        elif ( kind in _float_kinds ):
+            here = self.reduce( parser.p_FloatKind, [ self.take( kind ) ] )
+            here = self.reduce( parser.p_FloatType, [ here ] )
+        elif ( kind == 'ptr' ):
+            here = self.reduce( parser.p_PointerType, [ self.take( kind ) ] )
+        elif ( kind == 'local_ident' ):
+            here = self.reduce( parser.p_LocalIdent, [ self.take( kind ) ] )
+            here = self.reduce( parser.p_NamedType, [ here ] )
+        elif ( kind == '[' ):
+            left = self.take( '[' )
+            size = self.int_lit()
+            x = self.take( 'name' )
+            if ( x != 'x' ):
+                raise _Unusual
+            element = self.type()
+            here = self.reduce( parser.p_ArrayType, [ left, size, x, element, self.take( ']' ) ] )
+        else:
+            raise _Unusual
+        here = self.lift_concrete( here )
+        while ( self.peek() == '*' ):
+            space = self.reduce( parser.p_OptAddrSpace, [ self.empty() ] )
+            here = self.reduce( parser.p_PointerType, [ here, space, self.take( '*' ) ] )
+            here = self.lift_concrete( here )
+        return here
+
+    ############################################################
+    # Value -> LocalIdent | Constant, for the simple constants only.
+    ############################################################
+    def value( self ):
+        kind = self.peek()
+        if ( kind == 'local_ident' ):
+            here = self.reduce( parser.p_LocalIdent, [ self.take( kind ) ] )
+            return self.reduce( parser.p_Value, [ here ] )
+        if ( kind == 'global_ident' ):
+            here = self.reduce( parser.p_GlobalIdent, [ self.take( kind ) ] )
+        elif ( kind == 'decimals' ):
+            here = self.reduce( parser.p_IntConst, [ self.int_lit() ] )
+        elif ( kind == 'null' ):
+            here = self.reduce( parser.p_NullConst, [ self.take( kind ) ] )
+        elif ( kind == 'undef' ):
+            here = self.reduce( parser.p_UndefConst, [ self.take( kind ) ] )
+        elif ( kind == 'zeroinitializer' ):
+            here = self.reduce( parser.p_ZeroInitializerConst, [ self.take( kind ) ] )
+        elif ( kind == 'true_kw' or kind == 'false_kw' ):
+            here = self.reduce( parser.p_BoolLit, [ self.take( kind ) ] )
+            here = self.reduce( parser.p_BoolConst, [ here ] )
+        else:
+            raise _Unusual
+        here = self.reduce( parser.p_Constant, [ here ] )
+        return self.reduce( parser.p_Value, [ here ] )
+
+    ############################################################
+    # OptCommaSepMetadataAttachmentList, only for "!name !N" pairs.
+    ############################################################
+    def attachment( self ):
+        name = self.reduce( parser.p_MetadataName, [ self.take( 'metadata_name' ) ] )
+        here = self.reduce( parser.p_MetadataID, [ self.take( 'metadata_id' ) ] )
+        here = self.reduce( parser.p_MDNode, [ here ] )
+        return self.reduce( parser.p_MetadataAttachment, [ name, here ] )
+
+    def metadata( self ):
+        if ( self.peek() != ',' ):
+            return self.reduce( parser.p_OptCommaSepMetadataAttachmentList, [ self.empty() ] )
+        comma = self.take( ',' )
+        here = self.reduce( parser.p_CommaSepMetadataAttachmentList, [ self.attachment() ] )
+        while ( self.peek() == ',' ):
+            sep = self.take( ',' )
+            here = self.reduce( parser.p_CommaSepMetadataAttachmentList, [ here, sep, self.attachment() ] )
+        return self.reduce( parser.p_OptCommaSepMetadataAttachmentList, [ comma, here ] )
+
+    ############################################################
+    # The instructions.
+    ############################################################
+    def alloca( self ):
+        kids = [ self.take( 'alloca' ),
+                 self.optional( parser.p_OptInAlloca, 'inalloca' ),
+                 self.optional( parser.p_OptSwiftError, 'swifterror' ),
+                 self.type() ]
+        if ( self.peek() == ',' and self.peek( 1 ) == 'align' ):
+            kids = kids + [ self.take( ',' ), self.alignment() ]
+        return self.reduce( parser.p_AllocaInst, kids + [ self.metadata() ] )
+
+    # Shared by load and store: the trailing [, align N] [, !md !N]
+    def align_and_metadata( self, kids ):
+        if ( self.peek() == ',' and self.peek( 1 ) == 'align' ):
+            kids = kids + [ self.take( ',' ), self.alignment() ]
+        return kids + [ self.metadata() ]
+
+    def load( self ):
+        kids = [ self.take( 'load' ),
+                 self.optional( parser.p_OptVolatile, 'volatile_kw' ),
+                 self.type(), self.take( ',' ), self.type(), self.value() ]
+        return self.reduce( parser.p_LoadInst, self.align_and_metadata( kids ) )
+
+    def store( self ):
+        kids = [ self.take( 'store' ),
+                 self.optional( parser.p_OptVolatile, 'volatile_kw' ),
+                 self.type(), self.value(), self.take( ',' ), self.type(), self.value() ]
+        return self.reduce( parser.p_StoreInst, self.align_and_metadata( kids ) )
+
+    def getelementptr( self ):
+        kids = [ self.take( 'getelementptr' ),
+                 self.optional( parser.p_OptInBounds, 'inbounds' ),
+                 self.type(), self.take( ',' ), self.type(), self.value() ]
+        if ( self.peek() == ',' and self.peek( 1 ) != 'metadata_name' ):
+            kids.append( self.take( ',' ) )
+            here = self.reduce( parser.p_TypeValue, [ self.type(), self.value() ] )
+            here = self.reduce( parser.p_CommaSepTypeValueList, [ here ] )
+            while ( self.peek() == ',' and self.peek( 1 ) != 'metadata_name' ):
+                sep = self.take( ',' )
+                index = self.reduce( parser.p_TypeValue, [ self.type(), self.value() ] )
+                here = self.reduce( parser.p_CommaSepTypeValueList, [ here, sep, index ] )
+            kids.append( here )
+        return self.reduce( parser.p_GetElementPtrInst, kids + [ self.metadata() ] )
+
+    def icmp( self ):
+        kids = [ self.take( 'icmp' ) ]
+        if ( self.peek() not in _ipreds ):
+            raise _Unusual
+        kids.append( self.reduce( parser.p_IPred, [ self.take( self.peek() ) ] ) )
+        kids = kids + [ self.type(), self.value(), self.take( ',' ), self.value(), self.metadata() ]
+        return self.reduce( parser.p_ICmpInst, kids )
+
+    def bitcast( self ):
+        kids = [ self.take( 'bitcast' ), self.type(), self.value(),
+                 self.take( 'to' ), self.type(), self.metadata() ]
+        return self.reduce( parser.p_BitCastInst, kids )
+
+    def binary( self ):
+        action, flag_kind = _binary_ops[ self.peek() ]
+        kids = [ self.take( self.peek() ) ]
+        if ( flag_kind == 'OptExact' ):
+            kids.append( self.optional( parser.p_OptExact, 'exact' ) )
+        elif ( flag_kind != None ):
+            kids.append( self.flags( flag_kind ) )
+        kids = kids + [ self.type(), self.value(), self.take( ',' ), self.value(), self.metadata() ]
+        return self.reduce( action, kids )
+
+    def value_instruction( self ):
+        kind = self.peek()
+        if ( kind == 'alloca' ):
+            here = self.alloca()
+        elif ( kind == 'load' ):
+            here = self.load()
+        elif ( kind == 'getelementptr' ):
+            here = self.getelementptr()
+        elif ( kind == 'icmp' ):
+            here = self.icmp()
+        elif ( kind == 'bitcast' ):
+            here = self.bitcast()
+        elif ( kind in _binary_ops ):
+            here = self.binary()
+        else:
+            raise _Unusual
+        return self.reduce( parser.p_ValueInstruction, [ here ] )
+
+    ############################################################
+    # Instruction -> StoreInst | LocalIdent = ValueInstruction | ...
+    ############################################################
+    def instruction( self ):
+        if ( self.peek() == 'store' ):
+            here = self.reduce( parser.p_Instruction, [ self.store() ] )
+        elif ( self.peek() == 'local_ident' and self.peek( 1 ) == '=' ):
+            lhs = self.reduce( parser.p_LocalIdent, [ self.take( 'local_ident' ) ] )
+            equals = self.take( '=' )
+            here = self.reduce( parser.p_Instruction, [ lhs, equals, self.value_instruction() ] )
+        else:
+            here = self.reduce( parser.p_Instruction, [ self.value_instruction() ] )
+        if ( self.peek() != None ):
+            raise _Unusual
+        return here
+
+############################################################
+#
+# Returns the tree if this is one of the common shapes, None if not.
+# If we bail out part way through we put the serial numbers back, so
+# the full parser numbers the nodes just like it would have anyway.
+#
+############################################################
+
+def fast_path_parse( inputstring, context = None ):
+    if ( context == None ):
+        context = parser.ParseContext()
+    # We don't keep track of where the tokens were, so spans (see
+    # Node.text) are up to the full parser.
+    if ( context.spans ):
+        return None
+    serial = context.serial
+    metrics = parser.current_metrics()
+    if ( metrics != None ):
+        before = metrics.start( context )
+    # The types are interned once we know the line is ours; interning
+    # as we go would leave the inner types of a line we give up on in
+    # the table.
+    types = context.type_table
+    context.type_table = None
+    try:
+        with parser.using_context( context ):
+            fast = _FastPath( inputstring, parser._action_mode( context ) )
+            tree = fast.instruction()
+    except _Unusual:
+        context.serial = serial
+        if ( metrics != None ):
+            metrics.fast_path_result( False )
+        return None
+    finally:
+        context.type_table = types
+    if ( types != None ):
+        tree = types.intern_tree( tree )
+    if ( context.weak_parents ):
+        parser.weaken_parents( tree )
+    if ( metrics != None ):
+        metrics.fast_path_result( True )
+        metrics.record( 'Instruction', inputstring, tree, context, before, len( fast.toks ) )
+    return tree
+
+############################################################
+#
+# Drop-in replacement for inst_parse: the fast path when we can, the
+# full parser when we can't. Unlike inst_parse this does not write
+# the PLY debugging log unless asked to; that costs far more than
+# the parse.
+#
+############################################################
+
+def fast_inst_parse( inputstring, lex_debug = False, yacc_debug = False, context = None ):
+    if ( context == None ):
+        context = parser.ParseContext()
+    tree = fast_path_parse( inputstring, context )
+    if ( tree == None ):
+        tree = parser.inst_parse( inputstring, lex_debug, yacc_debug, context )
+    return tree
+
+############################################################
+#
+# Differential test mode. Run every line through both the fast path
+# and the full parser and insist the trees are the same. Returns how
+# many lines the fast path took and how many it handed back.
+#
+############################################################
+
+def differential_test( lines ):
+    taken = 0
+    declined = 0
+    for line in lines:
+        line = line.strip()
+        if ( line == '' or line[0] == ';' ):
+            continue
+        fast = fast_path_parse( line )
+        if ( fast == None ):
+            declined = declined + 1
+            continue
+        taken = taken + 1
+        full = parser.inst_parse( line, yacc_debug = False )
+        assert full != None, "Fast path accepted a line the parser rejects: " + line
+        assert fast.tree_as_string() == full.tree_as_string(), \
+            "Fast path and parser disagree on: " + line
+    return taken, declined
+
+if __name__ == "__main__":
+    for corpus in sys.argv[1:]:
+        with open( corpus ) as f:
+            taken, declined = differential_test( f )
+        print( corpus + ': fast path took ' + str( taken ) + ', declined ' + str( declined ) )
@@ -0,0 +1,340 @@
+# ============================================================
+#
+# Feature rows for every instruction, in NumPy arrays.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# For machine learning experiments each instruction becomes one row
+# of small numbers:
+#
+#    opcode       the kind of instruction, as a code (see below)
+#    result_type  the class of the type it produces (int, pointer,
+#                 ..., void for a store), as a code
+#    operands     how many values it uses (a call counts the function
+#                 being called; phi labels and metadata don't count)
+#    constants    how many of those are constants
+#    gep_indices  the number of indices on a getelementptr, else 0
+#    alignment    from ", align N", else 0
+#    volatile     1 if it is volatile
+#    atomic       1 for atomic loads and stores, fence, cmpxchg and
+#                 atomicrmw
+#    metadata     1 if it has trailing metadata attachments
+#    parsed       0 for a line that didn't parse (all else is 0 too,
+#                 and opcode is -1)
+#
+# The codes come from a Categories, which hands out a number to each
+# new name. Both start out with every name we know about in a fixed
+# order, so the codes are the same from one corpus to the next; the
+# names are saved along with the arrays.
+#
+#    features = llvm_features.FeatureExtractor()
+#    with open( 'module.ll' ) as f:
+#        features.add_lines( f )
+#    features.save( 'module.npz' )
+#
+# Rows go into an array.array as plain ints (the one Python step per
+# instruction, after the parse, is a single walk of its tree) and are
+# copied into a preallocated NumPy block a chunk at a time. Columns
+# and structured arrays are cut out of that block in one go.
+#
+# Run "python llvm_features.py corpus.ll out.npz" to do a whole file.
+#
+# This needs NumPy, which the rest of the parser doesn't; it is
+# imported when the first array is made.
+#
+# ============================================================
+
+import array
+import sys
+
+import llvm_instruction_parser as parser
+
+############################################################
+# Names to small integer codes, in the order they are first seen.
+############################################################
+class Categories:
+
+    def __init__( self, names = () ):
+        self.codes = {}
+        self.names = []
+        for name in names:
+            self.code( name )
+
+    def code( self, name ):
+        code = self.codes.get( name )
+        if ( code == None ):
+            code = len( self.names )
+            self.codes[ name ] = code
+            self.names.append( name )
+        return code
+
+    def __len__( self ):
+        return len( self.names )
+
+# Every kind of instruction, in the order of _opcode_kinds.
+instruction_kinds = list( dict.fromkeys( parser._opcode_kinds.values() ) )
+
+type_classes = [ 'void', 'int', 'float', 'pointer', 'vector', 'array', 'struct', 'named',
+                 'function', 'label', 'token', 'metadata', 'mmx', 'unknown' ]
+
+_type_class = {
+    'VoidType' : 'void', 'IntType' : 'int', 'FloatType' : 'float', 'PointerType' : 'pointer',
+    'VectorType' : 'vector', 'ArrayType' : 'array', 'StructType' : 'struct',
+    'NamedType' : 'named', 'FuncType' : 'function', 'LabelType' : 'label',
+    'TokenType' : 'token', 'MetadataType' : 'metadata', 'MMXType' : 'mmx',
+    }
+
+# The layers of Type we look through to find what it really is.
+_type_layers = frozenset( [ 'Type', 'FirstClassType', 'ConcreteType' ] )
+
+# Where the walk stops: these are counted, or never looked in.
+_skip_nodes = frozenset( [ 'OptCommaSepMetadataAttachmentList', 'FuncAttrs', 'OperandBundles' ] )
+
+_casts = frozenset( [ 'TruncInst', 'ZExtInst', 'SExtInst', 'FPTruncInst', 'FPExtInst',
+                      'FPToUIInst', 'FPToSIInst', 'UIToFPInst', 'SIToFPInst', 'PtrToIntInst',
+                      'IntToPtrInst', 'BitCastInst', 'AddrSpaceCastInst', 'VAArgInst', 'AtomicRMWInst' ] )
+_atomics = frozenset( [ 'FenceInst', 'CmpXchgInst', 'AtomicRMWInst' ] )
+
+# The columns, and what they are saved as (NumPy type names).
+columns = [ ( 'opcode', 'int16' ), ( 'result_type', 'int8' ), ( 'operands', 'int16' ),
+            ( 'constants', 'int16' ), ( 'gep_indices', 'int16' ), ( 'alignment', 'int32' ),
+            ( 'volatile', 'bool' ), ( 'atomic', 'bool' ), ( 'metadata', 'bool' ),
+            ( 'parsed', 'bool' ) ]
+
+_width = len( columns )
+_failed = ( -1, ) + ( 0, ) * ( _width - 1 )
+
+############################################################
+# NumPy isn't needed by anything else here, so it is only imported
+# once there is an array to build.
+############################################################
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError( 'llvm_features needs NumPy for its arrays; "pip install numpy"' ) from None
+    return numpy
+
+############################################################
+# What a Type node really is: FuncType, PointerType, ...
+############################################################
+def _type_leaf( node ):
+    while ( node.nodetype in _type_layers ):
+        node = node.children[ 0 ]
+    return node
+
+def type_class( node ):
+    return _type_class.get( _type_leaf( node ).nodetype, 'unknown' )
+
+############################################################
+# Is an optional part there? Without AST mode an empty one is still
+# in the tree, with just an (empty) under it. A LazyNode is only put
+# in for something that is there (and looking would parse it).
+############################################################
+def _present( node ):
+    if ( node.is_epsilon ):
+        return False
+    if ( isinstance( node, parser.LazyNode ) ):
+        return True
+    kids = node.children
+    return len( kids ) > 0 and not kids[ 0 ].is_epsilon
+
+def _first_terminal( node ):
+    while ( not node.was_terminal ):
+        node = node.children[ 0 ]
+    return node.nodetype
+
+############################################################
+# The class of what the instruction produces. Mostly that is the
+# first type written, but not always.
+############################################################
+def _result_class( kind, types ):
+    if ( kind == 'StoreInst' or kind == 'FenceInst' ):
+        return 'void'
+    if ( kind == 'GetElementPtrInst' or kind == 'AllocaInst' ):
+        return 'pointer'
+    if ( kind == 'CmpXchgInst' ):
+        return 'struct'
+    if ( kind == 'CatchPadInst' or kind == 'CleanupPadInst' ):
+        return 'token'
+    if ( len( types ) == 0 ):
+        return 'unknown'
+    if ( kind in _casts ):
+        return type_class( types[ -1 ] )
+    if ( kind == 'ICmpInst' or kind == 'FCmpInst' ):
+        return 'vector' if type_class( types[ 0 ] ) == 'vector' else 'int'
+    if ( kind == 'SelectInst' and len( types ) > 1 ):
+        return type_class( types[ 1 ] )
+    if ( kind == 'ExtractElementInst' ):
+        vector = _type_leaf( types[ 0 ] )
+        if ( vector.nodetype == 'VectorType' ):
+            for kid in vector.children:
+                if ( kid.nodetype == 'Type' ):
+                    return type_class( kid )
+        return 'unknown'
+    if ( kind == 'ExtractValueInst' ):
+        return 'unknown'
+    first = _type_leaf( types[ 0 ] )
+    if ( kind == 'CallInst' and first.nodetype == 'FuncType' ):
+        return type_class( first.children[ 0 ] )
+    return _type_class.get( first.nodetype, 'unknown' )
+
+############################################################
+#
+# The extractor. add() one tree at a time, or add_many(), add_lines()
+# or add_text() for a lot of them; then columns(), structured() or
+# save().
+#
+############################################################
+
+class FeatureExtractor:
+
+    def __init__( self, capacity = 1 << 16, chunk = 4096 ):
+        self.opcodes = Categories( instruction_kinds )
+        self.types = Categories( type_classes )
+        numpy = _numpy()
+        self.block = numpy.zeros( ( capacity, _width ), dtype = numpy.int64 )
+        self.count = 0
+        self.chunk = chunk
+        self.rows = array.array( 'q' )
+
+    def __len__( self ):
+        return self.count + len( self.rows ) // _width
+
+    def row( self, tree ):
+        if ( tree == None ):
+            return _failed
+        kids = tree.children
+        inst = kids[ -1 ]
+        if ( inst.nodetype == 'ValueInstruction' ):
+            inst = inst.children[ 0 ]
+        kind = parser._tree_kind( tree )
+        types = []
+        operands = 0
+        constants = 0
+        alignment = 0
+        volatile = 0
+        atomic = 1 if kind in _atomics else 0
+        metadata = 0
+        for kid in inst.children:
+            if ( not kid.was_terminal and not _present( kid ) ):
+                continue
+            name = kid.nodetype
+            if ( name == 'Alignment' ):
+                alignment = int( _first_terminal( kid.children[ -1 ] ) )
+            elif ( name == 'OptVolatile' ):
+                volatile = 1
+            elif ( name == 'atomic' ):
+                atomic = 1
+            elif ( name == 'OptCommaSepMetadataAttachmentList' ):
+                metadata = 1
+        work = [ inst ]
+        while ( len( work ) > 0 ):
+            here = work.pop()
+            if ( here.was_terminal ):
+                continue
+            name = here.nodetype
+            if ( name in _skip_nodes ):
+                continue
+            if ( name == 'Type' or name == 'ConcreteType' ):
+                types.append( here )
+            elif ( name == 'Value' ):
+                operands = operands + 1
+                if ( here.children[ 0 ].nodetype == 'Constant' ):
+                    constants = constants + 1
+            else:
+                work.extend( reversed( here.children ) )
+        gep = operands - 1 if kind == 'GetElementPtrInst' else 0
+        return ( self.opcodes.code( kind ), self.types.code( _result_class( kind, types ) ),
+                 operands, constants, gep, alignment, volatile, atomic, metadata, 1 )
+
+    def add( self, tree ):
+        self.rows.extend( self.row( tree ) )
+        if ( len( self.rows ) >= self.chunk * _width ):
+            self.__move()
+
+    def add_many( self, trees ):
+        for tree in trees:
+            self.add( tree )
+
+    ############################################################
+    # A whole file's worth of text through block_parse. Lines that
+    # don't parse get a row with parsed = 0.
+    ############################################################
+    def add_text( self, text, context = None ):
+        if ( context == None ):
+            context = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error )
+        self.add_many( parser.block_parse( text, context = context ) )
+
+    ############################################################
+    # The same for a file (or any lines), through parse_stream: a
+    # bufferful of lines at a time, so the whole file is never in
+    # memory.
+    ############################################################
+    def add_lines( self, lines, context = None, buffer_lines = 4096 ):
+        if ( context == None ):
+            context = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error )
+        for number, line, tree in parser.parse_stream( lines, context, buffer_lines ):
+            self.add( tree )
+
+    ############################################################
+    # The staged rows into the block, growing it if need be.
+    ############################################################
+    def __move( self ):
+        if ( len( self.rows ) == 0 ):
+            return
+        numpy = _numpy()
+        staged = numpy.frombuffer( self.rows, dtype = numpy.int64 ).reshape( -1, _width )
+        need = self.count + len( staged )
+        if ( need > len( self.block ) ):
+            bigger = numpy.zeros( ( max( need, 2 * len( self.block ) ), _width ), dtype = numpy.int64 )
+            bigger[ :self.count ] = self.block[ :self.count ]
+            self.block = bigger
+        self.block[ self.count:need ] = staged
+        self.count = need
+        del staged
+        self.rows = array.array( 'q' )
+
+    def columns( self ):
+        self.__move()
+        here = self.block[ :self.count ]
+        return { name: here[ :, i ].astype( kind ) for i, ( name, kind ) in enumerate( columns ) }
+
+    def structured( self ):
+        self.__move()
+        here = self.block[ :self.count ]
+        out = _numpy().empty( self.count, dtype = columns )
+        for i, ( name, kind ) in enumerate( columns ):
+            out[ name ] = here[ :, i ]
+        return out
+
+    ############################################################
+    # A .npy file holds the structured array, and can't hold
+    # anything else, so the names for the codes go next to it in
+    # an .npz ("module.npy" gets "module_names.npz"). Anything else
+    # is an .npz with one array per column, plus the names.
+    ############################################################
+    def save( self, filename, compressed = False ):
+        numpy = _numpy()
+        names = { 'opcode_names' : numpy.array( self.opcodes.names ),
+                  'result_type_names' : numpy.array( self.types.names ) }
+        if ( filename.endswith( '.npy' ) ):
+            numpy.save( filename, self.structured() )
+            arrays = names
+            filename = filename[ :-len( '.npy' ) ] + '_names.npz'
+        else:
+            arrays = self.columns()
+            arrays.update( names )
+        if ( compressed ):
+            numpy.savez_compressed( filename, **arrays )
+        else:
+            numpy.savez( filename, **arrays )
+
+if __name__ == "__main__":
+    features = FeatureExtractor()
+    with open( sys.argv[ 1 ] ) as f:
+        features.add_lines( f )
+    features.save( sys.argv[ 2 ] )
+    print( sys.argv[ 1 ] + ': ' + str( len( features ) ) + ' instructions' )
@@ -0,0 +1,126 @@
+# ============================================================
+#
+# Graphviz "dot" files for a lot of trees at once.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# Node.graph writes one tree to one file. For a whole function (or
+# a whole file) that is a lot of little files and a lot of opening
+# and closing. Here we do all of them in one pass, either
+#
+#    llvm_graph.write_dot( trees, 'function.dot', labels = lines )
+#
+# which puts every tree in one file, each in its own subgraph
+# cluster (labeled with its line if you give them), or
+#
+#    llvm_graph.write_dot_directory( trees, 'graphs' )
+#
+# which writes graphs/tree_1.dot, graphs/tree_2.dot and so on.
+#
+# Big trees make for graphs nobody can read (and "dot" takes forever
+# on them), so you can stop at max_depth levels down, or after
+# max_nodes nodes in a tree. What was left out shows up as a "..."
+# node where it would have gone.
+#
+# Unlike Node.graph, nodes here are named n<tree>_<number> and given
+# their label separately, so the same tree twice, or two trees that
+# both start at Node 0, don't run together. Labels are the same as
+# Node.graph's. A tree that is None (it didn't parse) is drawn as a
+# single node saying so.
+#
+# ============================================================
+
+import os
+
+import llvm_instruction_parser as parser
+
+############################################################
+# The lines for one tree: each node, and the edge to it from its
+# parent. "name" is what every node name starts with.
+############################################################
+def _tree_lines( tree, name, max_depth, max_nodes, out ):
+    if ( tree == None ):
+        out.append( '\t\t' + name + '0 [label="(did not parse)", shape=box];\n' )
+        return
+    count = 0
+    # Entries are ( node, depth, parent name, parent serial, position
+    # in parent ).
+    work = [ ( tree, 0, None, None, 0 ) ]
+    while ( len( work ) > 0 ):
+        node, depth, parent, above, i = work.pop()
+        if ( max_nodes != None and count >= max_nodes ):
+            # Out of room. Say so, under whoever was waiting.
+            out.append( '\t\t' + name + 'more [label="...", shape=plaintext];\n' )
+            if ( parent != None ):
+                out.append( '\t\t' + parent + ' -> ' + name + 'more;\n' )
+            break
+        here = name + str( count )
+        count = count + 1
+        if ( node.serial == None ):
+            # A SharedNode, see Node.graph.
+            serial = above + '.' + str( i )
+        else:
+            serial = str( node.serial )
+        if ( node.was_terminal ):
+            out.append( '\t\t' + here + ' [label="' + parser.dot_escape( node.nodetype ) +
+                        '\\n(Node ' + serial + ')\\n(terminal)", shape=box];\n' )
+        else:
+            title = ''
+            if ( node.title != "" ):
+                title = parser.dot_escape( node.title ) + '\\n'
+            out.append( '\t\t' + here + ' [label="' + title + parser.dot_escape( node.nodetype ) +
+                        '\\n(Node ' + serial + ')"];\n' )
+        if ( parent != None ):
+            out.append( '\t\t' + parent + ' -> ' + here + ';\n' )
+        kids = node.children
+        if ( len( kids ) == 0 ):
+            continue
+        if ( max_depth != None and depth >= max_depth ):
+            out.append( '\t\t' + here + 'cut [label="...", shape=plaintext];\n' )
+            out.append( '\t\t' + here + ' -> ' + here + 'cut;\n' )
+            continue
+        for k in range( len( kids ) - 1, -1, -1 ):
+            work.append( ( kids[ k ], depth + 1, here, serial, k ) )
+
+############################################################
+#
+# Everything in one file, a cluster per tree. "labels" (the source
+# lines, say) go on the clusters.
+#
+############################################################
+
+def write_dot( trees, filename, labels = None, max_depth = None, max_nodes = None, buffer_size = 1 << 20 ):
+    with open( filename, 'w', buffering = buffer_size ) as file:
+        file.write( 'digraph llvm_parse {\n' )
+        for t, tree in enumerate( trees ):
+            out = [ '\tsubgraph cluster_' + str( t ) + ' {\n' ]
+            if ( labels != None ):
+                out.append( '\t\tlabel="' + parser.dot_escape( labels[ t ] ) + '";\n' )
+            _tree_lines( tree, 'n' + str( t ) + '_', max_depth, max_nodes, out )
+            out.append( '\t}\n' )
+            file.write( ''.join( out ) )
+        file.write( '}\n' )
+
+############################################################
+#
+# A file per tree, all in "directory" (which is made if need be).
+# "pattern" gets the tree's number, counting from "first". Existing
+# files are overwritten. Returns the file names.
+#
+############################################################
+
+def write_dot_directory( trees, directory, pattern = 'tree_{}.dot', first = 1,
+                         max_depth = None, max_nodes = None ):
+    os.makedirs( directory, exist_ok = True )
+    names = []
+    for t, tree in enumerate( trees ):
+        out = [ 'digraph llvm_parse {\n' ]
+        _tree_lines( tree, 'n', max_depth, max_nodes, out )
+        out.append( '}\n' )
+        filename = os.path.join( directory, pattern.format( first + t ) )
+        with open( filename, 'w' ) as file:
+            file.write( ''.join( out ) )
+        names.append( filename )
+    return names
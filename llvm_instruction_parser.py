@@ -27,12 +27,244 @@ sys.path.append('/Users/xyzzy/LLVM_PLY/ply-3.11')
 import ply.lex as lex
 import ply.yacc as yacc
 import logging
+import re
+import threading
+import contextlib
+import concurrent.futures
+import collections
+import array
+import copy
+import weakref
+import gc
+import ast
+import inspect
+import hashlib
 
-# I never quite figured out how to move the line number information
-# from the lexical analysis into the parser side of things. So this
-# is a hack that I'm sure could be better.
-line_number = 0
-number_of_errors = 0
+# ============================================================
+#
+# Everything that changes while parsing lives in a ParseContext, one
+# per parse, so that several threads can parse at the same time. This
+# used to be module globals (line_number, number_of_errors and the
+# node serial number).
+#
+# The context for the parse going on in this thread is in
+# "_state.context". Node() and the lexer rules find it there, since
+# PLY doesn't give us a good way to pass it down to them. Every entry
+# point below takes an optional "context"; leave it out and each
+# parse gets a fresh one, so node serial numbers start over at 0.
+# Pass the same one along to keep numbering, or to share a TypeTable
+# (see below) across many parses:
+#
+#    context = parser.ParseContext( type_table = parser.TypeTable() )
+#    tree = parser.inst_parse( line, context = context )
+#
+# ============================================================
+
+class ParseContext:
+
+    def __init__( self, type_table = None, error_sink = None, resync_lines = False, profiler = None,
+                  weak_parents = False, flyweights = False, ast = False, spans = False, span_base = 0,
+                  hashes = False, cache = None, line_filter = None, anonymous_literals = False ):
+        self.serial = 0
+        # I never quite figured out how to move the line number
+        # information from the lexical analysis into the parser side
+        # of things, so the lexer leaves it here for Node() to find.
+        self.line_number = 0
+        self.number_of_errors = 0
+        self.type_table = type_table
+        # Every error found is kept here as a ParseError, and also
+        # handed to the sink (see below).
+        self.errors = []
+        if ( error_sink == None ):
+            error_sink = print_error
+        self.error_sink = error_sink
+        # See block_parse.
+        self.resync_lines = resync_lines
+        # See llvm_metrics.Profiler.
+        self.profiler = profiler
+        # See bulk_parsing.
+        self.weak_parents = weak_parents
+        # See SharedNode.
+        self.flyweights = flyweights
+        # See ast_children.
+        self.ast = ast
+        # See Node.text.
+        if ( spans and type_table != None ):
+            raise ValueError( 'Spans and a TypeTable do not go together: a shared type has no one span' )
+        self.spans = spans
+        self.span_base = span_base
+        # See Node.same_as.
+        self.hashes = hashes
+        self.anonymous_literals = anonymous_literals
+        # See llvm_parse_cache.
+        self.cache = cache
+        # See LineFilter.
+        self.line_filter = line_filter
+
+# ============================================================
+#
+# Errors. Rather than just printing something and moving on, every
+# error becomes a ParseError that is kept in the context, so bulk
+# runs can count and sort them afterwards. Each one is also handed
+# to the context's error sink, which is just a function taking the
+# ParseError. The default prints the message to stdout, as we always
+# have; on big dirty corpora that printing is a real bottleneck, so
+# use discard_error (or write_errors_to some file) there instead.
+#
+#    kind         "syntax", "illegal character", "illegal token" or
+#                 "semantic"
+#    token_type   the token where things went wrong ("$end" at the end)
+#    token_value  and its text
+#    position     offset of that token in the input (plus the
+#                 context's span_base, like a span)
+#    line         line number, for multi-line input
+#    column       where on its line the token starts (from 1)
+#    expected     the token types the parser could have taken there
+#    instruction  our guess at what kind of instruction it was
+#    source       the line of input it happened on
+#
+# ============================================================
+
+class ParseError:
+
+    def __init__( self, kind, message, token_type = None, token_value = None, position = None,
+                  line = None, expected = None, instruction = None, source = None, column = None ):
+        self.kind = kind
+        self.message = message
+        self.token_type = token_type
+        self.token_value = token_value
+        self.position = position
+        self.line = line
+        self.column = column
+        self.expected = expected
+        self.instruction = instruction
+        self.source = source
+
+    def __str__( self ):
+        return self.message
+
+    def __repr__( self ):
+        return 'ParseError(' + self.kind + ', ' + repr( self.message ) + ')'
+
+def print_error( error ):
+    print( error.message )
+
+def discard_error( error ):
+    pass
+
+def write_errors_to( file ):
+    return lambda error: file.write( error.message + '\n' )
+
+############################################################
+# Guess the kind of instruction from its opcode, for error reports.
+# The names are the ones in instruction.py.
+############################################################
+_opcode_kinds = {
+    'add' : 'AddInst', 'fadd' : 'FAddInst', 'sub' : 'SubInst', 'fsub' : 'FSubInst',
+    'mul' : 'MulInst', 'fmul' : 'FMulInst', 'udiv' : 'UDivInst', 'sdiv' : 'SDivInst',
+    'fdiv' : 'FDivInst', 'urem' : 'URemInst', 'srem' : 'SRemInst', 'frem' : 'FRemInst',
+    'shl' : 'ShlInst', 'lshr' : 'LShrInst', 'ashr' : 'AShrInst', 'and' : 'AndInst',
+    'or' : 'OrInst', 'xor' : 'XorInst', 'extractelement' : 'ExtractElementInst',
+    'insertelement' : 'InsertElementInst', 'shufflevector' : 'ShuffleVectorInst',
+    'extractvalue' : 'ExtractValueInst', 'insertvalue' : 'InsertValueInst',
+    'alloca' : 'AllocaInst', 'load' : 'LoadInst', 'store' : 'StoreInst', 'fence' : 'FenceInst',
+    'cmpxchg' : 'CmpXchgInst', 'atomicrmw' : 'AtomicRMWInst', 'getelementptr' : 'GetElementPtrInst',
+    'trunc' : 'TruncInst', 'zext' : 'ZExtInst', 'sext' : 'SExtInst', 'fptrunc' : 'FPTruncInst',
+    'fpext' : 'FPExtInst', 'fptoui' : 'FPToUIInst', 'fptosi' : 'FPToSIInst',
+    'uitofp' : 'UIToFPInst', 'sitofp' : 'SIToFPInst', 'ptrtoint' : 'PtrToIntInst',
+    'inttoptr' : 'IntToPtrInst', 'bitcast' : 'BitCastInst', 'addrspacecast' : 'AddrSpaceCastInst',
+    'icmp' : 'ICmpInst', 'fcmp' : 'FCmpInst', 'phi' : 'PhiInst', 'select' : 'SelectInst',
+    'call' : 'CallInst', 'tail' : 'CallInst', 'musttail' : 'CallInst', 'notail' : 'CallInst',
+    'va_arg' : 'VAArgInst', 'landingpad' : 'LandingPadInst', 'catchpad' : 'CatchPadInst',
+    'cleanuppad' : 'CleanupPadInst',
+    }
+
+############################################################
+# All types of possible ValueInstruction (common ones moved to the
+# front), and the instructions that aren't one.
+############################################################
+value_instruction_types = [
+    "CallInst",           # Call ... a type of ValueInstruction
+    "AllocaInst",         # %4 = alloca ... a type of ValueInstruction
+    "GetElementPtrInst",
+    "ICmpInst",           # Compare integers
+
+    "AddInst", "FAddInst", "SubInst", "FSubInst", "MulInst", "FMulInst", "UDivInst", "SDivInst", "FDivInst",
+    "URemInst", "SRemInst", "FRemInst", "ShlInst", "LShrInst", "AShrInst", "AndInst", "OrInst", "XorInst",
+    "ExtractElementInst", "InsertElementInst", "ShuffleVectorInst", "ExtractValueInst", "InsertValueInst",
+    "LoadInst", "TruncInst", "ZExtInst", "SExtInst", "FPTruncInst", "FPExtInst", "FPToUIInst", "FPToSIInst",
+    "UIToFPInst", "SIToFPInst", "PtrToIntInst", "IntToPtrInst", "BitCastInst", "AddrSpaceCastInst",
+    "FCmpInst", "PhiInst", "SelectInst", "VAArgInst", "LandingPadInst", "CatchPadInst", "CleanupPadInst",
+    "CmpXchgInst", "AtomicRMWInst"
+    ]
+
+other_instruction_types = [ "StoreInst", "FenceInst" ]
+
+_opcode_re = re.compile( r'\s*(?:(?:%[-a-zA-Z$._0-9]+|%"[^"]*")\s*=\s*)?([a-z_]+)' )
+
+def guess_instruction_kind( source ):
+    m = _opcode_re.match( source )
+    if ( m == None ):
+        return None
+    return _opcode_kinds.get( m.group( 1 ) )
+
+############################################################
+# The line of "data" that "position" is on.
+############################################################
+def _source_line( data, position ):
+    if ( data == None or position == None ):
+        return None
+    start = data.rfind( '\n', 0, position ) + 1
+    end = data.find( '\n', position )
+    if ( end < 0 ):
+        end = len( data )
+    return data[ start:end ]
+
+def _column( data, position ):
+    if ( data == None or position == None ):
+        return None
+    return position - data.rfind( '\n', 0, position )
+
+def _report( error ):
+    context = _state.context
+    if ( error.position != None ):
+        error.position = error.position + context.span_base
+    context.errors.append( error )
+    context.number_of_errors = context.number_of_errors + 1
+    if ( error.instruction == None and error.source != None ):
+        error.instruction = guess_instruction_kind( error.source )
+    context.error_sink( error )
+
+class _ThreadState( threading.local ):
+
+    def __init__( self ):
+        # Used when nodes are made outside of any parse.
+        self.context = ParseContext()
+        # Each thread gets its own copy of the lexer and parsers.
+        self.lexer = None
+        self.parsers = {}
+        # The one in the middle of parsing (for p_error).
+        self.parser = None
+        # For scanning text nobody needs to hear about (see
+        # _scan_quietly).
+        self.quiet = ParseContext( error_sink = discard_error )
+
+_state = _ThreadState()
+
+def current_context():
+    return _state.context
+
+############################################################
+# Make "context" the one in use by this thread for a while.
+############################################################
+@contextlib.contextmanager
+def using_context( context ):
+    saved = _state.context
+    _state.context = context
+    try:
+        yield context
+    finally:
+        _state.context = saved
 
 reserved = {
     "acq_rel" : "acq_rel",
@@ -470,6 +702,7 @@ tokens = [ 'attr_group_id',
            'name', 
            'quoted_string', 
            'sci_lit', 
+           'newline',
          ]
 
 # ============================================================
@@ -586,10 +819,11 @@ def t_dwarf_op(t):
 # want to recreate an output file from the parse tree and
 # we may as well include the comments in there as well...
 #
-# Well for now they cause a syntax error, so toss them.
+# Well for now they cause a syntax error, so toss them. Leave the
+# newline itself alone though, it separates instructions in a block.
 # ============================================================
 def t_comment(t):
-    r';.*\n'
+    r';[^\n]*'
     pass
     # return t
 
@@ -622,6 +856,8 @@ def t_label_ident(t):
     r'(((([A-Z])|([a-z])|([$\-\._]))|([0-9]))((([A-Z])|([a-z])|([$\-\._]))|([0-9]))*):'
     if ( reserved.get( t.value ) != None ):
         t.type = reserved.get( t.value )
+    else:
+        return _illegal_token( t )
     return t
 
 # ============================================================
@@ -665,6 +901,7 @@ def t_name(t):
         t.type = 'local_ident'
     elif ( t.value[0:1] == '$' ):
         t.type = 'comdat_name'
+        return _illegal_token( t )
     elif ( reserved.get( t.value ) != None ):
         t.type = reserved.get( t.value )
     return t
@@ -698,15 +935,18 @@ def t_metadata_name(t):
 # May really be a global_ident if it starts with '@'.
 # May really be a local_ident if it starts with '%'.
 # May really be a comdat_name if it starts with '$'.
+# Not across a newline: LLVM writes those as \0A, and in a block an
+# unterminated quote would take every line up to the next one with it.
 # ============================================================
 def t_quoted_string(t):
-    r'([@%$])?(["][^"]*["])'
+    r'([@%$])?(["][^"\n]*["])'
     if ( t.value[0:1] == '@' ):
         t.type = 'global_ident'
     elif ( t.value[0:1] == '%' ):
         t.type = 'local_ident'
     elif ( t.value[0:1] == '$' ):
         t.type = 'comdat_name'
+        return _illegal_token( t )
     return t
 
 # ============================================================
@@ -720,20 +960,63 @@ tokens = tokens + list( reserved.values() )
 t_ignore = " \t\r"
 
 # ============================================================
-# For errors we may want the line number
+# For errors we may want the line number. When parsing a whole
+# block of instructions (see block_parse) the newlines are also
+# what separates one instruction from the next, so there they are
+# handed to the parser. Otherwise they are just whitespace.
 # ============================================================
 def t_newline(t):
     r'\n+'
-    global line_number
     t.lexer.lineno += t.value.count("\n")
-    line_number = t.lexer.lineno
+    _state.context.line_number = t.lexer.lineno
+    if ( t.lexer.block_mode ):
+        t.lexer.segment = t.lexer.segment + 1
+        return t
 
 # ============================================================
 # Token for error handling
 # ============================================================
 def t_error(t):
-    print("Illegal character '%s'" % t.value[0])
-    t.lexer.skip(1)
+    _report( ParseError( 'illegal character', "Illegal character '%s'" % t.value[0],
+                         token_type = 'illegal', token_value = t.value[0], position = t.lexpos,
+                         line = t.lexer.lineno, column = _column( t.lexer.lexdata, t.lexpos ),
+                         source = _source_line( t.lexer.lexdata, t.lexer.lexpos ) ) )
+    t.lexer.failed.add( t.lexer.segment )
+    if ( _state.context.resync_lines and t.lexer.block_mode ):
+        # Throw away the rest of the line rather than complaining
+        # about every character of it.
+        end = t.value.find( '\n' )
+        if ( end < 0 ):
+            end = len( t.value )
+        t.lexer.skip( end )
+    else:
+        t.lexer.skip(1)
+
+# ============================================================
+# Labels ("entry:") and comdat names ("$name") look like tokens but
+# the grammar has no use for them at all, so they can't be part of
+# an instruction. Like an illegal character: say so, throw the token
+# away (the rest of the line too, with resync_lines in a block), and
+# the line (or the whole parse) comes back as None.
+#
+# Every lexer error marks the line it is on in lexer.failed, by
+# "segment": the number of newline tokens handed out before it. In a
+# block, every segment is one BlockLine (see p_BlockLine), so _parse
+# can tell afterwards which lines to make None.
+# ============================================================
+def _illegal_token( t ):
+    lexer = t.lexer
+    _report( ParseError( 'illegal token', "Illegal token '%s'" % t.value,
+                         token_type = t.type, token_value = t.value, position = t.lexpos,
+                         line = lexer.lineno, column = _column( lexer.lexdata, t.lexpos ),
+                         source = _source_line( lexer.lexdata, t.lexpos ) ) )
+    lexer.failed.add( lexer.segment )
+    if ( _state.context.resync_lines and lexer.block_mode ):
+        end = lexer.lexdata.find( '\n', lexer.lexpos )
+        if ( end < 0 ):
+            end = len( lexer.lexdata )
+        lexer.lexpos = end
+    return None
 
 # ============================================================
 #
@@ -745,10 +1028,37 @@ def t_error(t):
 #
 # ============================================================
 
-_Node__serial_number = 0
+############################################################
+# Text for a "dot" label. The double quotes would end the label, a
+# backslash (in a c"..." string) would start an escape of its own,
+# and "dot" gets confused with '%' in the string. Maybe everywhere, but
+# certainly if the label string starts with it. For instance if the
+# title is "%4\n..." you get a node in the graph with a label like
+# %1759 or some seemingly random number. The same few thousand
+# strings come up over and over, so we remember them.
+############################################################
+_dot_escapes = {}
+
+def dot_escape( text ):
+    escaped = _dot_escapes.get( text )
+    if ( escaped == None ):
+        escaped = text.replace( '\\', '\\\\' ).replace( '"', '\\"' ).replace( '%', '\\%' )
+        if ( len( _dot_escapes ) < 100000 ):
+            _dot_escapes[ text ] = escaped
+    return escaped
+
+def _dot_parent_label( node ):
+    left = ''
+    if ( node.title != "" ):
+        left = dot_escape( node.title ) + '\\n'
+    return '"' + left + dot_escape( node.nodetype ) + '\\n(Node ' + str( node.serial ) + ')"'
 
 class Node:
 
+    # ( start, end ) offsets into the input, in spans mode. See
+    # Node.text.
+    span = None
+
     ############################################################
     # Constructor.
     #
@@ -762,9 +1072,9 @@ class Node:
     #
     ############################################################
     def __init__( self, nodetype, newkids ):
-        global __serial_number
-        self.serial = __serial_number
-        __serial_number = __serial_number + 1
+        context = _state.context
+        self.serial = context.serial
+        context.serial = context.serial + 1
         self.title = ""
         self.nodetype = nodetype
         self.children = []
@@ -772,13 +1082,45 @@ class Node:
         self.was_terminal = False
         self.is_epsilon = False
         # line_number basically just doesn't work right.
-        self.line = line_number
+        self.line = context.line_number
+        ast = context.ast
+        # In AST mode, was everything under here (empty)?
+        only_epsilon = ast
+        # Spans need the token positions, which only PLY has (not
+        # hand made nodes, or the fast path). Shared terminals can't
+        # have a span of their own, so no flyweights then.
+        spans = context.spans and hasattr( newkids, 'lexpos' )
+        flyweights = context.flyweights and not spans
+        start = None
+        end = None
         # Go down the list of RHS elements and convert any
         # that are type "str" into type "Node".
         for x in range( 1, len( newkids[1:] ) + 1 ):
             if ( type( newkids[ x ] ) == str ):
+                if ( spans ):
+                    here = newkids.lexpos( x ) + context.span_base
+                    there = here + len( newkids[ x ] )
+                    if ( start == None ):
+                        start = here
+                    end = there
+                if ( ast and newkids[ x ] in ast_punctuation ):
+                    only_epsilon = False
+                    continue
+                if ( flyweights ):
+                    shared = shared_terminal( newkids[ x ] )
+                    if ( shared != None ):
+                        # No parent for these, see SharedNode.
+                        only_epsilon = False
+                        self.children.append( shared )
+                        continue
                 newkids[ x ] = Node( newkids[ x ], [] )
                 newkids[ x ].was_terminal = True
+                if ( spans ):
+                    newkids[ x ].span = ( here, there )
+            elif ( spans and newkids[ x ] is not None and newkids[ x ].span != None ):
+                if ( start == None ):
+                    start = newkids[ x ].span[ 0 ]
+                end = newkids[ x ].span[ 1 ]
 
             # Temporary debugging. Is this child a NoneType?
             if ( newkids[ x ] is None ):
@@ -790,8 +1132,97 @@ class Node:
             # OK, they may have been converted from "str"
             # or maybe not, but now for each of these,
             # the parent is this node.
+            if ( ast and newkids[ x ].is_epsilon ):
+                continue
+            only_epsilon = False
             newkids[ x ].parent = self
             self.children.append( newkids[ x ] )
+        if ( only_epsilon and len( newkids ) > 1 ):
+            self.is_epsilon = True
+        if ( spans and start != None ):
+            self.span = ( start, end )
+        if ( context.hashes ):
+            self.__hash()
+
+    ############################################################
+    # With weak parents (see bulk_parsing) there is no "parent" on
+    # the node itself, just a weak reference to it, and we end up
+    # here when someone asks.
+    ############################################################
+    def __getattr__( self, name ):
+        if ( name == 'parent' and '_parent_ref' in self.__dict__ ):
+            return self._parent_ref()
+        raise AttributeError( name )
+
+    ############################################################
+    # Source spans. With ParseContext( spans = True ) every node
+    # (other than an (empty)) gets a "span", the ( start, end )
+    # offsets of its text in the input, so "source[ start:end ]" is
+    # exactly what it was parsed from: the original text of an
+    # operand, say, rather than something pieced back together from
+    # the tree. Add "span_base" to the context to have them count
+    # from somewhere else, like where the line starts in a file.
+    #
+    # text() hands back that piece of "source". Give it bytes, an
+    # mmap or a memoryview and you get a memoryview, so nothing is
+    # copied. (The offsets count characters; for bytes that is the
+    # same thing as long as the text is ASCII.)
+    #
+    # Spans don't go with a TypeTable (ParseContext won't have it): a
+    # shared type is in many places at once, so it has no one span.
+    ############################################################
+    def text( self, source ):
+        if ( self.span == None ):
+            return None
+        if ( not isinstance( source, ( str, memoryview ) ) ):
+            source = memoryview( source )
+        return source[ self.span[ 0 ]:self.span[ 1 ] ]
+
+    ############################################################
+    # Structural hashes. With ParseContext( hashes = True ) each node
+    # gets two, worked out from its children's as the tree is built
+    # (so it costs a digest per node):
+    #
+    #    exact_hash  the nodetype and the children's exact_hash, so
+    #                the same whenever tree_as_string is
+    #    shape_hash  the same but blind to what is under the
+    #                anonymous_types, so "%3 = add i32 %1, 4" and
+    #                "%x = add i32 %y, 4" have the same one; with
+    #                ParseContext( anonymous_literals = True ) it is
+    #                blind to the literal_types too, and
+    #                "%x = add i32 %y, 12" has it as well
+    #
+    # Equal hashes almost certainly mean equal trees, and same_as
+    # and same_shape_as only walk the trees to make sure when they
+    # are. They are 8 byte blake2b digests (see stable_hash), not
+    # Python's hash(), which is different in every process; these
+    # are the same in every process and every run, so they can be
+    # kept in a file or sent between worker processes.
+    ############################################################
+    def __hash( self ):
+        kids = self.children
+        if ( len( kids ) == 0 ):
+            self.exact_hash = stable_hash( self.nodetype )
+            self.shape_hash = self.exact_hash
+            return
+        self.exact_hash = stable_hash( self.nodetype, [ x.exact_hash for x in kids ] )
+        if ( self.nodetype in anonymous_types or
+             ( self.nodetype in literal_types and _state.context.anonymous_literals ) ):
+            self.shape_hash = stable_hash( self.nodetype )
+        else:
+            self.shape_hash = stable_hash( self.nodetype, [ x.shape_hash for x in kids ] )
+
+    def same_as( self, other ):
+        _need_hashes( [ self, other ] )
+        if ( self.exact_hash != other.exact_hash ):
+            return False
+        return _same_structure( self, other, False )
+
+    def same_shape_as( self, other ):
+        _need_hashes( [ self, other ] )
+        if ( self.shape_hash != other.shape_hash ):
+            return False
+        return _same_structure( self, other, True )
 
     ############################################################
     # Dump to an ASCII file in "lispey" notation.  This was before I
@@ -829,52 +1260,49 @@ class Node:
         return pr
 
     ############################################################
-    # Dump out a "dot" file for the graphviz "dot" command.
+    # Dump out a "dot" file for the graphviz "dot" command. (For a
+    # lot of trees at once, see llvm_graph.)
     ############################################################
     def graph( self, filename, destroy = False ):
         # Don't destroy an existing file unless asked.
-        if ( destroy ):
-            file = None
-        else:
-            try:
-                file = open( filename, "r" )
-            except FileNotFoundError:
-                file = None
-        if ( file == None ):    
-            file = open( filename, "w" )
-            file.write( "digraph llvm_parse {\n" )
-            self.__generate( file )
-            file.write( "}\n" )
-            file.close()
-        else:
+        if ( not destroy and os.path.exists( filename ) ):
             print( "That dot and txt file exists - I am not overwriting it, please delete it first." )
+            return
+        out = [ "digraph llvm_parse {\n" ]
+        self.__generate( out )
+        out.append( "}\n" )
+        with open( filename, "w" ) as file:
+            file.write( ''.join( out ) )
 
     ############################################################
-    # Helper function for "graph".
+    # Helper function for "graph". Every node is named by its label,
+    # so a node is drawn once however many edges it is in. The edges
+    # come out parent first, each child's edge followed by everything
+    # under that child.
     ############################################################
-    def __generate( self, file ):
-        kids = len( self.children )
-        if ( kids > 0 ):
-            left = ''
-            if ( self.title != "" ):
-                # The title string might have double quotes, confusing "dot".
-                left = self.title.replace( '"', '\\"' ) + '\\n'
-            left = '"' + left + self.nodetype + '\\n(Node ' + str(self.serial) + ')"'
-            # "dot" gets confused with '%' in the string. Maybe everywhere,
-            # but certainly if the label string starts with it. For instance
-            # if the title is "%4\n..." you get a node in the graph with a 
-            # label like %1759 or some seemingly random number. 
-            left = left.replace( '%', '\\%' )
-            for x in self.children:
-                if ( x.was_terminal ):
-                    right = '"' + x.nodetype.replace('"', '\\"' ) + '\\n(Node ' + str(x.serial) + ')\\n(terminal)"'
-                else:
-                    right = '"' + x.nodetype + '\\n(Node ' + str(x.serial) + ')"'
-                right = right.replace( '%', '\\%' )
-                file.write( '\t' + left + ' -> ' + right + '\n' )
-                # Just to be efficient here. Terminals have no kids.
-                if ( not x.was_terminal ):
-                    x.__generate( file )
+    def __generate( self, out ):
+        work = []
+        if ( len( self.children ) > 0 ):
+            work.append( ( self, _dot_parent_label( self ), 0 ) )
+        while ( len( work ) > 0 ):
+            node, left, i = work.pop()
+            if ( i + 1 < len( node.children ) ):
+                work.append( ( node, left, i + 1 ) )
+            x = node.children[ i ]
+            # A shared node shows up all over, so it gets a name
+            # from where it is instead. See SharedNode.
+            if ( x.serial == None ):
+                serial = str( node.serial ) + '.' + str( i )
+            else:
+                serial = str( x.serial )
+            if ( x.was_terminal ):
+                right = '"' + dot_escape( x.nodetype ) + '\\n(Node ' + serial + ')\\n(terminal)"'
+            else:
+                right = '"' + dot_escape( x.nodetype ) + '\\n(Node ' + serial + ')"'
+            out.append( '\t' + left + ' -> ' + right + '\n' )
+            # Just to be efficient here. Terminals have no kids.
+            if ( not x.was_terminal and len( x.children ) > 0 ):
+                work.append( ( x, _dot_parent_label( x ), 0 ) )
 
     ############################################################
     # This is used by others (not in this file).
@@ -904,6 +1332,20 @@ class Node:
                 return x
         return None
 
+    ############################################################
+    # Every node in the tree, top down and left to right, as
+    # ( node, parent ) pairs. The parent comes from the walk, not
+    # from the node, so this is right for shared nodes too (see
+    # SharedNode).
+    ############################################################
+    def walk( self ):
+        work = [ ( self, None ) ]
+        while ( len( work ) > 0 ):
+            node, parent = work.pop()
+            yield ( node, parent )
+            for x in reversed( node.children ):
+                work.append( ( x, node ) )
+
     ############################################################
     # Many times there is a long chain of nodes that ends in one
     # thing. For example, Type -> FirstClassType -> ConcreteType ->
@@ -916,6 +1358,359 @@ class Node:
             here = here.children[ 0 ]
         return here.nodetype
     
+############################################################
+# The hash of a node from its nodetype and its children's hashes
+# (see Node.same_as). The nodetype is ended with a zero byte so it
+# can't run on into the first child's digest.
+############################################################
+def stable_hash( nodetype, kids = () ):
+    digest = hashlib.blake2b( nodetype.encode( 'utf-8', 'surrogatepass' ) + b'\0', digest_size = 8 )
+    for x in kids:
+        digest.update( x )
+    return digest.digest()
+
+# ============================================================
+#
+# Flyweights. A terminal node is nothing but its text, so there is
+# no need for a new one for every ',', '=', "align", "inbounds" or
+# "i32" in every tree, or for every (empty) that an omitted
+# OptVolatile, OptTail, FastMathFlags and the like turn into. With
+# ParseContext( flyweights = True ) keywords, punctuation, integer
+# types and (empty) are all one shared SharedNode each, which cuts
+# down the node count a lot. tree_as_string and friends can't tell
+# the difference.
+#
+# What you give up: a shared node can't have a parent, so its
+# "parent" is always None (use Node.walk to get at it from the top
+# down), it has no serial number (None; graph() names it after its
+# place in the tree), and it is read only. And since terminals no
+# longer use up serial numbers, the other nodes are numbered
+# differently than without flyweights.
+#
+# It is no slower to parse this way: the productions get their own
+# straight line actions for it (see _mode_parser), and there are
+# fewer nodes to make. "python llvm_benchmark.py modes" compares.
+#
+# ============================================================
+
+class SharedNode( Node ):
+
+    def __init__( self, nodetype, is_epsilon = False ):
+        self.__dict__.update( serial = None, title = "", nodetype = nodetype, children = (),
+                              parent = None, was_terminal = True, is_epsilon = is_epsilon, line = 0,
+                              exact_hash = stable_hash( nodetype ), shape_hash = stable_hash( nodetype ) )
+
+    def __setattr__( self, name, value ):
+        # Everybody sets the parent of a new child. Let them.
+        if ( name != 'parent' ):
+            raise AttributeError( 'shared node "' + self.nodetype + '" is read only' )
+
+_shared_terminals = {}
+
+_shared_int_type_re = re.compile( r'i[0-9]+$' )
+
+############################################################
+# The shared node for terminal "text", or None if it isn't one we
+# share. Identifiers and numbers aren't, or the table would grow
+# forever.
+############################################################
+def shared_terminal( text ):
+    shared = _shared_terminals.get( text )
+    if ( shared == None ):
+        if ( not ( text in reserved or text in literals or _shared_int_type_re.match( text ) ) ):
+            return None
+        # setdefault so that two threads can't both install one.
+        shared = _shared_terminals.setdefault( text, SharedNode( text ) )
+    return shared
+
+shared_empty = SharedNode( '(empty)', is_epsilon = True )
+
+# ============================================================
+#
+# AST mode. Nobody looking at a tree cares about the ',', '(', ')',
+# '[', "to" and so on, or about the (empty) under an OptVolatile
+# that wasn't there; they just get in the way, and they make the
+# child numbers jump around. With ParseContext( ast = True ) Node()
+# leaves out the punctuation terminals in ast_punctuation, and any
+# child that is nothing but (empty) all the way down (that child
+# gets is_epsilon set, like (empty) itself). Everything else stays
+# as it was.
+#
+# ('<' and '>' are kept, since they are what makes a struct packed,
+# and so is '=', which is how everybody tells "%x = ..." from an
+# instruction with no result: Instruction has the same three
+# children either way.)
+#
+# So the children of a node depend on which optional parts were
+# there. ast_children( 'LoadInst' ) gives the layout for each
+# production, with a '?' on the ones that may be missing; AST.md
+# has them all, one instruction kind at a time.
+#
+# Like flyweights, AST mode has its own straight line actions (see
+# _mode_parser), so the smaller trees cost no more to build.
+#
+# ============================================================
+
+ast_punctuation = frozenset( [ ',', '!', '(', ')', '[', ']', '{', '}', '*', '|', 'to' ] )
+
+############################################################
+# The right hand sides of the Instruction grammar, by nonterminal,
+# and which nonterminals can be empty.
+############################################################
+def _grammar():
+    rules = {}
+    for p in _get_parser( 'Instruction' ).productions[ 1: ]:
+        rhs = p.str.split( '->' )[ 1 ].split()
+        if ( rhs == [ '<empty>' ] ):
+            rhs = []
+        rules.setdefault( p.name, [] ).append( rhs )
+    nullable = set()
+    changed = True
+    while ( changed ):
+        changed = False
+        for name, productions in rules.items():
+            if ( name not in nullable and
+                 any( [ all( [ x in nullable for x in rhs ] ) for rhs in productions ] ) ):
+                nullable.add( name )
+                changed = True
+    return ( rules, nullable )
+
+############################################################
+# A list with one entry per production for "nodetype", each the
+# list of children an AST node of that production has. Terminals
+# are given by token type (in the tree the nodetype is the text).
+############################################################
+def ast_children( nodetype ):
+    rules, nullable = _grammar()
+    return [ [ x + '?' if x in nullable else x for x in rhs if x not in ast_punctuation ]
+             for rhs in rules.get( nodetype, [] ) ]
+
+############################################################
+# Write AST.md, the layouts for every kind of instruction.
+############################################################
+def write_ast_documentation( file ):
+    file.write( '# AST layouts\n\n' )
+    file.write( 'What the children of each kind of instruction are in AST mode\n' )
+    file.write( '(`ParseContext( ast = True )`), one line per production. Punctuation\n' )
+    file.write( '(' + ' '.join( [ '`' + x + '`' for x in sorted( ast_punctuation ) ] ) + ') is left out, and\n' )
+    file.write( 'a child marked `?` is left out when it is empty. Terminals are shown by\n' )
+    file.write( 'token type; in the tree their nodetype is the text itself.\n\n' )
+    file.write( 'Generated by `llvm_instruction_parser.write_ast_documentation`.\n' )
+    for kind in [ 'Instruction', 'ValueInstruction' ] + sorted( set( _opcode_kinds.values() ) ):
+        file.write( '\n## ' + kind + '\n\n' )
+        for children in ast_children( kind ):
+            file.write( '- ' + ' '.join( children ) + '\n' )
+
+# ============================================================
+#
+# For shape_hash (see Node.same_as) all identifiers are the same.
+# Integers are only if the trees were parsed with
+# ParseContext( anonymous_literals = True ).
+#
+# ============================================================
+
+anonymous_types = [ 'LocalIdent', 'GlobalIdent' ]
+
+literal_types = [ 'decimal_lit' ]
+
+############################################################
+# Hashes are only there if the trees came from a hashes = True
+# parse.
+############################################################
+def _need_hashes( trees ):
+    for tree in trees:
+        if ( not hasattr( tree, 'exact_hash' ) ):
+            raise ValueError( 'No structural hashes on this tree; parse with ParseContext( hashes = True )' )
+
+############################################################
+# Did shape_hash leave out what is under "node"? A literal's shape
+# hash is just its nodetype's when it did.
+############################################################
+def _anonymous( node ):
+    if ( node.nodetype in anonymous_types ):
+        return True
+    return node.nodetype in literal_types and node.shape_hash == stable_hash( node.nodetype )
+
+############################################################
+# Are "a" and "b" the same tree (or the same shape, ignoring what is
+# under the anonymous nodes)? Walks both side by side.
+############################################################
+def _same_structure( a, b, shape ):
+    work = [ ( a, b ) ]
+    while ( len( work ) > 0 ):
+        a, b = work.pop()
+        if ( a is b ):
+            continue
+        if ( a.nodetype != b.nodetype or len( a.children ) != len( b.children ) ):
+            return False
+        if ( shape and ( a.nodetype in anonymous_types or a.nodetype in literal_types ) ):
+            anonymous = _anonymous( a )
+            if ( anonymous != _anonymous( b ) ):
+                return False
+            if ( anonymous ):
+                continue
+        work.extend( zip( a.children, b.children ) )
+    return True
+
+############################################################
+# The trees in "trees" with the duplicates taken out (the first of
+# each is kept), going by the hashes from a hashes = True parse.
+############################################################
+def dedup( trees, shape = False ):
+    seen = {}
+    unique = []
+    for tree in trees:
+        _need_hashes( [ tree ] )
+        key = tree.shape_hash if shape else tree.exact_hash
+        bucket = seen.setdefault( key, [] )
+        if ( any( [ _same_structure( tree, x, shape ) for x in bucket ] ) ):
+            continue
+        bucket.append( tree )
+        unique.append( tree )
+    return unique
+
+# ============================================================
+#
+# Type interning. A module only has a few hundred distinct types but
+# every instruction parses its own copy of "i32", "ptr", "[128 x i8]"
+# and so on. If the ParseContext has a TypeTable then p_Type,
+# p_FirstClassType and p_ConcreteType hand back one shared instance
+# for each distinct type, for as long as that table is in use (the
+# "session"). So two types are the same exactly when they are the
+# same object, and "a is b" is all the comparison you need.
+#
+# Shared type subtrees must be treated as read only. And since one
+# instance hangs under many trees, a shared type has no parent: its
+# "parent" is always None (it is a SharedType), so walking up out of
+# one stops right there rather than ending up in some other tree.
+#
+#    context = parser.ParseContext( type_table = parser.TypeTable() )
+#    ... parse away, passing context = context ...
+#
+# A TypeTable may be shared by contexts in different threads; it
+# keeps everything it has seen until clear() starts a new session.
+#
+# ============================================================
+
+interned_types = [ 'Type', 'FirstClassType', 'ConcreteType' ]
+
+class SharedType( Node ):
+
+    # Everybody sets the parent of a new child; it goes nowhere.
+    @property
+    def parent( self ):
+        return None
+
+    @parent.setter
+    def parent( self, value ):
+        pass
+
+class TypeTable:
+
+    def __init__( self ):
+        self.lock = threading.Lock()
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+
+    ############################################################
+    # The key of a node is its nodetype plus the keys of the
+    # children. Interned children are already the shared instance
+    # (the parse is bottom up) so their identity is their key and we
+    # never have to look further down than that.
+    ############################################################
+    def key( self, node ):
+        if ( node.was_terminal ):
+            return node.nodetype
+        if ( node.nodetype in interned_types ):
+            return id( node )
+        return ( node.nodetype, tuple( [ self.key( x ) for x in node.children ] ) )
+
+    def intern( self, node ):
+        key = ( node.nodetype, tuple( [ self.key( x ) for x in node.children ] ) )
+        with self.lock:
+            shared = self.table.get( key )
+            if ( shared == None ):
+                node.__dict__.pop( 'parent', None )
+                node.__dict__.pop( '_parent_ref', None )
+                node.__class__ = SharedType
+                self.table[ key ] = node
+                self.misses = self.misses + 1
+                return node
+            self.hits = self.hits + 1
+            return shared
+
+    ############################################################
+    # Intern every type in a tree that was built without the table,
+    # innermost first (just the order the parse would have done it
+    # in), and put the shared ones in place. Returns the tree, or
+    # the shared instance if the tree is a type itself. This is for
+    # a parse that might give up part way (see llvm_fast_path): it
+    # builds with no table and interns only once it has finished,
+    # so giving up leaves nothing behind in here.
+    ############################################################
+    def intern_tree( self, node ):
+        if ( node.was_terminal or node.__class__ is SharedType ):
+            return node
+        kids = node.children
+        for x in range( 0, len( kids ) ):
+            kids[ x ] = self.intern_tree( kids[ x ] )
+        if ( node.nodetype in interned_types ):
+            return self.intern( node )
+        return node
+
+    ############################################################
+    # Start a new session. Types handed out already stay shared
+    # (and parentless), they just won't be handed out again.
+    ############################################################
+    def clear( self ):
+        with self.lock:
+            self.table = {}
+            self.hits = 0
+            self.misses = 0
+
+    def __len__( self ):
+        return len( self.table )
+
+# ============================================================
+#
+# A node whose subtree has not been parsed yet. All we keep is the
+# raw source text for it, and the first time anybody looks at the
+# children we run that text through the fragment parser for this
+# nodetype and adopt what comes back. See lazy_inst_parse.
+#
+# lazy_inst_parse has already made sure the text will parse, so this
+# shouldn't fail. If it does anyway, the error goes to the sink like
+# any other and we raise ValueError, rather than pretend there was
+# nothing there.
+#
+# ============================================================
+
+class LazyNode( Node ):
+
+    def __init__( self, nodetype, text ):
+        self._source_text = text
+        # The deferred parse carries on with the same serial numbers.
+        self.context = _state.context
+        Node.__init__( self, nodetype, [] )
+
+    @property
+    def children( self ):
+        if ( self._source_text != None ):
+            errors = self.context.number_of_errors
+            parsed = fragment_parse( self.nodetype, self._source_text, context = self.context )
+            if ( parsed == None or self.context.number_of_errors > errors ):
+                raise ValueError( 'Deferred ' + self.nodetype + ' did not parse: ' + self._source_text )
+            self._source_text = None
+            self._children = parsed.children
+            for x in self._children:
+                _set_parent( x, self, self.context.weak_parents )
+        return self._children
+
+    @children.setter
+    def children( self, kids ):
+        self._children = kids
+
 # ============================================================
 #
 # Parser starts here. 
@@ -943,6 +1738,56 @@ def p_Instruction(t):
     '''
     t[ 0 ] = Node( 'Instruction', t )
 
+# ============================================================
+# Not part of the LLVM grammar: a run of instructions, one per line,
+# for parsing a whole basic block in one go (see block_parse). This
+# builds a plain list of trees rather than a Node. A line that does
+# not parse becomes None in the list, and the "error" production
+# throws away the rest of that line so the next one starts clean.
+# So does a line the lexer had trouble with, even if what was left
+# of it parsed (see _illegal_token). Blank lines are skipped.
+#
+# Block     -> BlockLine
+#           -> Block newline BlockLine
+# BlockLine -> Instruction
+#           -> empty
+#           -> error
+# ============================================================
+
+# Next
+def p_Block(t):
+    '''Block : BlockLine
+    | Block newline BlockLine
+    '''
+    t[ 0 ] = t[ 1 ]
+    if ( len( t ) > 2 ):
+        t[ 0 ].extend( t[ 3 ] )
+
+# (Each line is numbered as it goes by, for _block_lines.)
+# Next
+def p_BlockLine(t):
+    '''BlockLine : Instruction
+    | empty
+    '''
+    index = t.lexer.block_lines
+    t.lexer.block_lines = index + 1
+    if ( t[ 1 ].is_epsilon ):
+        t[ 0 ] = []
+    else:
+        t[ 0 ] = [ ( index, t[ 1 ] ) ]
+
+# Next
+def p_BlockLine_error(t):
+    '''BlockLine : error
+    '''
+    index = t.lexer.block_lines
+    t.lexer.block_lines = index + 1
+    t[ 0 ] = [ ( index, None ) ]
+    # PLY stays quiet until three good tokens go by after an error,
+    # which could hide the next bad line. We know we're back in sync.
+    if ( _state.context.resync_lines ):
+        t.parser.errok()
+
 # Next
 def p_ValueInstruction(t):
     '''ValueInstruction : AddInst
@@ -1239,6 +2084,9 @@ def p_Type(t):
     | FirstClassType
     '''
     t[ 0 ] = Node( 'Type', t )
+    types = _state.context.type_table
+    if ( types != None ):
+        t[ 0 ] = types.intern( t[ 0 ] )
 
 # Next
 def p_FirstClassType(t):
@@ -1246,6 +2094,9 @@ def p_FirstClassType(t):
     | MetadataType
     '''
     t[ 0 ] = Node( 'FirstClassType', t )
+    types = _state.context.type_table
+    if ( types != None ):
+        t[ 0 ] = types.intern( t[ 0 ] )
 
 # Next
 def p_ConcreteType(t):
@@ -1261,6 +2112,9 @@ def p_ConcreteType(t):
     | TokenType
     '''
     t[ 0 ] = Node( 'ConcreteType', t )
+    types = _state.context.type_table
+    if ( types != None ):
+        t[ 0 ] = types.intern( t[ 0 ] )
 
 # Next
 def p_VoidType(t):
@@ -1338,7 +2192,7 @@ def p_VectorType(t):
     '''VectorType : '<' int_lit name Type '>'
     '''
     if ( t[ 3 ] != "x" ):
-        print( "Parsing VectorType but the name is not 'x'?" )
+        _semantic_error( t, 3, "Parsing VectorType but the name is not 'x'?" )
         raise SyntaxError
     t[ 0 ] = Node( 'VectorType', t )
 
@@ -1376,7 +2230,7 @@ def p_ArrayType(t):
     '''
     # print( 'here we are and t[3].value is', t[3] )
     if ( t[ 3 ] != "x" ):
-        print( "Parsing ArrayType but the name is not 'x'?" )
+        _semantic_error( t, 3, "Parsing ArrayType but the name is not 'x'?" )
         raise SyntaxError
     t[ 0 ] = Node( 'ArrayType', t )
 
@@ -1524,7 +2378,7 @@ def p_CharArrayConst(t):
     '''CharArrayConst : name StringLit
     '''
     if ( t[ 1 ] != "c" ):
-        print( "Parsing CharArrayConst but the name is not 'c' ???" )
+        _semantic_error( t, 1, "Parsing CharArrayConst but the name is not 'c' ???" )
         raise SyntaxError
     t[ 0 ] = Node( 'CharArrayConst', t )
 
@@ -3691,17 +4545,59 @@ def p_float_lit(t):
 def p_empty(t):
     '''empty :
     '''
-    t[ 0 ] = Node( '(empty)', [] )
-    t[ 0 ].is_epsilon = True
-    t[ 0 ].was_terminal = True
+    context = _state.context
+    if ( context.flyweights ):
+        t[ 0 ] = shared_empty
+        return
+    if ( context.hashes ):
+        t[ 0 ] = Node( '(empty)', [] )
+        t[ 0 ].is_epsilon = True
+        t[ 0 ].was_terminal = True
+        return
+    # This is the most common reduction of all, so it makes the node
+    # itself, just as Node() would have.
+    node = object.__new__( Node )
+    node.serial = context.serial
+    context.serial = context.serial + 1
+    node.title = ""
+    node.nodetype = '(empty)'
+    node.children = []
+    node.parent = None
+    node.was_terminal = True
+    node.is_epsilon = True
+    node.line = context.line_number
+    t[ 0 ] = node
 
 def p_error(token):
-    global number_of_errors
     # print( "Syntax error at '%s'" % token.value )
-    print( "Syntax error (well, grammar error) at about line " +
-           str( token.lineno ) + " at or before token '" +
-           token.value + "'" )
-    number_of_errors = number_of_errors + 1
+    # What could the parser have taken here? PLY leaves the state it
+    # was in on the parser for us.
+    i_parser = _state.parser
+    expected = None
+    if ( i_parser != None ):
+        expected = sorted( [ x for x in i_parser.action[ i_parser.state ].keys() if x != 'error' ] )
+    if ( token == None ):
+        data = _state.lexer.lexdata
+        _report( ParseError( 'syntax', "Syntax error (well, grammar error) at the end of the input",
+                             token_type = '$end', position = len( data ), line = _state.lexer.lineno,
+                             column = _column( data, len( data ) ), expected = expected,
+                             source = _source_line( data, len( data ) ) ) )
+        return
+    _report( ParseError( 'syntax', "Syntax error (well, grammar error) at about line " +
+                         str( token.lineno ) + " at or before token '" + str( token.value ) + "'",
+                         token_type = token.type, token_value = token.value, position = token.lexpos,
+                         line = token.lineno, column = _column( token.lexer.lexdata, token.lexpos ),
+                         expected = expected, source = _source_line( token.lexer.lexdata, token.lexpos ) ) )
+
+############################################################
+# The checks in p_ArrayType and friends come through here. The bad
+# token is t[ n ].
+############################################################
+def _semantic_error( t, n, message ):
+    data = t.lexer.lexdata
+    _report( ParseError( 'semantic', message, token_type = 'name', token_value = t[ n ],
+                         position = t.lexpos( n ), line = t.lineno( n ), column = _column( data, t.lexpos( n ) ),
+                         source = _source_line( data, t.lexpos( n ) ) ) )
 
 # ============================================================
 #
@@ -3723,10 +4619,323 @@ if ( False ):
 
 # ============================================================
 #
-# And here's the main function to do the work.
+# Nearly every p_* function is just "t[ 0 ] = Node( 'Whatever', t )",
+# and Node() then has to go down the right hand side checking each
+# thing to see if it is a terminal string. But we know which ones are
+# terminals from the grammar. So when a parser is built, each
+# production with one of these plain actions gets its own action,
+# written out here as straight line code that makes the same nodes
+# (serial numbers and all) without any of the checking.
 #
-# DEBUG logging gives you huge parselog.txt files.
-# ERROR logging just gives syntax error information.
+# Flyweights and AST mode get straight line actions of their own
+# (see _mode_parser); the spans and hashes modes are left to Node()
+# itself. The Type layers, which hand what they made to the
+# TypeTable (when there is one) after that, are just as plain.
+#
+# ============================================================
+
+# Production string -> the generated action.
+_generated_actions = {}
+# Name of a generated action -> ( nodetype, rhs, terminal, interned ),
+# for making the variants for the other modes.
+_action_specs = {}
+# p_* function -> ( its nodetype, whether it interns ), or None if
+# it does more than that.
+_plain_actions = {}
+
+# What p_Type and friends do after making the node.
+_interning = ast.dump( ast.parse( 'types = _state.context.type_table\n' +
+                                  'if ( types != None ):\n' +
+                                  '    t[ 0 ] = types.intern( t[ 0 ] )\n' ) )
+
+def _plain_nodetype( action ):
+    if ( action not in _plain_actions ):
+        nodetype = None
+        try:
+            body = ast.parse( inspect.getsource( action ) ).body[ 0 ].body
+        except ( OSError, TypeError, SyntaxError ):
+            body = []
+        if ( len( body ) > 0 and isinstance( body[ 0 ], ast.Expr ) ):
+            body = body[ 1: ]
+        interned = ( len( body ) == 3 and ast.dump( ast.Module( body = body[ 1: ], type_ignores = [] ) ) == _interning )
+        if ( interned ):
+            body = body[ :1 ]
+        if ( len( body ) == 1 and isinstance( body[ 0 ], ast.Assign ) ):
+            target = body[ 0 ].targets[ 0 ]
+            value = body[ 0 ].value
+            # t[ 0 ] = ...
+            plain = ( len( body[ 0 ].targets ) == 1 and isinstance( target, ast.Subscript ) and
+                      _is_name( target.value, 't' ) and _is_constant( target.slice, 0 ) )
+            # ... Node( 'Whatever', t )
+            plain = ( plain and isinstance( value, ast.Call ) and _is_name( value.func, 'Node' ) and
+                      len( value.args ) == 2 and len( value.keywords ) == 0 and
+                      _is_constant( value.args[ 0 ], str ) and _is_name( value.args[ 1 ], 't' ) )
+            if ( plain ):
+                nodetype = ( value.args[ 0 ].value, interned )
+        _plain_actions[ action ] = nodetype
+    return _plain_actions[ action ]
+
+def _is_name( node, name ):
+    return isinstance( node, ast.Name ) and node.id == name
+
+def _is_constant( node, value ):
+    if ( not isinstance( node, ast.Constant ) ):
+        return False
+    if ( value == str ):
+        return type( node.value ) == str
+    return node.value == value
+
+############################################################
+# The code for one production: "nodetype" made from "rhs", where
+# "terminal" says which of those are terminals. If it is "interned"
+# the node goes to the TypeTable after.
+############################################################
+def _intern_source( interned, indent = '    ' ):
+    if ( not interned ):
+        return []
+    return [ indent + 'types = context.type_table',
+             indent + 'if ( types != None ):',
+             indent + '    t[ 0 ] = types.intern( t[ 0 ] )' ]
+
+def _action_source( name, nodetype, rhs, terminal, interned ):
+    terminals = len( [ x for x in terminal if x ] )
+    code = [ 'def ' + name + '( t ):',
+             '    context = _state.context',
+             '    if ( context.flyweights or context.ast or context.spans or context.hashes ):',
+             '        t[ 0 ] = Node( ' + repr( nodetype ) + ', t )' ] + \
+        _intern_source( interned, '        ' ) + \
+           [ '        return',
+             '    serial = context.serial',
+             '    context.serial = serial + ' + str( terminals + 1 ),
+             '    line = context.line_number',
+             '    node = _new_node( Node )',
+             '    node.serial = serial',
+             '    node.title = ""',
+             '    node.nodetype = ' + repr( nodetype ) ]
+    # Same attributes in the same order as Node(), so all the nodes
+    # still share one set of dict keys.
+    n = 0
+    for i in range( 1, len( rhs ) + 1 ):
+        kid = 'k' + str( i )
+        if ( terminal[ i - 1 ] ):
+            n = n + 1
+            code = code + [ '    ' + kid + ' = _new_node( Node )',
+                            '    ' + kid + '.serial = serial + ' + str( n ),
+                            '    ' + kid + '.title = ""',
+                            '    ' + kid + '.nodetype = t[ ' + str( i ) + ' ]',
+                            '    ' + kid + '.children = []',
+                            '    ' + kid + '.parent = node',
+                            '    ' + kid + '.was_terminal = True',
+                            '    ' + kid + '.is_epsilon = False',
+                            '    ' + kid + '.line = line' ]
+        else:
+            code = code + [ '    ' + kid + ' = t[ ' + str( i ) + ' ]',
+                            '    ' + kid + '.parent = node' ]
+    code = code + [ '    node.children = [ ' + ', '.join( [ 'k' + str( i ) for i in range( 1, len( rhs ) + 1 ) ] ) + ' ]',
+                    '    node.parent = None',
+                    '    node.was_terminal = False',
+                    '    node.is_epsilon = False',
+                    '    node.line = line',
+                    '    t[ 0 ] = node' ] + _intern_source( interned )
+    return '\n'.join( code ) + '\n'
+
+############################################################
+# The same for a flyweights parse. Which terminals might be shared
+# goes by the token type: literals and keywords always are, and so
+# are the integer types, and no other token's text ever is (see
+# shared_terminal). Only the terminals that aren't shared use up
+# serial numbers, so they are counted as they go.
+############################################################
+_maybe_shared = frozenset( literals + list( reserved.values() ) + [ 'int_type' ] )
+
+def _flyweight_action_source( name, nodetype, rhs, terminal, interned ):
+    code = [ 'def ' + name + '( t ):',
+             '    context = _state.context',
+             '    serial = context.serial',
+             '    context.serial = serial + 1',
+             '    line = context.line_number',
+             '    node = _new_node( Node )',
+             '    node.serial = serial',
+             '    node.title = ""',
+             '    node.nodetype = ' + repr( nodetype ) ]
+    for i in range( 1, len( rhs ) + 1 ):
+        kid = 'k' + str( i )
+        if ( terminal[ i - 1 ] ):
+            indent = '    '
+            if ( rhs[ i - 1 ] in _maybe_shared ):
+                code = code + [ '    ' + kid + ' = _shared_terminal( t[ ' + str( i ) + ' ] )',
+                                '    if ( ' + kid + ' == None ):' ]
+                indent = '        '
+            code = code + [ indent + kid + ' = _new_node( Node )',
+                            indent + kid + '.serial = context.serial',
+                            indent + 'context.serial = context.serial + 1',
+                            indent + kid + '.title = ""',
+                            indent + kid + '.nodetype = t[ ' + str( i ) + ' ]',
+                            indent + kid + '.children = []',
+                            indent + kid + '.parent = node',
+                            indent + kid + '.was_terminal = True',
+                            indent + kid + '.is_epsilon = False',
+                            indent + kid + '.line = line' ]
+        else:
+            code = code + [ '    ' + kid + ' = t[ ' + str( i ) + ' ]',
+                            '    ' + kid + '.parent = node' ]
+    code = code + [ '    node.children = [ ' + ', '.join( [ 'k' + str( i ) for i in range( 1, len( rhs ) + 1 ) ] ) + ' ]',
+                    '    node.parent = None',
+                    '    node.was_terminal = False',
+                    '    node.is_epsilon = False',
+                    '    node.line = line',
+                    '    t[ 0 ] = node' ] + _intern_source( interned )
+    return '\n'.join( code ) + '\n'
+
+############################################################
+# And for AST mode (see ast_children), with or without flyweights.
+# A punctuation terminal is known from its token type, so it is
+# simply never looked at; an (empty) child is only known once it is
+# there. A node with no terminals whose children all turned out to
+# be (empty) is one itself.
+############################################################
+def _ast_action_source( name, nodetype, rhs, terminal, interned, flyweights ):
+    code = [ 'def ' + name + '( t ):',
+             '    context = _state.context',
+             '    serial = context.serial',
+             '    context.serial = serial + 1',
+             '    line = context.line_number',
+             '    node = _new_node( Node )',
+             '    node.serial = serial',
+             '    node.title = ""',
+             '    node.nodetype = ' + repr( nodetype ),
+             '    kids = []' ]
+    for i in range( 1, len( rhs ) + 1 ):
+        kid = 'k' + str( i )
+        if ( terminal[ i - 1 ] ):
+            if ( rhs[ i - 1 ] in ast_punctuation ):
+                continue
+            indent = '    '
+            if ( flyweights and rhs[ i - 1 ] in _maybe_shared ):
+                code = code + [ '    ' + kid + ' = _shared_terminal( t[ ' + str( i ) + ' ] )',
+                                '    if ( ' + kid + ' == None ):' ]
+                indent = '        '
+            code = code + [ indent + kid + ' = _new_node( Node )',
+                            indent + kid + '.serial = context.serial',
+                            indent + 'context.serial = context.serial + 1',
+                            indent + kid + '.title = ""',
+                            indent + kid + '.nodetype = t[ ' + str( i ) + ' ]',
+                            indent + kid + '.children = []',
+                            indent + kid + '.parent = node',
+                            indent + kid + '.was_terminal = True',
+                            indent + kid + '.is_epsilon = False',
+                            indent + kid + '.line = line',
+                            '    kids.append( ' + kid + ' )' ]
+        else:
+            code = code + [ '    ' + kid + ' = t[ ' + str( i ) + ' ]',
+                            '    if ( not ' + kid + '.is_epsilon ):',
+                            '        ' + kid + '.parent = node',
+                            '        kids.append( ' + kid + ' )' ]
+    if ( any( terminal ) or len( rhs ) == 0 ):
+        epsilon = 'False'
+    else:
+        epsilon = '( len( kids ) == 0 )'
+    code = code + [ '    node.children = kids',
+                    '    node.parent = None',
+                    '    node.was_terminal = False',
+                    '    node.is_epsilon = ' + epsilon,
+                    '    node.line = line',
+                    '    t[ 0 ] = node' ] + _intern_source( interned )
+    return '\n'.join( code ) + '\n'
+
+############################################################
+# Which set of generated actions a parse in "context" uses: None for
+# the plain ones (which hand anything out of the ordinary to Node()),
+# or the name of the mode whose variants it gets.
+############################################################
+def _action_mode( context ):
+    if ( context.spans or context.hashes ):
+        return None
+    if ( context.ast ):
+        return 'ast+flyweights' if context.flyweights else 'ast'
+    if ( context.flyweights ):
+        return 'flyweights'
+    return None
+
+_mode_sources = { 'flyweights' : _flyweight_action_source,
+                  'ast' : lambda *spec: _ast_action_source( *spec, flyweights = False ),
+                  'ast+flyweights' : lambda *spec: _ast_action_source( *spec, flyweights = True ) }
+
+# Mode -> name of a generated action -> its variant for that mode.
+_mode_actions = {}
+
+############################################################
+# A copy of the parser "built" whose generated actions are the
+# variants for "mode". The variants are made the first time anybody
+# parses in that mode, so nobody pays to compile ones they never
+# use. Run with _build_lock held.
+############################################################
+def _mode_parser( built, mode ):
+    actions = _mode_actions.setdefault( mode, {} )
+    wanted = [ ( name, spec ) for name, spec in _action_specs.items() if name not in actions ]
+    if ( len( wanted ) > 0 ):
+        space = { 'Node' : Node, '_state' : _state, '_new_node' : object.__new__, '_shared_terminal' : shared_terminal }
+        source = ''.join( [ _mode_sources[ mode ]( name, *spec ) for name, spec in wanted ] )
+        exec( compile( source, '<generated ' + mode + ' actions>', 'exec' ), space )
+        for name, spec in wanted:
+            actions[ name ] = space[ name ]
+    moded = copy.copy( built )
+    productions = []
+    for p in built.productions:
+        if ( p.callable != None and p.callable.__name__ in actions ):
+            p = copy.copy( p )
+            p.callable = actions[ p.callable.__name__ ]
+        productions.append( p )
+    moded.productions = productions
+    return moded
+
+############################################################
+# Put the generated actions into a freshly built parser.
+############################################################
+def _install_generated_actions( built ):
+    nonterminals = set( [ p.name for p in built.productions ] )
+    wanted = []
+    for p in built.productions:
+        if ( p.callable == None or p.str in _generated_actions ):
+            continue
+        plain = _plain_nodetype( p.callable )
+        if ( plain == None ):
+            continue
+        nodetype, interned = plain
+        rhs = p.str.split( '->' )[ 1 ].split()
+        if ( rhs == [ '<empty>' ] ):
+            rhs = []
+        name = '_generated_' + str( len( _generated_actions ) + len( wanted ) )
+        terminal = [ x not in nonterminals for x in rhs ]
+        wanted.append( ( p.str, name, ( nodetype, rhs, terminal, interned ) ) )
+    if ( len( wanted ) > 0 ):
+        space = { 'Node' : Node, '_state' : _state, '_new_node' : object.__new__ }
+        source = ''.join( [ _action_source( name, *spec ) for rule, name, spec in wanted ] )
+        exec( compile( source, '<generated actions>', 'exec' ), space )
+        for rule, name, spec in wanted:
+            _action_specs[ name ] = spec
+            _generated_actions[ rule ] = space[ name ]
+    productions = []
+    for p in built.productions:
+        action = _generated_actions.get( p.str )
+        if ( action != None and p.callable != None ):
+            p = copy.copy( p )
+            p.callable = action
+        productions.append( p )
+    built.productions = productions
+
+# ============================================================
+#
+# The lexer and the parsers are built once and then cached here.
+# Building them is far more expensive than parsing one instruction
+# (PLY has to collect and check every p_* function and read back the
+# tables). The parsers are keyed by their start symbol; "Instruction"
+# is the main one, the others are for parsing fragments (see below).
+#
+# PLY's lexer and parser objects keep the state of the parse in
+# progress, so they can't be shared between threads. Each thread
+# gets its own (cheap, shallow) copy of the ones built here; the
+# tables themselves are shared.
 #
 # Since we will be combining this with the instruction parser it is
 # important to give these distinct names and distinct parser table
@@ -3735,13 +4944,1103 @@ if ( False ):
 #
 # ============================================================
 
-def inst_parse( inputstring, lex_debug = False, yacc_debug = True ):
+_lexer = None
+_parsers = {}
+_build_lock = threading.Lock()
+
+def _get_lexer( lex_debug = False, log = None, block_mode = False ):
+    global _lexer
+    if ( _state.lexer == None ):
+        with _build_lock:
+            if ( _lexer == None ):
+                _lexer = lex.lex( debug = lex_debug, debuglog = log )
+        _state.lexer = _lexer.clone()
+    # Each parse starts over at line 1, like a brand new lexer would.
+    _state.lexer.lineno = 1
+    _state.lexer.block_mode = block_mode
+    _state.lexer.segment = 0
+    _state.lexer.failed = set()
+    _state.lexer.block_lines = 0
+    return _state.lexer
+
+############################################################
+# Block and BlockLine are only for block_parse, which has its own
+# tables (like the fragment parsers do), so from Instruction they
+# can't be reached. That's on purpose, and PLY needn't say so every
+# time it builds the tables. Everything else it has to say, it says.
+############################################################
+_block_symbols = frozenset( [ 'Block', 'BlockLine' ] )
+
+class _GrammarLog( yacc.PlyLogger ):
+
+    def warning( self, msg, *args, **kwargs ):
+        if ( msg == 'Symbol %r is unreachable' and args[ 0 ] in _block_symbols ):
+            return
+        yacc.PlyLogger.warning( self, msg, *args, **kwargs )
+
+def _get_parser( symbol, yacc_debug = False, mode = None ):
+    # (Careful - PLY looks through our local variables for things
+    # like "start", so don't name anything in here that way.)
+    parser = _state.parsers.get( ( symbol, mode ) )
+    if ( parser == None ):
+        with _build_lock:
+            built = _parsers.get( symbol )
+            if ( built == None ):
+                if ( symbol == 'Instruction' ):
+                    built = yacc.yacc( tabmodule = 'inst_parsertable', debug = yacc_debug, debugfile = 'inst_parser.out',
+                                       errorlog = _GrammarLog( sys.stderr ) )
+                else:
+                    # Starting anywhere else leaves most of the grammar
+                    # unreachable, and PLY has a lot to say about that.
+                    built = yacc.yacc( start = symbol, tabmodule = 'inst_' + symbol.lower() + '_parsertable',
+                                       debug = False, errorlog = yacc.NullLogger() )
+                _install_generated_actions( built )
+                _parsers[ symbol ] = built
+            if ( mode != None ):
+                moded = _parsers.get( ( symbol, mode ) )
+                if ( moded == None ):
+                    moded = _mode_parser( built, mode )
+                    _parsers[ ( symbol, mode ) ] = moded
+                built = moded
+        parser = copy.copy( built )
+        _state.parsers[ ( symbol, mode ) ] = parser
+    return parser
+
+############################################################
+# Everything comes through here: parse "inputstring" starting from
+# "symbol", with "context" in use for the duration.
+############################################################
+def _parse( symbol, inputstring, context, debug, block_mode = False, lex_debug = False, yacc_debug = False ):
+    if ( context == None ):
+        context = ParseContext()
+    with using_context( context ):
+        # Spans and the profiler need a real parse.
+        cache = context.cache
+        if ( symbol != 'Instruction' or context.spans or context.profiler != None ):
+            cache = None
+        if ( cache != None ):
+            metrics = _metrics
+            if ( metrics != None ):
+                before = metrics.start( context )
+            tree = cache.get( inputstring, context )
+            if ( metrics != None ):
+                metrics.cache_result( tree != None )
+            if ( tree != None ):
+                if ( context.weak_parents ):
+                    weaken_parents( tree )
+                if ( metrics != None ):
+                    metrics.record( symbol, inputstring, tree, context, before, 0 )
+                return tree
+        i_lexer = _get_lexer( lex_debug, debug or None, block_mode )
+        i_parser = _get_parser( symbol, yacc_debug, _action_mode( context ) )
+        if ( block_mode ):
+            i_lexer.lineno = 0
+        profiler = context.profiler
+        if ( profiler != None ):
+            i_parser = profiler.instrument( i_parser )
+            i_lexer.token = profiler.counting_tokens( i_parser, i_lexer.token )
+        metrics = _metrics
+        if ( metrics != None ):
+            tokens = [ 0 ]
+            i_lexer.token = metrics.counting_tokens( i_lexer.token, tokens )
+            before = metrics.start( context )
+        _state.parser = i_parser
+        errors = context.number_of_errors
+        try:
+            tree = i_parser.parse( inputstring, lexer = i_lexer, debug = debug )
+        finally:
+            _state.parser = None
+            # PLY leaves its stacks on the parser, and the last of
+            # them holds the tree, which would keep it (weak parents
+            # and all) alive until the next parse.
+            i_parser.symstack = None
+            i_parser.statestack = None
+            if ( profiler != None or metrics != None ):
+                del i_lexer.token
+        if ( block_mode ):
+            tree = _block_lines( tree, i_lexer )
+        elif ( len( i_lexer.failed ) > 0 or context.number_of_errors != errors ):
+            # The lexer threw something away, or PLY got over a syntax
+            # error by dropping tokens; whatever parsed isn't what was
+            # written.
+            tree = None
+        if ( profiler != None ):
+            profiler.collect( i_parser, tree )
+        if ( cache != None and tree != None ):
+            cache.put( inputstring, tree, context )
+        if ( context.weak_parents ):
+            weaken_parents( tree )
+        if ( metrics != None ):
+            metrics.record( symbol, inputstring, tree, context, before, tokens[ 0 ] )
+        return tree
+
+############################################################
+# The trees for a block, from the ( line, tree ) pairs the Block
+# production collected: None for every line the lexer had trouble
+# with (even one it threw all of away), and nothing for blank ones.
+############################################################
+def _block_lines( pairs, lexer ):
+    if ( pairs == None ):
+        return None
+    failed = lexer.failed
+    if ( len( failed ) == 0 ):
+        return [ tree for index, tree in pairs ]
+    trees = dict( pairs )
+    found = []
+    for index in range( 0, max( lexer.block_lines, max( failed ) + 1 ) ):
+        if ( index in failed ):
+            found.append( None )
+        elif ( index in trees ):
+            found.append( trees[ index ] )
+    return found
+
+# ============================================================
+#
+# And here's the main function to do the work.
+#
+# DEBUG logging gives you huge parselog.txt files.
+# ERROR logging just gives syntax error information.
+#
+# ============================================================
+
+def inst_parse( inputstring, lex_debug = False, yacc_debug = True, context = None ):
     logging.basicConfig( level = logging.DEBUG,
                          filename = "parselog.txt", filemode = "w",
                          format = "%(filename)10s:%(lineno)4d:%(message)s" )
     log = logging.getLogger()
 
-    i_lexer = lex.lex( debug = lex_debug, debuglog = log )
-    i_parser = yacc.yacc( tabmodule = 'inst_parsertable', debug = yacc_debug, debugfile = 'inst_parser.out' )
-    parsetree = i_parser.parse( inputstring, lexer = i_lexer, debug = log )
-    return parsetree
+    return _parse( 'Instruction', inputstring, context, log,
+                   lex_debug = lex_debug, yacc_debug = yacc_debug )
+
+# ============================================================
+#
+# Fragment entry points. Sometimes what we have is not an
+# instruction at all but a type (from a global declaration, say), a
+# constant initializer or a piece of metadata. Rather than wrapping
+# these in a fake instruction, parse them straight from the right
+# start symbol. Each of these gets its own parser (and table file),
+# built the first time it is used and cached like the main one.
+#
+#    parse_type( '[128 x i8]' )
+#    parse_constant( 'getelementptr inbounds ([19 x i8], ...)' )
+#    parse_metadata( '!DILocation(line: 7, column: 3, scope: !12)' )
+#
+# ============================================================
+
+def fragment_parse( symbol, inputstring, yacc_debug = False, context = None ):
+    if ( yacc_debug ):
+        debug = logging.getLogger()
+    else:
+        debug = False
+    return _parse( symbol, inputstring, context, debug )
+
+def parse_type( inputstring, yacc_debug = False, context = None ):
+    return fragment_parse( 'Type', inputstring, yacc_debug, context )
+
+def parse_constant( inputstring, yacc_debug = False, context = None ):
+    return fragment_parse( 'Constant', inputstring, yacc_debug, context )
+
+def parse_value( inputstring, yacc_debug = False, context = None ):
+    return fragment_parse( 'Value', inputstring, yacc_debug, context )
+
+def parse_metadata( inputstring, yacc_debug = False, context = None ):
+    return fragment_parse( 'Metadata', inputstring, yacc_debug, context )
+
+def parse_specialized_md_node( inputstring, yacc_debug = False, context = None ):
+    return fragment_parse( 'SpecializedMDNode', inputstring, yacc_debug, context )
+
+# ============================================================
+#
+# Parse a whole basic block (or any newline separated run of
+# instructions) in one call. Returns a list with one entry per
+# non-blank line: the tree, or None if that line did not parse.
+# Comment-only lines count as blank.
+#
+# This is for convenience, not speed. The setup for a parse (the
+# context, the lexer, the tables) is a few microseconds, next to the
+# couple of hundred that the tokens and reductions of a line take,
+# and the Block and BlockLine reductions cost about what is saved;
+# "python llvm_benchmark.py block" has it within a few percent of a
+# parse per line.
+#
+# The input is wrapped in newlines so that every line, even the
+# first, starts after a newline. That way PLY always has somewhere
+# to put the "error" token and a bad first or last line is isolated
+# just like any other. (That first newline is why the line count
+# starts at 0.)
+#
+# With resync_lines (the default here) every bad line gets its own
+# ParseError and an illegal character throws away the rest of its
+# line, so a bulk run over a dirty file keeps going at line speed.
+# Without it, you get PLY's usual error reporting.
+#
+# With a line_filter in the context, only the lines it keeps are
+# parsed and the list has entries for just those (see LineFilter).
+#
+# ============================================================
+
+def block_parse( inputstring, yacc_debug = False, context = None ):
+    if ( yacc_debug ):
+        debug = logging.getLogger()
+    else:
+        debug = False
+    if ( context == None ):
+        context = ParseContext( resync_lines = True )
+    if ( context.line_filter != None ):
+        inputstring = context.line_filter.blank_out( inputstring, context.spans )
+    return _block_parse( inputstring, context, debug )
+
+def _block_parse( inputstring, context, debug ):
+    # (Spans don't count that first newline.)
+    context.span_base = context.span_base - 1
+    try:
+        trees = _parse( 'Block', '\n' + inputstring + '\n', context, debug, block_mode = True )
+    finally:
+        context.span_base = context.span_base + 1
+    lines = _nonblank_lines( inputstring )
+    if ( trees != None and len( trees ) == len( lines ) ):
+        return trees
+    # The parser lost track of where the lines are (PLY's own error
+    # recovery, without resync_lines, can take a line with it). A
+    # tree paired with the wrong line is worse than slow, so go a
+    # line at a time. The bad lines get reported twice.
+    base = context.span_base
+    trees = []
+    try:
+        for start, line in lines:
+            context.span_base = base + start
+            trees.append( _parse( 'Instruction', line, context, debug ) )
+    finally:
+        context.span_base = base
+    return trees
+
+############################################################
+# ( where it starts, line ) for the lines of "text" that aren't blank.
+############################################################
+def _nonblank_lines( text ):
+    found = []
+    start = 0
+    for line in text.split( '\n' ):
+        if ( not _blank_line( line ) ):
+            found.append( ( start, line ) )
+        start = start + len( line ) + 1
+    return found
+
+# ============================================================
+#
+# Thread pool mode: parse a lot of instructions at once, one thread
+# per core, and hand back the trees in the same order. Each parse
+# gets its own context. With the GIL this is no faster than a plain
+# loop (so by default that is what we do); it pays off on the free
+# threaded builds of CPython, where we use every core by default.
+# A line_filter drops lines before any of them are parsed; those
+# (and blank lines) are None in what comes back, so the trees still
+# line up with "lines".
+#
+# ============================================================
+
+def free_threaded():
+    return hasattr( sys, '_is_gil_enabled' ) and not sys._is_gil_enabled()
+
+def parse_many( lines, threads = None, parse = None, line_filter = None ):
+    if ( line_filter != None ):
+        lines = list( lines )
+        kept = line_filter.select( lines )
+        trees = parse_many( [ line for i, line in kept ], threads, parse )
+        found = [ None ] * len( lines )
+        for ( i, line ), tree in zip( kept, trees ):
+            found[ i ] = tree
+        return found
+    if ( parse == None ):
+        parse = lambda line: _parse( 'Instruction', line, None, False )
+    if ( threads == None ):
+        threads = ( os.cpu_count() or 1 ) if free_threaded() else 1
+    if ( threads <= 1 ):
+        return [ parse( line ) for line in lines ]
+    with concurrent.futures.ThreadPoolExecutor( max_workers = threads ) as pool:
+        return list( pool.map( parse, lines, chunksize = 64 ) )
+
+# ============================================================
+#
+# Just the tokens. For things like opcode histograms, which
+# intrinsics get called or which metadata kinds show up, there is no
+# need to parse at all. These give back ( type, value, offset ) for
+# every token, where offset is from the start of the line:
+#
+#    for kind, value, offset in parser.tokenize( line ):
+#        ...
+#
+# tokenize_lines() does the same for a lot of lines (or a file),
+# giving ( line number, type, value, offset ), counting lines from 0.
+# A bad character goes to the context's error sink like it would
+# for a parse, and is skipped (the rest of its line is, with
+# resync_lines). Comments are not tokens.
+#
+# tokenize_batch() does a whole batch of lines in one go and gives
+# back a TokenBatch, with the token types as small integer codes in
+# an array (see token_types), for counting and the like:
+#
+#    batch = parser.tokenize_batch( lines )
+#    counts = batch.type_counts()
+#
+# These don't go through PLY's lexer. Most of its time goes into the
+# master regular expression, where every character of a name goes
+# through half a dozen capturing groups. So here the master
+# expression is built from the very same t_* rules, in the very same
+# order (PLY tries them in the order they are defined, and the first
+# one that matches wins), with the groups made non-capturing, and
+# the same keyword lookups in reserved after. The tokens come out
+# the same as the parser sees them; a "$name" or a label that isn't
+# a keyword is an error, just as in _illegal_token.
+#
+# ============================================================
+
+# Every token type, keywords and literals included. A type's code is
+# where it is in here.
+token_types = list( tokens ) + list( literals )
+token_codes = { kind: code for code, kind in enumerate( token_types ) }
+
+############################################################
+# A t_* regular expression with its groups made non-capturing. Not
+# in a character class, and not an escaped paren, and not a group
+# that is already special ("(?...").
+############################################################
+def _without_groups( pattern ):
+    out = []
+    in_class = False
+    i = 0
+    while ( i < len( pattern ) ):
+        c = pattern[ i ]
+        if ( c == '\\' ):
+            out.append( pattern[ i:i + 2 ] )
+            i = i + 2
+            continue
+        if ( in_class ):
+            if ( c == ']' ):
+                in_class = False
+        elif ( c == '[' ):
+            in_class = True
+            # A ']' first thing in a class is just a ']'.
+            if ( pattern[ i + 1:i + 2 ] == '^' ):
+                out.append( c )
+                i = i + 1
+                c = '^'
+            if ( pattern[ i + 1:i + 2 ] == ']' ):
+                out.append( c )
+                i = i + 1
+                c = ']'
+        elif ( c == '(' and pattern[ i + 1:i + 2 ] != '?' ):
+            c = '(?:'
+        out.append( c )
+        i = i + 1
+    return ''.join( out )
+
+############################################################
+# The master expression, put together the way PLY's lex does it:
+# the t_* functions in the order they are defined (by line number),
+# then the t_* strings, longest first, each a group named for its
+# token. After those come the literals, which PLY tries only when no
+# rule matches, and then anything else, which is an error. t_ignore
+# goes in front.
+############################################################
+def _master_pattern():
+    functions = []
+    strings = []
+    for name, rule in globals().items():
+        if ( not name.startswith( 't_' ) or name in [ 't_ignore', 't_error' ] ):
+            continue
+        if ( callable( rule ) ):
+            functions.append( ( rule.__code__.co_firstlineno, name, getattr( rule, 'regex', rule.__doc__ ) ) )
+        elif ( isinstance( rule, str ) ):
+            strings.append( ( -len( rule ), name, rule ) )
+    rules = sorted( functions ) + sorted( strings )
+    groups = [ '(?P<' + name[ 2: ] + '>' + _without_groups( regex ) + ')' for key, name, regex in rules ]
+    groups.append( '(?P<literal>[' + re.escape( ''.join( literals ) ) + '])' )
+    groups.append( '(?P<illegal>[^' + re.escape( t_ignore ) + '])' )
+    return '[' + re.escape( t_ignore ) + ']*(?:' + '|'.join( groups ) + ')'
+
+# (With lex's own flags.)
+_scan_re = re.compile( _master_pattern(), re.VERBOSE )
+
+# What a leading character makes of a decimals or quoted_string.
+_prefixed = { '@' : 'global_ident', '%' : 'local_ident', '#' : 'attr_group_id', '!' : 'metadata_id' }
+
+############################################################
+# The tokens in "text" as ( type, value, position ), newlines
+# included as tokens if "newlines". Like the t_* functions, errors
+# go to the context in use. (After the rules come the literals,
+# which PLY tries only when no rule matches, and then anything else,
+# which is an error. So every match starts right where the last one
+# ended, give or take some blanks.)
+############################################################
+def _scan( text, newlines ):
+    found = []
+    append = found.append
+    pos = 0
+    while ( pos >= 0 ):
+        pos = _scan_from( text, pos, newlines, append )
+    return found
+
+# Returns where to go on from after a bad token with resync_lines (the
+# next newline, same as _illegal_token does), or -1 at the end. A
+# quoted string can't be left to run on past that newline.
+def _scan_from( text, pos, newlines, append ):
+    resync = _state.context.resync_lines and newlines
+    for m in _scan_re.finditer( text, pos ):
+        kind = m.lastgroup
+        value = m.group( kind )
+        if ( kind == 'name' ):
+            first = value[ 0 ]
+            if ( first == '%' ):
+                kind = 'local_ident'
+            elif ( first == '@' ):
+                kind = 'global_ident'
+            elif ( first == '$' ):
+                kind = 'comdat_name'
+            else:
+                kind = reserved.get( value, 'name' )
+        elif ( kind == 'literal' ):
+            kind = value
+        elif ( kind == 'decimals' or kind == 'quoted_string' ):
+            first = value[ 0 ]
+            if ( first == '$' ):
+                kind = 'comdat_name'
+            elif ( first in _prefixed ):
+                kind = _prefixed[ first ]
+        elif ( kind == 'label_ident' or kind == 'metadata_name' ):
+            kind = reserved.get( value, kind )
+        elif ( kind == 'comment' ):
+            continue
+        elif ( kind == 'newline' ):
+            if ( newlines ):
+                append( ( kind, value, m.start( 'newline' ) ) )
+            continue
+        elif ( kind == 'illegal' ):
+            _scan_error( text, m.start( kind ) )
+            if ( resync ):
+                return _resync_at( text, m.start( kind ) )
+            continue
+        if ( kind not in token_codes ):
+            # A label or a "$name", see _illegal_token.
+            _scan_error( text, m.start( m.lastgroup ), kind, value )
+            if ( resync ):
+                return _resync_at( text, m.end( m.lastgroup ) )
+            continue
+        append( ( kind, value, m.start( m.lastgroup ) ) )
+    return -1
+
+def _resync_at( text, pos ):
+    end = text.find( '\n', pos )
+    if ( end < 0 ):
+        return -1
+    return end
+
+def _scan_error( text, pos, kind = None, value = None ):
+    line = text.count( '\n', 0, pos ) + 1
+    if ( kind == None ):
+        _report( ParseError( 'illegal character', "Illegal character '%s'" % text[ pos ],
+                             token_type = 'illegal', token_value = text[ pos ], position = pos,
+                             line = line, column = _column( text, pos ), source = _source_line( text, pos ) ) )
+    else:
+        _report( ParseError( 'illegal token', "Illegal token '%s'" % value,
+                             token_type = kind, token_value = value, position = pos,
+                             line = line, column = _column( text, pos ), source = _source_line( text, pos ) ) )
+
+############################################################
+# The tokens of "text" and how many errors there were, with the
+# errors going nowhere (for a look at a line that isn't a parse).
+############################################################
+def _scan_quietly( text ):
+    quiet = _state.quiet
+    with using_context( quiet ):
+        found = _scan( text, False )
+    errors = quiet.number_of_errors
+    if ( errors > 0 ):
+        quiet.errors = []
+        quiet.number_of_errors = 0
+    return ( found, errors )
+
+def tokenize( inputstring, context = None ):
+    if ( context == None ):
+        context = ParseContext()
+    with using_context( context ):
+        return _scan( inputstring, False )
+
+############################################################
+# Lines go through a bufferful at a time, with the newlines as
+# tokens to tell where one line ends. Blank lines still count.
+############################################################
+def tokenize_lines( lines, context = None, buffer_lines = 4096 ):
+    if ( context == None ):
+        context = ParseContext()
+    number = 0
+    chunk = []
+    for line in lines:
+        chunk.append( line.rstrip( '\n' ) )
+        if ( len( chunk ) >= buffer_lines ):
+            yield from _tokenize_chunk( chunk, number, context )
+            number = number + len( chunk )
+            chunk = []
+    if ( len( chunk ) > 0 ):
+        yield from _tokenize_chunk( chunk, number, context )
+
+def _tokenize_chunk( chunk, number, context ):
+    # (The context is only in use while scanning, not between yields.)
+    with using_context( context ):
+        found = _scan( '\n'.join( chunk ), True )
+    line_start = 0
+    for kind, value, pos in found:
+        if ( kind == 'newline' ):
+            number = number + len( value )
+            line_start = pos + len( value )
+        else:
+            yield ( number, kind, value, pos - line_start )
+
+############################################################
+# A batch of lines' tokens, side by side: types (codes, see
+# token_types), values and offsets, one entry per token, and
+# starts, where each line's tokens begin (and one more for the end).
+############################################################
+class TokenBatch:
+
+    def __init__( self ):
+        self.types = array.array( 'H' )
+        self.values = []
+        self.offsets = array.array( 'I' )
+        self.starts = array.array( 'I', [ 0 ] )
+
+    def __len__( self ):
+        return len( self.starts ) - 1
+
+    def line( self, i ):
+        codes = self.types
+        return [ ( token_types[ codes[ x ] ], self.values[ x ], self.offsets[ x ] )
+                 for x in range( self.starts[ i ], self.starts[ i + 1 ] ) ]
+
+    def type_counts( self ):
+        counts = collections.Counter( self.types )
+        return { token_types[ code ]: n for code, n in counts.items() }
+
+def tokenize_batch( lines, context = None ):
+    if ( context == None ):
+        context = ParseContext()
+    lines = list( lines )
+    batch = TokenBatch()
+    codes = token_codes
+    types = batch.types
+    values = batch.values
+    offsets = batch.offsets
+    starts = batch.starts
+    line = 0
+    for number, kind, value, offset in tokenize_lines( lines, context ):
+        while ( line < number ):
+            starts.append( len( values ) )
+            line = line + 1
+        types.append( codes[ kind ] )
+        values.append( value )
+        offsets.append( offset )
+    # (Including any blank lines at the end.)
+    while ( len( starts ) <= len( lines ) ):
+        starts.append( len( values ) )
+    return batch
+
+# ============================================================
+#
+# Predicate pushdown. Often only a few kinds of instruction are
+# wanted out of a huge module (the calls, say, or the stores), and
+# parsing everything else just to throw it away is most of the time.
+# A LineFilter is a cheap check on each line, done before any
+# parsing; lines that fail it are dropped and never parsed.
+#
+#    kinds      instruction kinds ("CallInst") or opcodes ("call"),
+#               from the opcode (guess_instruction_kind)
+#    pattern    a regular expression (text or compiled) that has to
+#               be found somewhere in the line
+#    mentions   token text that has to be in the line as a whole
+#               token: "@fprintf" is in "call ... @fprintf(" but
+#               not in "@fprintf_unlocked"
+#    tokens     a function given the line's tokens (see tokenize)
+#               that says whether to keep it
+#
+# A line has to pass all the ones that are given, cheapest first;
+# only mentions and tokens need the lexer, and mentions looks for
+# the plain text before bothering. When every mention is an "@name"
+# or "%name", and the line has no strings or comments in it (where
+# the text could be without being a token), a look at the character
+# after the text settles it and the lexer isn't needed at all.
+#
+# Put it in the context for block_parse and parse_stream, or give it
+# to parse_many:
+#
+#    calls = parser.LineFilter( kinds = [ 'CallInst' ], mentions = '@fprintf' )
+#    context = parser.ParseContext( resync_lines = True, line_filter = calls )
+#    for number, line, tree in parser.parse_stream( open( 'module.ll' ), context ):
+#        ...
+#    print( calls.parsed, 'parsed', calls.skipped, 'skipped' )
+#
+# Blank and comment lines are neither. With metrics on, the skipped
+# lines are counted there too (lines_skipped).
+#
+# ============================================================
+
+class LineFilter:
+
+    def __init__( self, kinds = None, pattern = None, mentions = None, tokens = None ):
+        self.kinds = None
+        if ( kinds != None ):
+            self.kinds = frozenset( [ _opcode_kinds.get( kind, kind ) for kind in kinds ] )
+        if ( isinstance( pattern, str ) ):
+            pattern = re.compile( pattern )
+        self.pattern = pattern
+        if ( isinstance( mentions, str ) ):
+            mentions = [ mentions ]
+        self.mentions = None if mentions == None else frozenset( mentions )
+        # See keep().
+        self.whole = None
+        if ( self.mentions != None and all( [ _mention_re.match( x ) for x in self.mentions ] ) ):
+            self.whole = re.compile( '(?:' + '|'.join( [ re.escape( x ) for x in sorted( self.mentions ) ] ) +
+                                     ')(?![-a-zA-Z$._0-9])' )
+        self.tokens = tokens
+        self.lock = threading.Lock()
+        self.parsed = 0
+        self.skipped = 0
+
+    ############################################################
+    # Does "line" (not blank) get parsed?
+    ############################################################
+    def keep( self, line ):
+        if ( self.kinds != None and guess_instruction_kind( line ) not in self.kinds ):
+            return False
+        if ( self.pattern != None and self.pattern.search( line ) == None ):
+            return False
+        if ( self.mentions != None and not any( [ text in line for text in self.mentions ] ) ):
+            return False
+        if ( self.mentions == None and self.tokens == None ):
+            return True
+        if ( self.whole != None and '"' not in line and ';' not in line ):
+            if ( self.whole.search( line ) == None ):
+                return False
+            if ( self.tokens == None ):
+                return True
+            mentioned = True
+        else:
+            mentioned = self.mentions == None
+        found, errors = _scan_quietly( line )
+        if ( not mentioned and not any( [ value in self.mentions for kind, value, pos in found ] ) ):
+            return False
+        if ( self.tokens != None and not self.tokens( found ) ):
+            return False
+        return True
+
+    ############################################################
+    # The lines to parse, as ( where it was in "lines", line ).
+    ############################################################
+    def select( self, lines ):
+        kept = []
+        skipped = 0
+        for i, line in enumerate( lines ):
+            if ( _blank_line( line ) ):
+                continue
+            if ( self.keep( line ) ):
+                kept.append( ( i, line ) )
+            else:
+                skipped = skipped + 1
+        self.__count( len( kept ), skipped )
+        return kept
+
+    ############################################################
+    # "text" with the lines that don't get parsed made blank, so the
+    # line numbers in errors stay right (and with "spaces", where
+    # everything is, for spans).
+    ############################################################
+    def blank_out( self, text, spaces = False ):
+        lines = text.split( '\n' )
+        parsed = 0
+        skipped = 0
+        for i, line in enumerate( lines ):
+            if ( _blank_line( line ) ):
+                continue
+            if ( self.keep( line ) ):
+                parsed = parsed + 1
+            else:
+                skipped = skipped + 1
+                lines[ i ] = ' ' * len( line ) if spaces else ''
+        self.__count( parsed, skipped )
+        if ( skipped == 0 ):
+            return text
+        return '\n'.join( lines )
+
+    def __count( self, parsed, skipped ):
+        with self.lock:
+            self.parsed = self.parsed + parsed
+            self.skipped = self.skipped + skipped
+        metrics = _metrics
+        if ( metrics != None and skipped > 0 ):
+            metrics.lines_filtered( skipped )
+
+    def counts( self ):
+        with self.lock:
+            return { 'parsed' : self.parsed, 'skipped' : self.skipped }
+
+    def reset( self ):
+        with self.lock:
+            self.parsed = 0
+            self.skipped = 0
+
+# A mention that is a whole "@name" or "%name" token however the line
+# goes on, as long as the next character can't be part of it.
+_mention_re = re.compile( r'[@%][-a-zA-Z$._][-a-zA-Z$._0-9]*$' )
+
+def _blank_line( line ):
+    line = line.strip()
+    return line == '' or line[ 0 ] == ';'
+
+############################################################
+# Parse lines as they come (from a file, say), a bufferful at a time
+# through block_parse, giving ( line number, line, tree ) for each
+# line that isn't blank, counting lines from 0. Nothing is kept once
+# it has been handed out. The context's line_filter, if any, is used.
+# With spans they count from the start of the line that is handed
+# out (plus span_base), so node.text( line ) works.
+############################################################
+def parse_stream( lines, context = None, buffer_lines = 4096 ):
+    if ( context == None ):
+        context = ParseContext( resync_lines = True )
+    number = 0
+    chunk = []
+    for line in lines:
+        chunk.append( line.rstrip( '\n' ) )
+        if ( len( chunk ) >= buffer_lines ):
+            yield from _parse_chunk( chunk, number, context )
+            number = number + len( chunk )
+            chunk = []
+    if ( len( chunk ) > 0 ):
+        yield from _parse_chunk( chunk, number, context )
+
+def _parse_chunk( chunk, number, context ):
+    if ( context.line_filter != None ):
+        kept = context.line_filter.select( chunk )
+    else:
+        kept = [ ( i, line ) for i, line in enumerate( chunk ) if not _blank_line( line ) ]
+    if ( len( kept ) == 0 ):
+        return
+    trees = _block_parse( '\n'.join( [ line for i, line in kept ] ), context, False )
+    start = 0
+    for ( i, line ), tree in zip( kept, trees ):
+        if ( context.spans and tree != None and start > 0 ):
+            _shift_spans( tree, start )
+        start = start + len( line ) + 1
+        yield ( number + i, line, tree )
+
+############################################################
+# Spans that counted from the start of a bufferful, made to count
+# from "start" in it. A shared node is in other trees too, so it and
+# everything under it are left alone.
+############################################################
+def _shift_spans( tree, start ):
+    work = [ tree ]
+    while ( len( work ) > 0 ):
+        node = work.pop()
+        if ( isinstance( node, ( SharedType, SharedNode ) ) ):
+            continue
+        if ( node.span != None ):
+            node.span = ( node.span[ 0 ] - start, node.span[ 1 ] - start )
+        work.extend( node.children )
+
+# ============================================================
+#
+# Lazy mode. Most instructions end with things like ", !tbaa !2",
+# "!dbg !N", "#13" or long lists of function attributes, and most
+# analyses never look at any of it. Here we cut those trailing pieces
+# off the text before parsing, and put LazyNode's in the tree where
+# they would have been. They parse themselves the first time their
+# children are asked for, so the tree looks exactly the same to
+# anyone who does look (tree_as_string and all).
+#
+# The pieces we defer are OptCommaSepMetadataAttachmentList on every
+# instruction, and FuncAttrs and OperandBundles on a call.
+#
+# Deferring the parse mustn't mean deferring the answer: a line that
+# inst_parse would turn down gets turned down here too. Each piece is
+# run through the LR tables for its nodetype without building
+# anything (see _recognizes), and if one won't go we parse the whole
+# line the normal way, errors and all.
+#
+# ============================================================
+
+# Things that matter for finding the trailing pieces: strings (which
+# can hold anything), brackets of all kinds, and the comma in front
+# of the first metadata attachment.
+_trailer_re = re.compile( r'"[^"]*"|[(\[{<]|[)\]}>]|,[ \t]*![-a-zA-Z$._\\]' )
+
+_call_re = re.compile( r'^\s*(%\S+\s*=\s*)?((tail|musttail|notail)\s+)?call\s' )
+
+############################################################
+# Returns ( head, attrs, bundles, metadata ) where head is what is
+# left to parse now. The others are None if there is nothing there.
+############################################################
+def _split_trailers( inputstring ):
+    depth = 0
+    last_close = None
+    metadata_at = len( inputstring )
+    for m in _trailer_re.finditer( inputstring ):
+        c = m.group()[ 0 ]
+        if ( c in '([{<' ):
+            depth = depth + 1
+        elif ( c in ')]}>' ):
+            depth = depth - 1
+            if ( depth == 0 and c == ')' ):
+                last_close = m.end()
+        elif ( c == ',' and depth == 0 ):
+            metadata_at = m.start()
+            break
+    metadata = inputstring[ metadata_at: ].strip()
+    head = inputstring[ :metadata_at ]
+    attrs = None
+    bundles = None
+    if ( last_close != None and _call_re.match( head ) ):
+        tail = head[ last_close: ]
+        head = head[ :last_close ]
+        bracket = tail.find( '[' )
+        if ( bracket >= 0 ):
+            bundles = tail[ bracket: ].strip()
+            tail = tail[ :bracket ]
+        attrs = tail.strip()
+    return ( head, attrs or None, bundles or None, metadata or None )
+
+def lazy_inst_parse( inputstring, lex_debug = False, yacc_debug = False, context = None ):
+    if ( context == None ):
+        context = ParseContext()
+    # AST mode drops the empty nodes the lazy ones would replace, we
+    # don't know where in the input their text came from, and there
+    # is nothing to hash yet.
+    if ( context.ast or context.spans or context.hashes ):
+        return inst_parse( inputstring, lex_debug, yacc_debug, context )
+    head, attrs, bundles, metadata = _split_trailers( inputstring )
+    if ( attrs == None and bundles == None and metadata == None ):
+        return inst_parse( inputstring, lex_debug, yacc_debug, context )
+    if ( not ( ( attrs == None or _recognizes( 'FuncAttrs', attrs ) ) and
+               ( bundles == None or _recognizes( 'OperandBundles', bundles ) ) and
+               ( metadata == None or _recognizes( 'OptCommaSepMetadataAttachmentList', metadata ) ) ) ):
+        return inst_parse( inputstring, lex_debug, yacc_debug, context )
+    serial = context.serial
+    tree = inst_parse( head, lex_debug, yacc_debug, context )
+    if ( tree == None ):
+        # We cut in the wrong place, or it was never going to parse.
+        context.serial = serial
+        return inst_parse( inputstring, lex_debug, yacc_debug, context )
+    with using_context( context ):
+        _install_lazy_nodes( tree, attrs, bundles, metadata )
+    return tree
+
+def _install_lazy_nodes( tree, attrs, bundles, metadata ):
+    here = tree.children[ -1 ]
+    if ( here.nodetype == 'ValueInstruction' ):
+        here = here.children[ 0 ]
+    if ( metadata != None ):
+        _install_lazy_node( here, 'OptCommaSepMetadataAttachmentList', metadata )
+    if ( here.nodetype == 'CallInst' ):
+        if ( attrs != None ):
+            _install_lazy_node( here, 'FuncAttrs', attrs )
+        if ( bundles != None ):
+            _install_lazy_node( here, 'OperandBundles', bundles )
+
+############################################################
+# Swap the (empty) child "nodetype" of "here" for a lazy one. The
+# last one, since the metadata always comes at the end.
+############################################################
+def _install_lazy_node( here, nodetype, text ):
+    kids = here.children
+    for i in range( len( kids ) - 1, -1, -1 ):
+        if ( kids[ i ].nodetype == nodetype ):
+            kids[ i ] = LazyNode( nodetype, text )
+            _set_parent( kids[ i ], here, _state.context.weak_parents )
+            return
+
+############################################################
+# Would "text" parse as a "symbol"? The tokens go through the LR
+# tables with no actions run, so the answer is the parser's own, but
+# no nodes get made; building the tree is what costs.
+############################################################
+def _recognizes( symbol, text ):
+    found, errors = _scan_quietly( text )
+    if ( errors > 0 ):
+        return False
+    tables = _get_parser( symbol )
+    action = tables.action
+    goto = tables.goto
+    productions = tables.productions
+    kinds = [ kind for kind, value, pos in found ]
+    kinds.append( '$end' )
+    stack = [ 0 ]
+    at = 0
+    while ( True ):
+        move = action[ stack[ -1 ] ].get( kinds[ at ] )
+        if ( move == None ):
+            return False
+        if ( move > 0 ):
+            stack.append( move )
+            at = at + 1
+        elif ( move < 0 ):
+            rule = productions[ -move ]
+            if ( rule.len > 0 ):
+                del stack[ -rule.len: ]
+            stack.append( goto[ stack[ -1 ] ][ rule.name ] )
+        else:
+            return True
+
+# ============================================================
+#
+# Hooks for llvm_metrics. A Profiler comes in the context (profiler
+# = ...), but Metrics count every parse in every thread once they
+# are turned on, so the ones in use are kept here. With none (the
+# default) it costs one test per parse.
+#
+# ============================================================
+
+_metrics = None
+
+def set_metrics( metrics ):
+    global _metrics
+    _metrics = metrics
+
+def current_metrics():
+    return _metrics
+
+############################################################
+# The kind of instruction at the root of "tree". See the grammar
+# comment in instruction.py. This is the name guess_instruction_kind
+# gives, so the select node (which is called _SelectInst) comes out
+# as SelectInst.
+############################################################
+def _tree_kind( tree ):
+    here = tree.children[ -1 ]
+    if ( here.nodetype == 'ValueInstruction' ):
+        here = here.children[ 0 ]
+    return here.nodetype.lstrip( '_' )
+
+# ============================================================
+#
+# Bulk parsing and the garbage collector. Every child points at its
+# parent and every parent at its children, so each tree is a big
+# knot of reference cycles, and when we build millions of nodes
+# Python's cyclic collector keeps kicking in and walking the whole
+# (ever growing) heap looking for garbage that isn't there.
+#
+# bulk_parsing() turns the collector off for a batch (or, with a
+# "threshold", just makes it run a lot less often). With "freeze"
+# whatever is still alive at the end, the trees you kept, is
+# collected once and then moved out of the collector's sight for
+# good with gc.freeze():
+#
+#    with parser.bulk_parsing( freeze = True ):
+#        trees = parser.parse_many( lines )
+#
+# The collector is one for the whole process, so bulk_parsing keeps
+# count: with several threads in it at once (or one inside another)
+# the first one in says what happens to the collector (off, or its
+# threshold), the others just go along with that, and only when the
+# last of them is done does it go back the way it was. The collection
+# for "freeze" is run after that, with nobody waiting on our lock for
+# it.
+#
+# Going further, ParseContext( weak_parents = True ) gives trees
+# with no cycles at all: "parent" becomes a weak reference, so a
+# tree is freed by reference counting the moment it is dropped, and
+# the collector never has any garbage to find. That costs a weak
+# reference per parent, a little more time than it saves (see the
+# README), but with the collector off it is what lets the trees you
+# throw away as you go be freed at all. The catch is that a parent
+# only lives as long as somebody holds the root; keep just a subtree
+# and its "parent" turns into None.
+#
+# ============================================================
+
+_bulk_lock = threading.Lock()
+_bulk_depth = 0
+# How the collector was before the first one in.
+_bulk_saved = None
+
+@contextlib.contextmanager
+def bulk_parsing( freeze = False, threshold = None ):
+    global _bulk_depth, _bulk_saved
+    with _bulk_lock:
+        if ( _bulk_depth == 0 ):
+            _bulk_saved = ( gc.isenabled(), gc.get_threshold() )
+            if ( threshold == None ):
+                gc.disable()
+            else:
+                gc.set_threshold( threshold, *_bulk_saved[ 1 ][ 1: ] )
+        _bulk_depth = _bulk_depth + 1
+    try:
+        yield
+    finally:
+        with _bulk_lock:
+            _bulk_depth = _bulk_depth - 1
+            if ( _bulk_depth == 0 ):
+                gc.set_threshold( *_bulk_saved[ 1 ] )
+                if ( _bulk_saved[ 0 ] ):
+                    gc.enable()
+        if ( freeze ):
+            gc.collect()
+            gc.freeze()
+
+def _set_parent( child, parent, weak ):
+    if ( isinstance( child, ( SharedNode, SharedType ) ) ):
+        return
+    if ( weak ):
+        child.__dict__.pop( 'parent', None )
+        child._parent_ref = weakref.ref( parent )
+    else:
+        child.parent = parent
+
+############################################################
+# Turn every parent link under "tree" (a tree, or a list of them
+# from block_parse) into a weak one. Shared nodes (flyweights and
+# TypeTable types) are left alone, and so is everything under them:
+# they hang under many trees at once, have no parent, and are read
+# only.
+############################################################
+def weaken_parents( tree ):
+    if ( type( tree ) == list ):
+        work = [ x for x in tree if x != None ]
+    elif ( tree != None ):
+        work = [ tree ]
+    else:
+        return
+    while ( len( work ) > 0 ):
+        node = work.pop()
+        # Don't make a lazy node parse itself just to look.
+        if ( isinstance( node, LazyNode ) and node._source_text != None ):
+            continue
+        # (This is _set_parent, by hand, since it is run on every
+        # node. All the children can share the one reference.)
+        parent = weakref.ref( node )
+        for x in node.children:
+            # (A SharedNode or a SharedType.)
+            if ( x.serial == None or x.__class__ is SharedType ):
+                continue
+            kid = x.__dict__
+            kid.pop( 'parent', None )
+            kid[ '_parent_ref' ] = parent
+            if ( not x.was_terminal ):
+                work.append( x )
+
+############################################################
+# For rebuilding stored trees (llvm_parse_cache and llvm_tree_file
+# do): the node the parser would have made
+# for "nodetype" with children "kids" (terminals as strings), and
+# for an (empty). Make the children first, left to right, and the
+# serial numbers come out just like a parse.
+############################################################
+def make_node( nodetype, kids ):
+    node = Node( nodetype, [ None ] + kids )
+    types = _state.context.type_table
+    if ( types != None and nodetype in interned_types ):
+        node = types.intern( node )
+    return node
+
+def make_empty():
+    t = [ None ]
+    p_empty( t )
+    return t[ 0 ]
@@ -0,0 +1,209 @@
+# ============================================================
+#
+# JSON Lines (NDJSON) export of parsed instructions.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# For tools that aren't written in Python. One instruction per line
+# of output, each line a JSON object, written through a buffer as we
+# go so nothing is held onto but the current line.
+#
+#    with llvm_json_lines.JSONLinesWriter( 'module.ndjson' ) as out:
+#        for line in lines:
+#            out.write( parser.inst_parse( line ), line )
+#
+# There are two forms. The full form has the whole tree:
+#
+#    {"source":"%3 = load i32, i32* %2","tree":["Instruction",...]}
+#
+# where a nonterminal is a list of its nodetype and then its children,
+# a terminal is a string, and an epsilon is null. (So an AST mode tree
+# comes out without any nulls or punctuation.) The summary form has
+#
+#    {"source":...,"kind":"LoadInst","lhs":"%3",
+#     "types":["i32","i32*"],"operands":["%2"]}
+#
+# where kind is named the way guess_instruction_kind names it (so a
+# select is "SelectInst", whatever the node is called), and types and
+# operands are the outermost Type and Value parts of the instruction
+# in order, as text. A call's arguments are operands
+# (after the function being called), and the trailing metadata is
+# left out. A line that didn't parse has a null tree, or a null kind
+# and nothing else. "source" is only there if you pass it.
+#
+# Run "python llvm_json_lines.py [--summary] corpus.ll" to write a
+# file of instructions to stdout.
+#
+# ============================================================
+
+import json
+import sys
+
+import llvm_instruction_parser as parser
+
+# The C encoder does all the work; no indenting, no spaces.
+_encoder = json.JSONEncoder( check_circular = False, separators = ( ',', ':' ) )
+
+# Where to stop going down for types and for operands.
+_type_nodes = frozenset( [ 'Type', 'FirstClassType', 'ConcreteType' ] )
+_value_nodes = frozenset( [ 'Value' ] )
+# And what the summary never looks in.
+_skip_nodes = frozenset( [ 'OptCommaSepMetadataAttachmentList', 'FuncAttrs', 'OperandBundles' ] )
+
+# No space before these, or after those, when putting text back
+# together from the terminals.
+_no_space_before = frozenset( [ ',', ')', ']', '}', '*', '>' ] )
+_no_space_after = frozenset( [ '(', '[', '{', '<' ] )
+
+############################################################
+# The full form of a tree, as lists and strings.
+############################################################
+def tree_as_json( node ):
+    if ( node.is_epsilon ):
+        return None
+    if ( node.was_terminal ):
+        return node.nodetype
+    here = [ node.nodetype ]
+    for kid in node.children:
+        here.append( tree_as_json( kid ) )
+    return here
+
+############################################################
+# The text of a subtree: its terminals, with spaces where LLVM would
+# usually put them.
+############################################################
+def _text( node ):
+    words = []
+    work = [ node ]
+    while ( len( work ) > 0 ):
+        here = work.pop()
+        if ( here.is_epsilon ):
+            continue
+        if ( here.was_terminal ):
+            text = here.nodetype
+            if ( len( words ) > 0 and text not in _no_space_before and words[ -1 ] not in _no_space_after ):
+                words.append( ' ' )
+            words.append( text )
+        else:
+            work.extend( reversed( here.children ) )
+    return ''.join( words )
+
+############################################################
+# The summary form: kind, lhs, types and operands.
+############################################################
+def tree_summary( tree ):
+    kids = tree.children
+    lhs = None
+    if ( len( kids ) == 3 ):
+        lhs = _text( kids[ 0 ] )
+    types = []
+    operands = []
+    work = [ kids[ -1 ] ]
+    while ( len( work ) > 0 ):
+        here = work.pop()
+        if ( here.was_terminal or here.nodetype in _skip_nodes ):
+            continue
+        if ( here.nodetype in _type_nodes ):
+            types.append( _text( here ) )
+        elif ( here.nodetype in _value_nodes ):
+            operands.append( _text( here ) )
+        else:
+            work.extend( reversed( here.children ) )
+    return { 'kind': parser._tree_kind( tree ), 'lhs': lhs, 'types': types, 'operands': operands }
+
+# ============================================================
+#
+# The writer. Give it a file name or anything with a write( str )
+# method (sys.stdout, say); a file we open we also close.
+#
+# ============================================================
+
+class JSONLinesWriter:
+
+    def __init__( self, file, summary = False, buffer_size = 1 << 20 ):
+        if ( isinstance( file, str ) ):
+            self.file = open( file, 'w', encoding = 'utf-8', newline = '\n' )
+            self.owned = True
+        else:
+            self.file = file
+            self.owned = False
+        self.summary = summary
+        self.buffer_size = buffer_size
+        self.out = []
+        self.size = 0
+        self.written = 0
+
+    def record( self, tree, source = None ):
+        if ( self.summary ):
+            if ( tree == None ):
+                record = { 'kind': None }
+            else:
+                record = tree_summary( tree )
+        else:
+            record = { 'tree': None if tree == None else tree_as_json( tree ) }
+        if ( source != None ):
+            record = dict( source = source, **record )
+        return record
+
+    def write( self, tree, source = None ):
+        line = _encoder.encode( self.record( tree, source ) )
+        self.out.append( line )
+        self.size = self.size + len( line ) + 1
+        self.written = self.written + 1
+        if ( self.size >= self.buffer_size ):
+            self.flush()
+
+    def write_many( self, trees, sources = None ):
+        if ( sources == None ):
+            for tree in trees:
+                self.write( tree )
+        else:
+            for tree, source in zip( trees, sources ):
+                self.write( tree, source )
+
+    def flush( self ):
+        if ( len( self.out ) > 0 ):
+            self.out.append( '' )
+            self.file.write( '\n'.join( self.out ) )
+            self.out = []
+            self.size = 0
+        self.file.flush()
+
+    def close( self ):
+        if ( self.file == None ):
+            return
+        self.flush()
+        if ( self.owned ):
+            self.file.close()
+        self.file = None
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, kind, value, traceback ):
+        self.close()
+
+############################################################
+#
+# A whole file of instructions, through parse_stream: a bufferful of
+# lines is parsed and written out before the next is read, so a big
+# file never has to be in memory all at once.
+#
+############################################################
+
+def export_file( corpus, out, summary = False, context = None, buffer_lines = 4096 ):
+    if ( context == None ):
+        # Keep the error reports out of the output.
+        context = parser.ParseContext( resync_lines = True, error_sink = parser.write_errors_to( sys.stderr ) )
+    with open( corpus ) as f, JSONLinesWriter( out, summary ) as writer:
+        for number, line, tree in parser.parse_stream( f, context, buffer_lines ):
+            writer.write( tree, line.strip() )
+        return writer.written
+
+if __name__ == "__main__":
+    summary = '--summary' in sys.argv[1:]
+    for corpus in sys.argv[1:]:
+        if ( corpus != '--summary' ):
+            export_file( corpus, sys.stdout, summary )
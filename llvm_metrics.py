@@ -0,0 +1,492 @@
+# ============================================================
+#
+# Counting what the parser does: a Profiler for working out where a
+# parse spends its time, and Metrics for watching a parser that runs
+# inside a long lived service.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import copy
+import os
+import threading
+import time
+import weakref
+
+import llvm_instruction_parser as parser
+
+# ============================================================
+#
+# Profiling. With a Profiler in the context, every reduction is
+# counted and timed, per production and per nonterminal, and every
+# token is counted by type. One Profiler can be shared by lots of
+# parses (and threads) and reports on all of them together:
+#
+#    profiler = llvm_metrics.Profiler()
+#    for line in lines:
+#        parser.inst_parse( line, yacc_debug = False,
+#                           context = parser.ParseContext( profiler = profiler ) )
+#    print( profiler.report() )
+#    profiler.write_collapsed( open( 'parse.folded', 'w' ) )
+#
+# The time for a production is just the time spent in its p_*
+# function (building the Node), not shifting or lexing. In the
+# collapsed stacks each node's time is charged to its path from the
+# root, so "flamegraph.pl parse.folded" shows where it all goes.
+# The fast path (llvm_fast_path) doesn't go through PLY's
+# reductions, so none of that is counted here.
+#
+# Read the results after the parses are done.
+#
+# ============================================================
+
+class Profiler:
+
+    def __init__( self ):
+        # Each thread's parser gets its own instrumented copy, which
+        # keeps its own counts, so there is no locking while
+        # parsing. The reports add them all up. (The copies are kept
+        # in "records" as well, since the thread and its parser may
+        # be long gone by the time anybody asks.)
+        self.instrumented = weakref.WeakKeyDictionary()
+        self.records = []
+        self.lock = threading.Lock()
+
+    ############################################################
+    # The copy of "i_parser" that counts and times its reductions.
+    ############################################################
+    def instrument( self, i_parser ):
+        profiled = self.instrumented.get( i_parser )
+        if ( profiled == None ):
+            profiled = copy.copy( i_parser )
+            profiled.profile_counts = {}
+            profiled.profile_tokens = {}
+            profiled.profile_stacks = {}
+            profiled.profile_times = {}
+            profiled.profile_parses = 0
+            profiled.productions = [ self.__timed( p, profiled ) for p in i_parser.productions ]
+            with self.lock:
+                self.instrumented[ i_parser ] = profiled
+                self.records.append( profiled )
+        return profiled
+
+    def __timed( self, production, profiled ):
+        action = production.callable
+        if ( action == None ):
+            return production
+        counts = profiled.profile_counts
+        times = profiled.profile_times
+        key = ( production.name, production.str )
+        counts[ key ] = [ 0, 0.0 ]
+        def timed( t ):
+            started = time.perf_counter()
+            try:
+                action( t )
+            finally:
+                elapsed = time.perf_counter() - started
+                c = counts[ key ]
+                c[ 0 ] = c[ 0 ] + 1
+                c[ 1 ] = c[ 1 ] + elapsed
+                # Hang on to the node too, so its id can't be reused.
+                times[ id( t[ 0 ] ) ] = ( t[ 0 ], elapsed )
+        production = copy.copy( production )
+        production.callable = timed
+        return production
+
+    def counting_tokens( self, profiled, token ):
+        tokens = profiled.profile_tokens
+        def counted():
+            tok = token()
+            if ( tok != None ):
+                tokens[ tok.type ] = tokens.get( tok.type, 0 ) + 1
+            return tok
+        return counted
+
+    ############################################################
+    # After a parse: charge the time for each node to its path from
+    # the root, for the collapsed stacks.
+    ############################################################
+    def collect( self, profiled, tree ):
+        times = profiled.profile_times
+        stacks = profiled.profile_stacks
+        profiled.profile_parses = profiled.profile_parses + 1
+        if ( type( tree ) == list ):
+            roots = [ x for x in tree if x != None ]
+        elif ( tree != None ):
+            roots = [ tree ]
+        else:
+            roots = []
+        work = [ ( x, x.nodetype ) for x in roots ]
+        while ( len( work ) > 0 ):
+            node, path = work.pop()
+            timed = times.get( id( node ) )
+            if ( timed != None and timed[ 0 ] is node ):
+                stacks[ path ] = stacks.get( path, 0.0 ) + timed[ 1 ]
+            # Don't make a lazy node parse itself just to look.
+            if ( isinstance( node, parser.LazyNode ) and node._source_text != None ):
+                continue
+            for x in node.children:
+                if ( not x.was_terminal ):
+                    work.append( ( x, path + ';' + x.nodetype ) )
+        times.clear()
+
+    ############################################################
+    # The results, added up over all the instrumented parsers.
+    ############################################################
+    def __all( self ):
+        with self.lock:
+            return list( self.records )
+
+    def parses( self ):
+        return sum( [ p.profile_parses for p in self.__all() ] )
+
+    def productions( self ):
+        totals = {}
+        for p in self.__all():
+            for key, c in list( p.profile_counts.items() ):
+                total = totals.setdefault( key, [ 0, 0.0 ] )
+                total[ 0 ] = total[ 0 ] + c[ 0 ]
+                total[ 1 ] = total[ 1 ] + c[ 1 ]
+        return totals
+
+    def nonterminals( self ):
+        totals = {}
+        for ( name, rule ), c in self.productions().items():
+            total = totals.setdefault( name, [ 0, 0.0 ] )
+            total[ 0 ] = total[ 0 ] + c[ 0 ]
+            total[ 1 ] = total[ 1 ] + c[ 1 ]
+        return totals
+
+    def tokens( self ):
+        totals = {}
+        for p in self.__all():
+            for kind, n in list( p.profile_tokens.items() ):
+                totals[ kind ] = totals.get( kind, 0 ) + n
+        return totals
+
+    def stacks( self ):
+        totals = {}
+        for p in self.__all():
+            for path, t in list( p.profile_stacks.items() ):
+                totals[ path ] = totals.get( path, 0.0 ) + t
+        return totals
+
+    ############################################################
+    # Grammar coverage: the productions (of the start symbols we
+    # have used) that were never reduced.
+    ############################################################
+    def unused( self ):
+        return sorted( [ rule for ( name, rule ), c in self.productions().items() if c[ 0 ] == 0 ] )
+
+    ############################################################
+    # A table, one row per production ("production"), nonterminal
+    # ("nonterminal") or token type ("token"). Sort by "time",
+    # "count", "mean" or "name"; the biggest come first except for
+    # names. "limit" keeps just the top so many rows.
+    ############################################################
+    def table( self, by = 'production', sort = 'time', limit = None ):
+        if ( by == 'token' ):
+            rows = [ ( kind, n, 0.0 ) for kind, n in self.tokens().items() ]
+        elif ( by == 'nonterminal' ):
+            rows = [ ( name, c[ 0 ], c[ 1 ] ) for name, c in self.nonterminals().items() ]
+        else:
+            rows = [ ( rule, c[ 0 ], c[ 1 ] ) for ( name, rule ), c in self.productions().items() ]
+        rows = [ r for r in rows if r[ 1 ] > 0 ]
+        if ( sort == 'name' ):
+            rows.sort( key = lambda r: r[ 0 ] )
+        elif ( sort == 'count' ):
+            rows.sort( key = lambda r: ( -r[ 1 ], r[ 0 ] ) )
+        elif ( sort == 'mean' ):
+            rows.sort( key = lambda r: ( -r[ 2 ] / r[ 1 ], r[ 0 ] ) )
+        else:
+            rows.sort( key = lambda r: ( -r[ 2 ], -r[ 1 ], r[ 0 ] ) )
+        if ( limit != None ):
+            rows = rows[ :limit ]
+        if ( by == 'token' ):
+            lines = [ '%10s  %s' % ( 'count', 'token' ) ]
+            lines = lines + [ '%10d  %s' % ( r[ 1 ], r[ 0 ] ) for r in rows ]
+        else:
+            lines = [ '%10s %12s %10s  %s' % ( 'count', 'total ms', 'mean us', by ) ]
+            lines = lines + [ '%10d %12.3f %10.2f  %s' % ( r[ 1 ], r[ 2 ] * 1e3, r[ 2 ] * 1e6 / r[ 1 ], r[ 0 ] )
+                              for r in rows ]
+        return '\n'.join( lines ) + '\n'
+
+    def report( self, sort = 'time', limit = 40 ):
+        unused = self.unused()
+        return ( 'Parses: ' + str( self.parses() ) + '\n\n' +
+                 'Productions:\n' + self.table( 'production', sort, limit ) + '\n' +
+                 'Nonterminals:\n' + self.table( 'nonterminal', sort, limit ) + '\n' +
+                 'Tokens:\n' + self.table( 'token', 'count', limit ) + '\n' +
+                 'Never used (' + str( len( unused ) ) + ' of ' + str( len( self.productions() ) ) + '):\n' +
+                 ''.join( [ '    ' + rule + '\n' for rule in unused ] ) )
+
+    ############################################################
+    # Collapsed stacks ("A;B;C microseconds" per line), the input
+    # format for flamegraph.pl and friends.
+    ############################################################
+    def write_collapsed( self, file ):
+        for path, t in sorted( self.stacks().items() ):
+            us = int( round( t * 1e6 ) )
+            if ( us > 0 ):
+                file.write( path + ' ' + str( us ) + '\n' )
+
+# ============================================================
+#
+# Metrics, for when the parser lives inside a long running service.
+# Turn them on once and every parse in every thread is counted:
+#
+#    metrics = llvm_metrics.enable_metrics()
+#    ...
+#    metrics.snapshot()[ 'instructions_parsed' ]
+#    metrics.write_prometheus( '/var/lib/node_exporter/llvm_parser.prom' )
+#
+# What we keep:
+#
+#    instructions_parsed  instructions that parsed (lines of a block too)
+#    failures             parses (or block lines) that did not, by the
+#                         kind of the first error: "syntax", "illegal
+#                         character" or "semantic"
+#    errors               every error reported, by kind
+#    tokens_lexed         tokens handed to the parser
+#    nodes_allocated      Node()s made (the serial numbers used up)
+#    type_table_hits      TypeTable lookups that found a shared type
+#    type_table_misses    ... and that didn't
+#    parse_cache_hits     instructions found in a ParseCache
+#    parse_cache_misses   ... and not
+#    fast_path            llvm_fast_path: "taken" or "declined"
+#    latency              a histogram of parse times for each kind of
+#                         instruction (or the start symbol, for
+#                         fragments). A block's lines each count under
+#                         their own kind, with an even share of the
+#                         block's time.
+#
+# With metrics off (the default) all this costs one test per parse.
+#
+# ============================================================
+
+def enable_metrics( metrics = None ):
+    if ( metrics == None ):
+        metrics = Metrics()
+    parser.set_metrics( metrics )
+    return metrics
+
+def disable_metrics():
+    parser.set_metrics( None )
+
+def current_metrics():
+    return parser.current_metrics()
+
+class Metrics:
+
+    # Upper bounds of the latency buckets, in seconds.
+    buckets = [ 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 1e-1 ]
+
+    def __init__( self ):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset( self ):
+        with self.lock:
+            self.instructions_parsed = 0
+            self.failures = {}
+            self.errors = {}
+            self.tokens_lexed = 0
+            self.nodes_allocated = 0
+            self.type_table_hits = 0
+            self.type_table_misses = 0
+            self.parse_cache_hits = 0
+            self.parse_cache_misses = 0
+            self.fast_path = {}
+            self.lines_skipped = 0
+            # kind -> [ count per bucket (plus one for the rest), count, sum ]
+            self.latency = {}
+
+    def counting_tokens( self, token, tokens ):
+        def counted():
+            tok = token()
+            if ( tok != None ):
+                tokens[ 0 ] = tokens[ 0 ] + 1
+            return tok
+        return counted
+
+    def start( self, context ):
+        hits = misses = 0
+        if ( context.type_table != None ):
+            hits = context.type_table.hits
+            misses = context.type_table.misses
+        return ( time.perf_counter(), context.serial, len( context.errors ), hits, misses )
+
+    ############################################################
+    # One parse is over. "before" is what start() gave back.
+    ############################################################
+    def record( self, symbol, inputstring, tree, context, before, tokens ):
+        elapsed = time.perf_counter() - before[ 0 ]
+        errors = context.errors[ before[ 2 ]: ]
+        reason = errors[ 0 ].kind if len( errors ) > 0 else 'unknown'
+        kinds = None
+        if ( symbol == 'Block' ):
+            lines = [ line for start, line in parser._nonblank_lines( inputstring ) ]
+            if ( tree != None and len( tree ) == len( lines ) ):
+                kinds = [ parser._tree_kind( x ) if x != None else ( parser.guess_instruction_kind( line ) or 'unknown' )
+                          for line, x in zip( lines, tree ) ]
+                parsed = len( [ x for x in tree if x != None ] )
+                failed = len( tree ) - parsed
+            else:
+                # block_parse goes back over it a line at a time, and
+                # those parses count the lines; all this one has is
+                # the time it wasted.
+                parsed = failed = 0
+                errors = []
+            kind = symbol
+        elif ( symbol == 'Instruction' ):
+            parsed = 1 if tree != None else 0
+            failed = 1 - parsed
+            if ( tree != None ):
+                kind = parser._tree_kind( tree )
+            else:
+                kind = parser.guess_instruction_kind( inputstring ) or 'unknown'
+        else:
+            parsed = 0
+            failed = 1 if tree == None else 0
+            kind = symbol
+        hits = misses = 0
+        if ( context.type_table != None ):
+            hits = context.type_table.hits - before[ 3 ]
+            misses = context.type_table.misses - before[ 4 ]
+        with self.lock:
+            self.instructions_parsed = self.instructions_parsed + parsed
+            if ( failed > 0 ):
+                self.failures[ reason ] = self.failures.get( reason, 0 ) + failed
+            for e in errors:
+                self.errors[ e.kind ] = self.errors.get( e.kind, 0 ) + 1
+            self.tokens_lexed = self.tokens_lexed + tokens
+            self.nodes_allocated = self.nodes_allocated + context.serial - before[ 1 ]
+            self.type_table_hits = self.type_table_hits + hits
+            self.type_table_misses = self.type_table_misses + misses
+            if ( kinds == None ):
+                self.__observe( kind, elapsed )
+            else:
+                for kind in kinds:
+                    self.__observe( kind, elapsed / len( kinds ) )
+
+    def __observe( self, kind, elapsed ):
+        histogram = self.latency.get( kind )
+        if ( histogram == None ):
+            histogram = [ [ 0 ] * ( len( self.buckets ) + 1 ), 0, 0.0 ]
+            self.latency[ kind ] = histogram
+        i = 0
+        while ( i < len( self.buckets ) and elapsed > self.buckets[ i ] ):
+            i = i + 1
+        histogram[ 0 ][ i ] = histogram[ 0 ][ i ] + 1
+        histogram[ 1 ] = histogram[ 1 ] + 1
+        histogram[ 2 ] = histogram[ 2 ] + elapsed
+
+    def cache_result( self, hit ):
+        with self.lock:
+            if ( hit ):
+                self.parse_cache_hits = self.parse_cache_hits + 1
+            else:
+                self.parse_cache_misses = self.parse_cache_misses + 1
+
+    def lines_filtered( self, skipped ):
+        with self.lock:
+            self.lines_skipped = self.lines_skipped + skipped
+
+    def fast_path_result( self, taken ):
+        result = 'taken' if taken else 'declined'
+        with self.lock:
+            self.fast_path[ result ] = self.fast_path.get( result, 0 ) + 1
+
+    ############################################################
+    # Everything as plain dicts and numbers. Each latency entry has
+    # "buckets" (upper bound -> cumulative count, the last bound
+    # being infinity), "count" and "sum".
+    ############################################################
+    def snapshot( self ):
+        with self.lock:
+            latency = {}
+            for kind, histogram in self.latency.items():
+                cumulative = 0
+                buckets = {}
+                for bound, n in zip( self.buckets + [ float( 'inf' ) ], histogram[ 0 ] ):
+                    cumulative = cumulative + n
+                    buckets[ bound ] = cumulative
+                latency[ kind ] = { 'buckets' : buckets, 'count' : histogram[ 1 ], 'sum' : histogram[ 2 ] }
+            return { 'instructions_parsed' : self.instructions_parsed,
+                     'failures' : dict( self.failures ),
+                     'errors' : dict( self.errors ),
+                     'tokens_lexed' : self.tokens_lexed,
+                     'nodes_allocated' : self.nodes_allocated,
+                     'type_table_hits' : self.type_table_hits,
+                     'type_table_misses' : self.type_table_misses,
+                     'parse_cache_hits' : self.parse_cache_hits,
+                     'parse_cache_misses' : self.parse_cache_misses,
+                     'fast_path' : dict( self.fast_path ),
+                     'lines_skipped' : self.lines_skipped,
+                     'latency' : latency }
+
+    ############################################################
+    # The Prometheus text exposition format.
+    ############################################################
+    def prometheus( self, prefix = 'llvm_parser' ):
+        snap = self.snapshot()
+        lines = []
+        def metric( name, kind, help, samples ):
+            lines.append( '# HELP ' + prefix + '_' + name + ' ' + help )
+            lines.append( '# TYPE ' + prefix + '_' + name + ' ' + kind )
+            for suffix, labels, value in samples:
+                if ( len( labels ) > 0 ):
+                    labels = '{' + ','.join( [ k + '="' + _label_value( v ) + '"' for k, v in labels ] ) + '}'
+                else:
+                    labels = ''
+                lines.append( prefix + '_' + name + suffix + labels + ' ' + _sample_value( value ) )
+        metric( 'instructions_parsed_total', 'counter', 'Instructions parsed.',
+                [ ( '', [], snap[ 'instructions_parsed' ] ) ] )
+        metric( 'failures_total', 'counter', 'Parses that failed, by the kind of the first error.',
+                [ ( '', [ ( 'reason', r ) ], n ) for r, n in sorted( snap[ 'failures' ].items() ) ] )
+        metric( 'errors_total', 'counter', 'Errors reported, by kind.',
+                [ ( '', [ ( 'kind', k ) ], n ) for k, n in sorted( snap[ 'errors' ].items() ) ] )
+        metric( 'tokens_lexed_total', 'counter', 'Tokens lexed.',
+                [ ( '', [], snap[ 'tokens_lexed' ] ) ] )
+        metric( 'nodes_allocated_total', 'counter', 'Parse tree nodes allocated.',
+                [ ( '', [], snap[ 'nodes_allocated' ] ) ] )
+        metric( 'type_table_lookups_total', 'counter', 'TypeTable lookups, by result.',
+                [ ( '', [ ( 'result', 'hit' ) ], snap[ 'type_table_hits' ] ),
+                  ( '', [ ( 'result', 'miss' ) ], snap[ 'type_table_misses' ] ) ] )
+        metric( 'parse_cache_lookups_total', 'counter', 'ParseCache lookups, by result.',
+                [ ( '', [ ( 'result', 'hit' ) ], snap[ 'parse_cache_hits' ] ),
+                  ( '', [ ( 'result', 'miss' ) ], snap[ 'parse_cache_misses' ] ) ] )
+        metric( 'fast_path_total', 'counter', 'Fast path attempts, by result.',
+                [ ( '', [ ( 'result', r ) ], n ) for r, n in sorted( snap[ 'fast_path' ].items() ) ] )
+        metric( 'lines_skipped_total', 'counter', 'Lines a LineFilter kept from being parsed.',
+                [ ( '', [], snap[ 'lines_skipped' ] ) ] )
+        samples = []
+        for kind, histogram in sorted( snap[ 'latency' ].items() ):
+            for bound, n in histogram[ 'buckets' ].items():
+                samples.append( ( '_bucket', [ ( 'kind', kind ), ( 'le', bound ) ], n ) )
+            samples.append( ( '_sum', [ ( 'kind', kind ) ], histogram[ 'sum' ] ) )
+            samples.append( ( '_count', [ ( 'kind', kind ) ], histogram[ 'count' ] ) )
+        metric( 'parse_seconds', 'histogram', 'Parse time, by kind of instruction.', samples )
+        return '\n'.join( lines ) + '\n'
+
+    ############################################################
+    # Write it to "filename" (for node_exporter's textfile
+    # collector, say). The file is replaced in one go so nobody
+    # ever reads half of it.
+    ############################################################
+    def write_prometheus( self, filename, prefix = 'llvm_parser' ):
+        text = self.prometheus( prefix )
+        with open( filename + '.tmp', 'w' ) as file:
+            file.write( text )
+        os.replace( filename + '.tmp', filename )
+
+def _label_value( value ):
+    if ( type( value ) == float ):
+        return _sample_value( value )
+    return str( value ).replace( '\\', '\\\\' ).replace( '"', '\\"' ).replace( '\n', '\\n' )
+
+def _sample_value( value ):
+    if ( value == float( 'inf' ) ):
+        return '+Inf'
+    return repr( value )
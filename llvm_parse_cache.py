@@ -0,0 +1,224 @@
+# ============================================================
+#
+# A persistent parse cache.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# A parse cache that lasts from one run to the next. We go over the
+# same module dumps day after day, so keep the trees on disk (in an
+# SQLite file) and skip the parse for any instruction seen before:
+#
+#    cache = llvm_parse_cache.ParseCache( 'parses.sqlite', max_bytes = 1 << 30 )
+#    tree = parser.inst_parse( line, context = parser.ParseContext( cache = cache ) )
+#    ...
+#    cache.close()
+#
+# Only whole instructions are cached, and only ones that parse. What
+# comes back is rebuilt through Node() so it is just what a parse
+# would have given: same serial numbers, and flyweights, AST mode,
+# hashes and the TypeTable all work as usual. (Not with spans or a
+# profiler, though; those always parse.)
+#
+# Entries are keyed by a hash of the text (and AST mode, which
+# changes the tree). The file also records a fingerprint of the
+# grammar, the p_* and t_* functions and the reserved words, and if
+# that doesn't match the parser the whole cache is thrown out.
+#
+# max_bytes is a limit on the stored trees, added up: when they come
+# to more than that, the least recently used go. The file itself is
+# somewhat bigger (SQLite's pages and the index), and it never
+# shrinks, since SQLite keeps the freed pages to use again; it just
+# stops growing. vacuum() gives the space back.
+#
+# Several threads and processes can share one file; SQLite does the
+# locking. New trees and the "recently used" times are written out
+# in batches, so call flush() (in each thread) or close() when done.
+# The hits and misses are for the whole cache, all threads together.
+#
+# ============================================================
+
+import hashlib
+import inspect
+import marshal
+import sqlite3
+import threading
+import time
+
+import llvm_instruction_parser as parser
+
+# Bump this when the way trees are stored changes.
+_cache_format = 1
+
+_fingerprint = None
+
+def grammar_fingerprint():
+    global _fingerprint
+    if ( _fingerprint == None ):
+        digest = hashlib.sha256( str( _cache_format ).encode() )
+        names = vars( parser )
+        for name in sorted( names ):
+            if ( name.startswith( 'p_' ) or name.startswith( 't_' ) ):
+                thing = names[ name ]
+                if ( callable( thing ) ):
+                    thing = inspect.getsource( thing )
+                digest.update( ( name + '\n' + str( thing ) + '\n' ).encode() )
+        digest.update( repr( sorted( parser.reserved.items() ) ).encode() )
+        digest.update( repr( parser.literals ).encode() )
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+############################################################
+# A tree as nested tuples, for marshal: a nonterminal is
+# ( nodetype, children ), a terminal is its text and (empty) is None.
+############################################################
+def _encode_tree( node ):
+    if ( node.is_epsilon and node.was_terminal ):
+        return None
+    if ( node.was_terminal ):
+        return node.nodetype
+    return ( node.nodetype, tuple( [ _encode_tree( x ) for x in node.children ] ) )
+
+############################################################
+# And back, bottom up like the parser would, so the serial numbers
+# come out the same. Run inside using_context.
+############################################################
+def _decode_tree( encoded ):
+    if ( encoded == None ):
+        return parser.make_empty()
+    if ( type( encoded ) == str ):
+        return encoded
+    nodetype, kids = encoded
+    return parser.make_node( nodetype, [ _decode_tree( x ) for x in kids ] )
+
+class ParseCache:
+
+    def __init__( self, filename, max_bytes = 256 << 20, batch = 256 ):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.batch = batch
+        self.hits = 0
+        self.misses = 0
+        # One connection per thread (SQLite wants it that way).
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        connection = self.__connection()
+        with connection:
+            row = connection.execute( "SELECT value FROM meta WHERE name = 'fingerprint'" ).fetchone()
+            if ( row == None or row[ 0 ] != grammar_fingerprint() ):
+                connection.execute( 'DELETE FROM entries' )
+                connection.execute( "INSERT OR REPLACE INTO meta VALUES ( 'fingerprint', ? )",
+                                    ( grammar_fingerprint(), ) )
+
+    def __connection( self ):
+        connection = getattr( self.local, 'connection', None )
+        if ( connection == None ):
+            # Only this thread uses it, until close() closes them all.
+            connection = sqlite3.connect( self.filename, timeout = 60, check_same_thread = False )
+            connection.execute( 'PRAGMA journal_mode = WAL' )
+            connection.execute( 'PRAGMA synchronous = NORMAL' )
+            with connection:
+                connection.execute( 'CREATE TABLE IF NOT EXISTS meta ( name TEXT PRIMARY KEY, value TEXT )' )
+                connection.execute( 'CREATE TABLE IF NOT EXISTS entries ( key BLOB PRIMARY KEY, tree BLOB, ' +
+                                    'size INTEGER, used REAL )' )
+                connection.execute( 'CREATE INDEX IF NOT EXISTS entries_used ON entries ( used )' )
+            self.local.connection = connection
+            self.local.pending = []
+            self.local.touched = []
+            with self.lock:
+                self.connections.append( connection )
+        return connection
+
+    def __key( self, inputstring, context ):
+        mode = 'ast\0' if context.ast else '\0'
+        return hashlib.sha256( ( mode + inputstring ).encode() ).digest()
+
+    def get( self, inputstring, context ):
+        connection = self.__connection()
+        key = self.__key( inputstring, context )
+        try:
+            row = connection.execute( 'SELECT tree FROM entries WHERE key = ?', ( key, ) ).fetchone()
+        except sqlite3.Error:
+            row = None
+        with self.lock:
+            if ( row == None ):
+                self.misses = self.misses + 1
+            else:
+                self.hits = self.hits + 1
+        if ( row == None ):
+            return None
+        self.local.touched.append( key )
+        if ( len( self.local.touched ) >= self.batch ):
+            self.flush()
+        with parser.using_context( context ):
+            return _decode_tree( marshal.loads( row[ 0 ] ) )
+
+    def put( self, inputstring, tree, context ):
+        self.__connection()
+        data = marshal.dumps( _encode_tree( tree ) )
+        self.local.pending.append( ( self.__key( inputstring, context ), data, len( data ), time.time() ) )
+        if ( len( self.local.pending ) >= self.batch ):
+            self.flush()
+
+    ############################################################
+    # Write out what this thread has been saving up, and make room
+    # if the file is too big.
+    ############################################################
+    def flush( self ):
+        connection = self.__connection()
+        pending = self.local.pending
+        touched = self.local.touched
+        self.local.pending = []
+        self.local.touched = []
+        now = time.time()
+        try:
+            with connection:
+                connection.executemany( 'INSERT OR REPLACE INTO entries VALUES ( ?, ?, ?, ? )', pending )
+                connection.executemany( 'UPDATE entries SET used = ? WHERE key = ?',
+                                        [ ( now, key ) for key in touched ] )
+            if ( len( pending ) > 0 ):
+                self.__evict( connection )
+        except sqlite3.Error:
+            # Somebody else has it locked for too long. It's only a
+            # cache; we'll parse those again next time.
+            pass
+
+    def __evict( self, connection ):
+        total = connection.execute( 'SELECT TOTAL( size ) FROM entries' ).fetchone()[ 0 ]
+        if ( total <= self.max_bytes ):
+            return
+        # Down to 90%, so we aren't back here after every batch.
+        excess = total - self.max_bytes * 0.9
+        victims = []
+        for key, size in connection.execute( 'SELECT key, size FROM entries ORDER BY used' ):
+            victims.append( ( key, ) )
+            excess = excess - size
+            if ( excess <= 0 ):
+                break
+        with connection:
+            connection.executemany( 'DELETE FROM entries WHERE key = ?', victims )
+
+    ############################################################
+    # Shrink the file down to what is in it. This rewrites the whole
+    # file, and waits for everyone else using it to finish.
+    ############################################################
+    def vacuum( self ):
+        self.flush()
+        self.__connection().execute( 'VACUUM' )
+
+    def __len__( self ):
+        return self.__connection().execute( 'SELECT COUNT(*) FROM entries' ).fetchone()[ 0 ]
+
+    ############################################################
+    # Flush this thread's batch and close every connection. Other
+    # threads should flush() before this.
+    ############################################################
+    def close( self ):
+        self.flush()
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
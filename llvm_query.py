@@ -0,0 +1,339 @@
+# ============================================================
+#
+# Tree patterns: finding things in parse trees without writing the
+# search by hand each time.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# Instead of a.children[ 2 ].locate_tree_node( "LocalIdent" ) and
+# friends, say what you are after as a path of nodetypes:
+#
+#    CallInst/Value//GlobalIdent    a GlobalIdent anywhere under a
+#                                   Value that is a child of a CallInst
+#    StoreInst[Type//PointerType]   a StoreInst with a child Type that
+#                                   has a PointerType under it (a Type
+#                                   is Type/FirstClassType/ConcreteType/
+#                                   PointerType, so "/" would miss it)
+#    ICmpInst/*@1/*@0               child 0 of child 1 of an ICmpInst
+#    Alignment/int_lit//'4'         the terminal "4" in an alignment
+#    CallInst/Value:callee          ... and call the Value "callee"
+#
+# The pieces:
+#
+#    A/B      B is a child of A
+#    A//B     B is anywhere under A
+#    *        any nodetype
+#    'text'   a terminal with just that text
+#    B@n      B is child number n of its parent (from 0; -1 is the
+#             last one)
+#    A[p]     A, as long as the path p (starting from A's children,
+#             or from anywhere under A if p starts with //) matches
+#             something; there can be more than one [p]
+#    A:name   bind the A that matched to "name"
+#
+# A pattern that starts with "/" only matches starting at the top of
+# the tree; otherwise it starts anywhere.
+#
+# A pattern is compiled once (compile_pattern, and query() keeps the
+# ones it has seen) into a chain of little functions, one per step.
+# search() gives back every match as ( node, bindings ), in tree
+# order, where bindings is a dict of the :names (including those
+# inside [ ], from the first way the [ ] matched). search_many() does
+# a whole batch of trees and tells you which tree each match is in.
+# Each match comes back once, even when it can be reached more than
+# one way ("Type//IntType" in "[10 x [20 x i8]]" finds the i8 from
+# all three Types).
+#
+#    calls = llvm_query.compile_pattern( 'CallInst/Value:callee//GlobalIdent' )
+#    for index, node, bindings in calls.search_many( trees ):
+#        print( index, node.children[ 0 ].nodetype )
+#
+# ============================================================
+
+import re
+
+_token_re = re.compile( r"\s*(?:(//)|(/)|(\[)|(\])|(\*)|@(-?[0-9]+)|:([A-Za-z_][A-Za-z_0-9]*)|'((?:[^'\\]|\\.)*)'|([A-Za-z_][A-Za-z_0-9]*))" )
+
+############################################################
+# The pattern as a list of ( kind, value, position ) tokens.
+############################################################
+def _tokenize( text ):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while ( pos < len( text ) ):
+        m = _token_re.match( text, pos )
+        if ( m == None ):
+            raise ValueError( 'Bad tree pattern at ' + str( pos ) + ': ' + text )
+        kind = m.lastindex
+        tokens.append( ( kind, m.group( kind ), m.start( kind ) ) )
+        pos = m.end()
+    return tokens
+
+# Token kinds (which group of _token_re matched).
+_descendant, _child, _open, _close, _any, _position, _binding, _terminal, _name = range( 1, 10 )
+
+# ============================================================
+#
+# The matchers. Each step becomes a function( node, where, bindings )
+# that yields ( node, where, bindings ) for every way the rest of the
+# pattern matches from "node", which is the node the step before
+# matched (or the root). The last step's "next" just hands back what
+# it got. "where" is the way down to the node from the root, as
+# ( where the parent is, child number ), since with flyweights or a
+# TypeTable the same node can be in a tree in more than one place.
+#
+# ============================================================
+
+def _finish( node, where, bindings ):
+    yield ( node, where, bindings )
+
+############################################################
+# Every node under "node" (not "node" itself), in tree order, as
+# ( node, its position in its parent, how many children that is,
+# where it is ).
+############################################################
+def _descendants( node, where ):
+    kids = node.children
+    count = len( kids )
+    work = [ ( kids[ k ], k, count, ( where, k ) ) for k in range( count - 1, -1, -1 ) ]
+    while ( len( work ) > 0 ):
+        here = work.pop()
+        yield here
+        kids = here[ 0 ].children
+        count = len( kids )
+        where = here[ 3 ]
+        for k in range( count - 1, -1, -1 ):
+            work.append( ( kids[ k ], k, count, ( where, k ) ) )
+
+############################################################
+# The matches from "run", each one once: the same node in the same
+# place with the same bindings is the same match.
+############################################################
+def _unique( run ):
+    seen = set()
+    for node, where, bindings in run:
+        key = ( where, tuple( sorted( [ ( name, id( x ) ) for name, x in bindings.items() ] ) ) )
+        if ( key in seen ):
+            continue
+        seen.add( key )
+        yield ( node, bindings )
+
+def _make_step( axis, test, terminal, position, predicates, label, next ):
+
+    ############################################################
+    # Does "node" (child "i" of "count") pass this step? Returns the
+    # bindings to go on with, or None.
+    ############################################################
+    def accept( node, i, count, bindings ):
+        if ( test != None and ( node.nodetype != test or node.was_terminal != terminal ) ):
+            return None
+        if ( position != None and i != ( position if position >= 0 else count + position ) ):
+            return None
+        for predicate in predicates:
+            found = predicate( node )
+            if ( found == None ):
+                return None
+            if ( len( found ) > 0 ):
+                bindings = dict( bindings, **found )
+        if ( label != None ):
+            bindings = dict( bindings )
+            bindings[ label ] = node
+        return bindings
+
+    if ( axis == _child and position != None ):
+        # Only the one child to look at.
+        def step( node, where, bindings ):
+            kids = node.children
+            count = len( kids )
+            i = position if position >= 0 else count + position
+            if ( i >= 0 and i < count ):
+                here = accept( kids[ i ], i, count, bindings )
+                if ( here != None ):
+                    yield from next( kids[ i ], ( where, i ), here )
+    elif ( axis == _child ):
+        def step( node, where, bindings ):
+            kids = node.children
+            count = len( kids )
+            for i in range( 0, count ):
+                here = accept( kids[ i ], i, count, bindings )
+                if ( here != None ):
+                    yield from next( kids[ i ], ( where, i ), here )
+    elif ( axis == _descendant ):
+        def step( node, where, bindings ):
+            for kid, i, count, place in _descendants( node, where ):
+                here = accept( kid, i, count, bindings )
+                if ( here != None ):
+                    yield from next( kid, place, here )
+    else:
+        # The first step: the node we are given (the top of the tree
+        # has no position, so @n never matches it), and unless the
+        # pattern is anchored with "/", everything under it too.
+        anchored = ( axis == 'root' )
+        def step( node, where, bindings ):
+            if ( position == None ):
+                here = accept( node, None, 0, bindings )
+                if ( here != None ):
+                    yield from next( node, where, here )
+            if ( not anchored ):
+                for kid, i, count, place in _descendants( node, where ):
+                    here = accept( kid, i, count, bindings )
+                    if ( here != None ):
+                        yield from next( kid, place, here )
+    return step
+
+# ============================================================
+#
+# The compiler: a little recursive descent over the tokens.
+#
+# ============================================================
+
+class _Compiler:
+
+    def __init__( self, text ):
+        self.text = text
+        self.tokens = _tokenize( text )
+        self.at = 0
+
+    def error( self, message ):
+        if ( self.at < len( self.tokens ) ):
+            where = ' at ' + str( self.tokens[ self.at ][ 2 ] )
+        else:
+            where = ' at the end'
+        raise ValueError( 'Bad tree pattern' + where + ' (' + message + '): ' + self.text )
+
+    def peek( self ):
+        if ( self.at < len( self.tokens ) ):
+            return self.tokens[ self.at ][ 0 ]
+        return None
+
+    def take( self ):
+        token = self.tokens[ self.at ]
+        self.at = self.at + 1
+        return token
+
+    ############################################################
+    # path := [ / | // ] step ( ( / | // ) step )*
+    # "first" is the axis for a first step with no slash in front.
+    ############################################################
+    def path( self, first ):
+        steps = []
+        axis = first
+        if ( self.peek() == _descendant or self.peek() == _child ):
+            kind = self.take()[ 0 ]
+            if ( first == 'anywhere' ):
+                axis = 'root' if kind == _child else 'anywhere'
+            else:
+                axis = kind
+        steps.append( self.step( axis ) )
+        while ( self.peek() == _descendant or self.peek() == _child ):
+            axis = self.take()[ 0 ]
+            steps.append( self.step( axis ) )
+        next = _finish
+        for args in reversed( steps ):
+            next = _make_step( *( args + ( next, ) ) )
+        return next
+
+    ############################################################
+    # step := ( name | * | 'text' ) [ @n ] ( '[' path ']' )* [ :name ]
+    ############################################################
+    def step( self, axis ):
+        kind = self.peek()
+        if ( kind == _name ):
+            test = self.take()[ 1 ]
+            terminal = False
+        elif ( kind == _terminal ):
+            test = re.sub( r'\\(.)', r'\1', self.take()[ 1 ] )
+            terminal = True
+        elif ( kind == _any ):
+            self.take()
+            test = None
+            terminal = False
+        else:
+            self.error( 'expected a nodetype, * or a quoted terminal' )
+        position = None
+        if ( self.peek() == _position ):
+            position = int( self.take()[ 1 ] )
+        predicates = []
+        while ( self.peek() == _open ):
+            self.take()
+            predicates.append( _predicate( self.path( _child ) ) )
+            if ( self.peek() != _close ):
+                self.error( "expected ']'" )
+            self.take()
+        label = None
+        if ( self.peek() == _binding ):
+            label = self.take()[ 1 ]
+        return ( axis, test, terminal, position, predicates, label )
+
+def _predicate( run ):
+    def predicate( node ):
+        for found, where, bindings in run( node, (), {} ):
+            return bindings
+        return None
+    return predicate
+
+############################################################
+#
+# A compiled pattern.
+#
+############################################################
+
+class Pattern:
+
+    def __init__( self, text ):
+        self.text = text
+        compiler = _Compiler( text )
+        self.run = compiler.path( 'anywhere' )
+        if ( compiler.at < len( compiler.tokens ) ):
+            compiler.error( 'unexpected ' + repr( compiler.tokens[ compiler.at ][ 1 ] ) )
+
+    ############################################################
+    # Every match in one tree, as ( node, bindings ).
+    ############################################################
+    def search( self, tree ):
+        if ( tree == None ):
+            return []
+        return list( _unique( self.run( tree, (), {} ) ) )
+
+    def first( self, tree ):
+        if ( tree != None ):
+            for match in _unique( self.run( tree, (), {} ) ):
+                return match
+        return None
+
+    def matches( self, tree ):
+        return self.first( tree ) != None
+
+    ############################################################
+    # A batch of trees: ( index of the tree, node, bindings ) for
+    # every match. Trees that are None are skipped.
+    ############################################################
+    def search_many( self, trees ):
+        for index, tree in enumerate( trees ):
+            if ( tree != None ):
+                for node, bindings in _unique( self.run( tree, (), {} ) ):
+                    yield ( index, node, bindings )
+
+    def __repr__( self ):
+        return 'Pattern(' + repr( self.text ) + ')'
+
+_patterns = {}
+
+def compile_pattern( text ):
+    pattern = _patterns.get( text )
+    if ( pattern == None ):
+        pattern = Pattern( text )
+        _patterns[ text ] = pattern
+    return pattern
+
+############################################################
+# Shorthand: every match of "text" in "tree", and just the nodes.
+############################################################
+def query( text, tree ):
+    return compile_pattern( text ).search( tree )
+
+def query_nodes( text, tree ):
+    return [ node for node, bindings in compile_pattern( text ).search( tree ) ]
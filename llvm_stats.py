@@ -0,0 +1,312 @@
+# ============================================================
+#
+# Corpus statistics: what is in this module, in one pass.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# The instruction mix of a whole file (or lots of them):
+#
+#    kinds        instructions of each kind (CallInst, LoadInst, ...),
+#                 split into value instructions and the others the
+#                 way instruction.py does it
+#    types        every type written in an instruction, outermost
+#                 ones only ("[4 x i8]*", not the "[4 x i8]" in it)
+#    callees      who gets called: "@name", or "(indirect)" through a
+#                 local, or "(inline asm)"
+#    attributes   function, parameter and return attributes, by name
+#                 ("nonnull", "align", "#13", "\"frame-pointer\"")
+#    metadata     attached metadata kinds ("!tbaa", "!dbg")
+#    failures     lines that look like an instruction but didn't
+#                 parse, by the kind we guess from the opcode
+#    other_lines  lines that aren't instructions this parser knows
+#                 ("define", "br", "ret", "}"), by their first word
+#
+# Nothing is kept but the counts. The lines go through block_parse a
+# bufferful at a time, the counts are taken and the trees dropped.
+# The trees have weak parents and the collector is off while parsing
+# (see bulk_parsing), so each bufferful is freed as soon as it is
+# dropped and the collector never goes looking through it. The
+# README has what that saves.
+# A CorpusStats merges with another one (merge()), so pieces can be
+# counted anywhere and added up after; collect_file() does exactly
+# that over byte ranges of one big file, a worker process per range.
+#
+#    stats = llvm_stats.collect_file( 'module.ll', workers = 8 )
+#    print( stats.report() )
+#
+# Run "python llvm_stats.py [--workers N] [--json] corpus.ll ..." for
+# the report on some files (added together).
+#
+# ============================================================
+
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+
+import llvm_instruction_parser as parser
+import llvm_emit
+
+_value_kinds = frozenset( parser.value_instruction_types )
+
+# The layers a Type goes through before it gets to the real thing,
+# so "Type" is as far down as we need to look.
+_type_nodes = frozenset( [ 'Type', 'ConcreteType' ] )
+_attribute_nodes = frozenset( [ 'FuncAttr', 'ParamAttr', 'ReturnAttr' ] )
+
+def _first_terminal( node ):
+    while ( not node.was_terminal ):
+        node = node.children[ 0 ]
+    return node.nodetype
+
+############################################################
+# What a line that isn't an instruction starts with, past any
+# "%x =" (so "fneg", not "%x").
+############################################################
+def _first_word( line ):
+    m = parser._opcode_re.match( line )
+    if ( m != None ):
+        return m.group( 1 )
+    return line.split( None, 1 )[ 0 ]
+
+############################################################
+# Who a call calls, from the Value of a CallInst.
+############################################################
+def _callee( value ):
+    what = value.children[ 0 ]
+    if ( what.nodetype == 'LocalIdent' ):
+        return '(indirect)'
+    if ( what.nodetype == 'InlineAsm' ):
+        return '(inline asm)'
+    # A plain @name, or one inside a bitcast.
+    found = what.locate_tree_node( 'GlobalIdent' )
+    if ( found == None ):
+        return '(indirect)'
+    return _first_terminal( found )
+
+class CorpusStats:
+
+    def __init__( self ):
+        self.lines = 0
+        self.kinds = collections.Counter()
+        self.types = collections.Counter()
+        self.callees = collections.Counter()
+        self.attributes = collections.Counter()
+        self.metadata = collections.Counter()
+        self.failures = collections.Counter()
+        self.other_lines = collections.Counter()
+
+    def instructions( self ):
+        return sum( self.kinds.values() )
+
+    ############################################################
+    # Count one parsed instruction.
+    ############################################################
+    def add_tree( self, tree ):
+        kind = parser._tree_kind( tree )
+        self.kinds[ kind ] += 1
+        types = self.types
+        work = [ tree.children[ -1 ] ]
+        while ( len( work ) > 0 ):
+            here = work.pop()
+            if ( here.was_terminal ):
+                continue
+            name = here.nodetype
+            if ( name in _type_nodes ):
+                types[ llvm_emit.emit( here ) ] += 1
+                continue
+            if ( name in _attribute_nodes ):
+                self.attributes[ _first_terminal( here ) ] += 1
+                continue
+            if ( name == 'MetadataAttachment' ):
+                self.metadata[ _first_terminal( here ) ] += 1
+                continue
+            if ( name == 'CallInst' ):
+                for kid in here.children:
+                    if ( kid.nodetype == 'Value' ):
+                        self.callees[ _callee( kid ) ] += 1
+                        break
+            work.extend( here.children )
+
+    ############################################################
+    # A batch of lines. Only the ones that start like an instruction
+    # get parsed; the rest are just counted.
+    ############################################################
+    def add_lines( self, lines, context = None ):
+        if ( context == None ):
+            context = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error,
+                                           weak_parents = True )
+        chunk = []
+        for line in lines:
+            line = line.strip()
+            if ( line == '' or line[ 0 ] == ';' ):
+                continue
+            self.lines = self.lines + 1
+            if ( parser.guess_instruction_kind( line ) == None ):
+                self.other_lines[ _first_word( line ) ] += 1
+            else:
+                chunk.append( line )
+        if ( len( chunk ) == 0 ):
+            return
+        with parser.bulk_parsing():
+            trees = parser.block_parse( '\n'.join( chunk ), context = context )
+        # One for each line, or the counts go on the wrong instructions.
+        if ( len( trees ) != len( chunk ) ):
+            raise RuntimeError( 'block_parse gave ' + str( len( trees ) ) + ' trees for ' +
+                                str( len( chunk ) ) + ' lines' )
+        for line, tree in zip( chunk, trees ):
+            if ( tree == None ):
+                self.failures[ parser.guess_instruction_kind( line ) ] += 1
+            else:
+                self.add_tree( tree )
+
+    ############################################################
+    # Everything from a file (or anything that gives lines), a
+    # bufferful at a time.
+    ############################################################
+    def add_file( self, file, buffer_lines = 4096 ):
+        context = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error,
+                                       weak_parents = True )
+        chunk = []
+        for line in file:
+            chunk.append( line )
+            if ( len( chunk ) >= buffer_lines ):
+                self.add_lines( chunk, context )
+                chunk = []
+                # The errors would pile up in the context otherwise.
+                context.errors = []
+        self.add_lines( chunk, context )
+
+    ############################################################
+    # Add "other" (from another worker, say) into this one.
+    ############################################################
+    def merge( self, other ):
+        self.lines = self.lines + other.lines
+        self.kinds.update( other.kinds )
+        self.types.update( other.types )
+        self.callees.update( other.callees )
+        self.attributes.update( other.attributes )
+        self.metadata.update( other.metadata )
+        self.failures.update( other.failures )
+        self.other_lines.update( other.other_lines )
+        return self
+
+    ############################################################
+    # As plain dicts, most common first (for json.dump).
+    ############################################################
+    def as_dict( self ):
+        value = sum( [ n for kind, n in self.kinds.items() if kind in _value_kinds ] )
+        return { 'lines' : self.lines,
+                 'instructions' : self.instructions(),
+                 'value_instructions' : value,
+                 'other_instructions' : self.instructions() - value,
+                 'failed' : sum( self.failures.values() ),
+                 'kinds' : dict( self.kinds.most_common() ),
+                 'types' : dict( self.types.most_common() ),
+                 'callees' : dict( self.callees.most_common() ),
+                 'attributes' : dict( self.attributes.most_common() ),
+                 'metadata' : dict( self.metadata.most_common() ),
+                 'failures' : dict( self.failures.most_common() ),
+                 'other_lines' : dict( self.other_lines.most_common() ) }
+
+    ############################################################
+    # The report, as text: the "top" most common of each.
+    ############################################################
+    def report( self, top = 20 ):
+        summary = self.as_dict()
+        total = summary[ 'instructions' ]
+        out = []
+        out.append( 'Lines                ' + str( summary[ 'lines' ] ) )
+        out.append( 'Instructions         ' + str( total ) )
+        out.append( '  value instructions ' + str( summary[ 'value_instructions' ] ) )
+        out.append( '  other instructions ' + str( summary[ 'other_instructions' ] ) )
+        out.append( 'Did not parse        ' + str( summary[ 'failed' ] ) )
+        def section( title, counter, percent ):
+            out.append( '' )
+            out.append( title + ' (' + str( len( counter ) ) + ' different)' )
+            for name, n in counter.most_common( top ):
+                line = '  ' + str( n ).rjust( 10 ) + '  '
+                if ( percent and total > 0 ):
+                    line = line + ( '%5.1f%%  ' % ( 100.0 * n / total ) )
+                out.append( line + str( name ) )
+        section( 'Instruction kinds', self.kinds, True )
+        section( 'Types', self.types, False )
+        section( 'Callees', self.callees, False )
+        section( 'Attributes', self.attributes, False )
+        section( 'Metadata kinds', self.metadata, False )
+        if ( len( self.failures ) > 0 ):
+            section( 'Did not parse', self.failures, False )
+        if ( len( self.other_lines ) > 0 ):
+            section( 'Other lines', self.other_lines, False )
+        return '\n'.join( out ) + '\n'
+
+# ============================================================
+#
+# A big file in pieces. Each worker gets a byte range and takes the
+# lines that start in it (so a line cut in two by a boundary belongs
+# to the range it starts in), and sends back its CorpusStats.
+#
+# ============================================================
+
+def _range_lines( filename, begin, end ):
+    with open( filename, 'rb' ) as file:
+        pos = begin
+        if ( begin > 0 ):
+            # Back up one, in case "begin" is right at the start of a
+            # line, and skip to the end of that line.
+            file.seek( begin - 1 )
+            pos = begin - 1 + len( file.readline() )
+        while ( pos < end ):
+            line = file.readline()
+            if ( len( line ) == 0 ):
+                break
+            pos = pos + len( line )
+            yield line.decode( 'utf-8', 'replace' )
+
+def _collect_range( filename, begin, end, buffer_lines ):
+    stats = CorpusStats()
+    stats.add_file( _range_lines( filename, begin, end ), buffer_lines )
+    return stats
+
+def collect_file( filename, workers = None, buffer_lines = 4096 ):
+    if ( workers == None ):
+        workers = os.cpu_count() or 1
+    size = os.path.getsize( filename )
+    if ( workers <= 1 or size < ( 1 << 20 ) ):
+        return _collect_range( filename, 0, size, buffer_lines )
+    # Build (and write out) the parse tables here first, so the
+    # workers don't all try to at once.
+    parser.block_parse( '', context = parser.ParseContext( error_sink = parser.discard_error ) )
+    step = size // workers + 1
+    stats = CorpusStats()
+    with concurrent.futures.ProcessPoolExecutor( max_workers = workers ) as pool:
+        pieces = [ pool.submit( _collect_range, filename, begin, min( begin + step, size ), buffer_lines )
+                   for begin in range( 0, size, step ) ]
+        for piece in pieces:
+            stats.merge( piece.result() )
+    return stats
+
+if __name__ == "__main__":
+    workers = None
+    as_json = False
+    files = []
+    args = sys.argv[1:]
+    while ( len( args ) > 0 ):
+        arg = args.pop( 0 )
+        if ( arg == '--workers' ):
+            workers = int( args.pop( 0 ) )
+        elif ( arg == '--json' ):
+            as_json = True
+        else:
+            files.append( arg )
+    stats = CorpusStats()
+    for corpus in files:
+        stats.merge( collect_file( corpus, workers ) )
+    if ( as_json ):
+        json.dump( stats.as_dict(), sys.stdout, indent = 1 )
+        print()
+    else:
+        sys.stdout.write( stats.report() )
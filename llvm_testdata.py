@@ -0,0 +1,49 @@
+# ============================================================
+#
+# Instructions to try things out on. instruction.py, the tests and
+# the benchmarks all use these.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+# These make no sense because I just copy/pasted them out of all
+# sorts of places.
+testdata = [
+    '%buf.i.i = alloca [250 x i8], align 16',
+    '%yymsgbuf = alloca [128 x i8], align 16',
+    '%yyvsa = alloca [200 x i8*], align 16',
+    '%ref.tmp = alloca %"class.std::__cxx11::basic_string", align 8',
+    '%0 = getelementptr inbounds [128 x i8], [128 x i8]* %yymsgbuf, i64 0, i64 0',
+    'call void @llvm.lifetime.start.p0i8(i64 128, i8* nonnull %0) #13',
+    '%1 = bitcast [200 x i16]* %yyssa to i8*',
+    '%arraydecay1 = getelementptr inbounds [200 x i16], [200 x i16]* %yyssa, i64 0, i64 0',
+    '%2 = bitcast [200 x i8*]* %yyvsa to i8*',
+    '%arraydecay2 = getelementptr inbounds [200 x i8*], [200 x i8*]* %yyvsa, i64 0, i64 0',
+    '%3 = load i32, i32* @expressionyydebug, align 4, !tbaa !2',
+    '%tobool = icmp eq i32 %3, 0',
+    '%_IO_read_ptr = getelementptr inbounds %struct._IO_FILE, %struct._IO_FILE* %__fp, i64 0, i32 1',
+    '%0 = load i8*, i8** %_IO_read_ptr, align 8, !tbaa !6',
+    '%_IO_read_end = getelementptr inbounds %struct._IO_FILE, %struct._IO_FILE* %__fp, i64 0, i32 2',
+    '%1 = load i8*, i8** %_IO_read_end, align 8, !tbaa !11',
+    '%cmp = icmp ult i8* %0, %1',
+    '%call9 = call i32 (%struct._IO_FILE*, i8*, ...) @fprintf(%struct._IO_FILE* %9, i8* getelementptr inbounds ([19 x i8], [19 x i8]* @.str.1, i64 0, i64 0), i32 %yystate.1832) #14'
+]
+
+# These are from the compiler explorer web site, the "sander" little
+# function, with instructions that are syntactically identical
+# removed.
+sander = [
+    "%3 = alloca i32, align 4",
+    # Both the old kind (pre version 15) and the new kind:
+    "store i32 %0, i32* %3, align 4",
+    "store i32 %0, ptr %3, align 4",
+    # Both the old kind (pre version 15) and the new kind:
+    "%6 = load i32, i32* %3, align 4",
+    "%6 = load i32, ptr %3, align 4",
+    "%8 = icmp slt i32 %6, %7",
+    "%10 = load i32, i32* %3, align 4",
+    "%14 = phi i32 [ %10, %9 ], [ %12, %11 ]",
+    "store i32 %14, i32* %5, align 4",
+    "%16 = shl i32 %15, 2",
+]
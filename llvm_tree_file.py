@@ -0,0 +1,307 @@
+# ============================================================
+#
+# A compact binary file format for parse trees.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+#
+# tree_as_string can't be read back (and can't tell a terminal from
+# a nonterminal with no children), and dot files are for looking at.
+# This is a file of any number of trees that can be written quickly,
+# and read back one tree at a time: the file is memory mapped, and
+# a tree is only decoded when it is asked for, by its index.
+#
+#    with llvm_tree_file.TreeWriter( 'module.trees' ) as writer:
+#        for line in lines:
+#            writer.write( parser.inst_parse( line ) )
+#
+#    trees = llvm_tree_file.TreeReader( 'module.trees' )
+#    len( trees ), trees[ 12345 ]
+#
+# The layout:
+#
+#    magic     "LLVMTREE" and a format version byte
+#    trees     one after the other
+#    nodetypes the nonterminal names, each one once
+#    strings   the terminal strings, each one once
+#    index     the offset of each tree, and of the end of the last,
+#              as 8 byte little endian numbers
+#    footer    the offsets of nodetypes, strings and index, the
+#              number of trees, and the magic again (also 8 bytes
+#              each)
+#
+# A tree is its nodes in preorder. Each node starts with a varint
+# (LEB128) which is ( n << 2 ) | flags, where flags has 1 for a
+# terminal and 2 for an epsilon. For a terminal, n is the number of
+# its text in the string table; otherwise it is the number of its
+# nodetype, and another varint with the number of children follows.
+# Strings are a varint count, then for each a varint length and the
+# UTF-8 bytes. A tree that is None (it didn't parse) takes no bytes
+# at all.
+#
+# Trees come back through the parser's own make_node, so they look
+# just like a fresh parse in the context you give (serial numbers,
+# flyweights and all). The title and line of a node are not kept.
+#
+# ============================================================
+
+import mmap
+import struct
+
+import llvm_instruction_parser as parser
+
+_magic = b'LLVMTREE'
+_version = 1
+_footer = struct.Struct( '<QQQQ8s' )
+# Where a tree starts, and where the next one does.
+_span = struct.Struct( '<QQ' )
+
+_terminal = 1
+_epsilon = 2
+
+def _put_varint( out, n ):
+    while ( n >= 0x80 ):
+        out.append( ( n & 0x7f ) | 0x80 )
+        n = n >> 7
+    out.append( n )
+
+############################################################
+# A varint from "data" at "pos". Returns ( value, next pos ).
+############################################################
+def _get_varint( data, pos ):
+    byte = data[ pos ]
+    if ( byte < 0x80 ):
+        return ( byte, pos + 1 )
+    n = byte & 0x7f
+    shift = 7
+    while True:
+        pos = pos + 1
+        byte = data[ pos ]
+        n = n | ( ( byte & 0x7f ) << shift )
+        if ( byte < 0x80 ):
+            return ( n, pos + 1 )
+        shift = shift + 7
+
+def _put_strings( out, strings ):
+    _put_varint( out, len( strings ) )
+    for x in strings:
+        raw = x.encode( 'utf-8' )
+        _put_varint( out, len( raw ) )
+        out.extend( raw )
+
+def _get_strings( data, pos ):
+    count, pos = _get_varint( data, pos )
+    strings = []
+    for i in range( 0, count ):
+        size, pos = _get_varint( data, pos )
+        strings.append( bytes( data[ pos:pos + size ] ).decode( 'utf-8' ) )
+        pos = pos + size
+    return strings
+
+def _skip_strings( data, pos ):
+    count, pos = _get_varint( data, pos )
+    for i in range( 0, count ):
+        size, pos = _get_varint( data, pos )
+        pos = pos + size
+    return pos
+
+############################################################
+# Encoding one tree, with the tables that go with it.
+############################################################
+class _Encoder:
+
+    def __init__( self ):
+        self.nodetypes = {}
+        self.strings = {}
+
+    def encode( self, tree, out ):
+        work = [ tree ]
+        while ( len( work ) > 0 ):
+            node = work.pop()
+            if ( node.was_terminal ):
+                n = self.strings.setdefault( node.nodetype, len( self.strings ) )
+                flags = _terminal | ( _epsilon if node.is_epsilon else 0 )
+                _put_varint( out, ( n << 2 ) | flags )
+            else:
+                n = self.nodetypes.setdefault( node.nodetype, len( self.nodetypes ) )
+                flags = _epsilon if node.is_epsilon else 0
+                _put_varint( out, ( n << 2 ) | flags )
+                kids = node.children
+                _put_varint( out, len( kids ) )
+                work.extend( reversed( kids ) )
+
+    def tables( self, out ):
+        _put_strings( out, list( self.nodetypes ) )
+        _put_strings( out, list( self.strings ) )
+
+############################################################
+# And decoding. Children are made before their parent, like the
+# parser does, so the serial numbers match.
+############################################################
+def _decode( data, pos, nodetypes, strings ):
+    # Each entry is ( header, children still to come, children so
+    # far ) for a nonterminal whose children are being decoded. No
+    # recursion, so a deep tree is fine.
+    work = []
+    while True:
+        header, pos = _get_varint( data, pos )
+        if ( header & _terminal ):
+            if ( header & _epsilon ):
+                node = parser.make_empty()
+            else:
+                node = strings[ header >> 2 ]
+        else:
+            count, pos = _get_varint( data, pos )
+            if ( count > 0 ):
+                work.append( ( header, count, [] ) )
+                continue
+            node = parser.make_node( nodetypes[ header >> 2 ], [] )
+            if ( header & _epsilon ):
+                node.is_epsilon = True
+        # Hand the node to its parent, and make each parent that now
+        # has all of its children.
+        while ( len( work ) > 0 ):
+            header, count, kids = work[ -1 ]
+            kids.append( node )
+            if ( len( kids ) < count ):
+                break
+            work.pop()
+            node = parser.make_node( nodetypes[ header >> 2 ], kids )
+            if ( header & _epsilon ):
+                node.is_epsilon = True
+        if ( len( work ) == 0 ):
+            return ( node, pos )
+
+############################################################
+# One tree to bytes and back, without any file.
+############################################################
+def dumps( tree ):
+    encoder = _Encoder()
+    body = bytearray()
+    encoder.encode( tree, body )
+    out = bytearray()
+    encoder.tables( out )
+    out.extend( body )
+    return bytes( out )
+
+def loads( data, context = None ):
+    if ( context == None ):
+        context = parser.ParseContext()
+    nodetypes = _get_strings( data, 0 )
+    pos = _skip_strings( data, 0 )
+    strings = _get_strings( data, pos )
+    pos = _skip_strings( data, pos )
+    with parser.using_context( context ):
+        return _decode( data, pos, nodetypes, strings )[ 0 ]
+
+# ============================================================
+#
+# Writing a file. Trees go straight out (through a buffer); only the
+# tables and the index are kept until close().
+#
+# ============================================================
+
+class TreeWriter:
+
+    def __init__( self, filename, buffer_size = 1 << 20 ):
+        self.file = open( filename, 'wb' )
+        self.buffer_size = buffer_size
+        self.encoder = _Encoder()
+        self.out = bytearray( _magic )
+        self.out.append( _version )
+        self.offsets = []
+        self.written = 0
+
+    def write( self, tree ):
+        self.offsets.append( self.written + len( self.out ) )
+        if ( tree != None ):
+            self.encoder.encode( tree, self.out )
+        if ( len( self.out ) >= self.buffer_size ):
+            self.__drain()
+
+    def __drain( self ):
+        self.file.write( self.out )
+        self.written = self.written + len( self.out )
+        self.out = bytearray()
+
+    def close( self ):
+        if ( self.file == None ):
+            return
+        end = self.written + len( self.out )
+        self.offsets.append( end )
+        nodetypes_at = end
+        tables = bytearray()
+        _put_strings( tables, list( self.encoder.nodetypes ) )
+        strings_at = nodetypes_at + len( tables )
+        _put_strings( tables, list( self.encoder.strings ) )
+        index_at = nodetypes_at + len( tables )
+        self.out.extend( tables )
+        self.out.extend( struct.pack( '<' + str( len( self.offsets ) ) + 'Q', *self.offsets ) )
+        self.out.extend( _footer.pack( nodetypes_at, strings_at, index_at, len( self.offsets ) - 1, _magic ) )
+        self.__drain()
+        self.file.close()
+        self.file = None
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, kind, value, traceback ):
+        self.close()
+
+# ============================================================
+#
+# Reading one. Opening it only reads the tables; each tree is
+# decoded when you index it. Give a context to get( i, context ) to
+# number the nodes on from somewhere (or to use a TypeTable, ...);
+# otherwise each tree gets a fresh one.
+#
+# ============================================================
+
+class TreeReader:
+
+    def __init__( self, filename ):
+        self.file = open( filename, 'rb' )
+        self.data = mmap.mmap( self.file.fileno(), 0, access = mmap.ACCESS_READ )
+        if ( self.data[ 0:len( _magic ) ] != _magic or self.data[ len( _magic ) ] != _version ):
+            raise ValueError( filename + ' is not a tree file (or is a different version)' )
+        nodetypes_at, strings_at, index_at, count, magic = _footer.unpack_from( self.data, len( self.data ) - _footer.size )
+        if ( magic != _magic ):
+            raise ValueError( filename + ' is not a complete tree file' )
+        self.nodetypes = _get_strings( self.data, nodetypes_at )
+        self.strings = _get_strings( self.data, strings_at )
+        self.count = count
+        self.index_at = index_at
+
+    def __len__( self ):
+        return self.count
+
+    def get( self, i, context = None ):
+        if ( i < 0 ):
+            i = i + self.count
+        if ( i < 0 or i >= self.count ):
+            raise IndexError( 'tree index out of range' )
+        start, end = _span.unpack_from( self.data, self.index_at + i * 8 )
+        if ( start == end ):
+            return None
+        if ( context == None ):
+            context = parser.ParseContext()
+        with parser.using_context( context ):
+            return _decode( self.data, start, self.nodetypes, self.strings )[ 0 ]
+
+    def __getitem__( self, i ):
+        return self.get( i )
+
+    def __iter__( self ):
+        for i in range( 0, self.count ):
+            yield self.get( i )
+
+    def close( self ):
+        self.data.close()
+        self.file.close()
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, kind, value, traceback ):
+        self.close()
@@ -0,0 +1,42 @@
+# ============================================================
+#
+# Test setup: the modules are plain files at the top of the tree,
+# and inst_parse writes parselog.txt wherever it is run from, so the
+# tests run from a scratch directory. (The parse tables go next to
+# the parser, as they always do.)
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
+
+import llvm_testdata
+
+@pytest.fixture( autouse = True, scope = 'session' )
+def _scratch( tmp_path_factory ):
+    here = os.getcwd()
+    os.chdir( tmp_path_factory.mktemp( 'tables' ) )
+    yield
+    os.chdir( here )
+
+# All the instructions instruction.py tries out.
+testdata = llvm_testdata.testdata + llvm_testdata.sander
+
+############################################################
+# Everything about a tree that a mode might get wrong: the class,
+# nodetype, serial and flags of each node, and whether its parent
+# is the node it hangs under (shared nodes have none).
+############################################################
+def shape( node, parent = None ):
+    link = ( node.parent is parent ) if node.serial != None else None
+    out = [ ( type( node ).__name__, node.nodetype, node.serial, node.was_terminal, node.is_epsilon, link,
+              len( node.children ) ) ]
+    for x in node.children:
+        out = out + shape( x, node )
+    return out
@@ -0,0 +1,37 @@
+# ============================================================
+#
+# AST mode: no punctuation and no (empty)s in the tree.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import pytest
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata, shape
+
+############################################################
+# AST mode has straight-line actions of its own (with flyweights
+# or not). With hashes on it goes through Node() instead, so the
+# two have to build the very same trees.
+############################################################
+@pytest.mark.parametrize( 'mode', [ { 'ast' : True }, { 'ast' : True, 'flyweights' : True } ] )
+def test_ast_actions_match_node( mode ):
+    for line in testdata:
+        fast = parser.fragment_parse( 'Instruction', line, context = parser.ParseContext( **mode ) )
+        slow = parser.fragment_parse( 'Instruction', line, context = parser.ParseContext( hashes = True, **mode ) )
+        assert shape( fast ) == shape( slow ), line
+
+def test_ast_drops_punctuation_and_empties():
+    for line in testdata:
+        tree = parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( ast = True ) )
+        for node, parent in tree.walk():
+            assert not node.is_epsilon, line
+            assert not ( node.was_terminal and node.nodetype in parser.ast_punctuation ), line
+
+def test_ast_keeps_the_rest():
+    tree = parser.inst_parse( '%x = add nsw i32 %a, 1', yacc_debug = False, context = parser.ParseContext( ast = True ) )
+    leaves = [ node.nodetype for node, parent in tree.walk() if node.was_terminal ]
+    assert leaves == [ '%x', '=', 'add', 'nsw', 'i32', '%a', '1' ]
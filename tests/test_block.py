@@ -0,0 +1,32 @@
+# ============================================================
+#
+# Whole blocks through block_parse and parse_stream.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata
+
+############################################################
+# A bad line in a block is None and only that line is: an
+# unterminated quote mustn't take the lines after it along.
+############################################################
+def test_block_parse_keeps_lines_apart():
+    block = [ '%a = add i32 1, 2', '%b = add i32 "x', '%c = add i32 3, 4',
+              '%d = call void @"y(i32 1)', '%e = add i32 5, 6' ]
+    quiet = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error )
+    trees = parser.block_parse( '\n'.join( block ), context = quiet )
+    assert [ t.children[ 0 ].children[ 0 ].nodetype if t != None else None for t in trees ] == \
+        [ '%a', None, '%c', None, '%e' ]
+    for number, line, tree in parser.parse_stream( block, quiet ):
+        assert ( tree == None ) == ( '"' in line )
+        if ( tree != None ):
+            assert tree.children[ 0 ].children[ 0 ].nodetype == line.split()[ 0 ]
+
+def test_block_parse_matches_line_by_line():
+    trees = parser.block_parse( '\n'.join( testdata ) )
+    for line, tree in zip( testdata, trees ):
+        assert tree.tree_as_string() == parser.inst_parse( line, yacc_debug = False ).tree_as_string()
@@ -0,0 +1,139 @@
+# ============================================================
+#
+# bulk_parsing and weak parents.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import gc
+import threading
+import weakref
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata, shape
+
+def test_collector_off_inside_and_back_after():
+    assert gc.isenabled()
+    threshold = gc.get_threshold()
+    with parser.bulk_parsing():
+        assert not gc.isenabled()
+        with parser.bulk_parsing():
+            assert not gc.isenabled()
+        # Still in the outer one.
+        assert not gc.isenabled()
+    assert gc.isenabled() and gc.get_threshold() == threshold
+
+def test_threshold_instead_of_off():
+    threshold = gc.get_threshold()
+    with parser.bulk_parsing( threshold = 100000 ):
+        assert gc.isenabled() and gc.get_threshold()[ 0 ] == 100000
+    assert gc.get_threshold() == threshold
+
+############################################################
+# Inside another one, bulk_parsing goes along with what the outer
+# one did to the collector.
+############################################################
+def test_outer_mode_wins():
+    threshold = gc.get_threshold()
+    with parser.bulk_parsing( threshold = 100000 ):
+        with parser.bulk_parsing():
+            assert gc.isenabled() and gc.get_threshold()[ 0 ] == 100000
+        assert gc.isenabled() and gc.get_threshold()[ 0 ] == 100000
+    with parser.bulk_parsing():
+        with parser.bulk_parsing( threshold = 100000 ):
+            assert not gc.isenabled() and gc.get_threshold() == threshold
+    assert gc.isenabled() and gc.get_threshold() == threshold
+
+############################################################
+# The collection for freeze can take a long time on a big heap, and
+# nobody else going in or out should wait on it.
+############################################################
+def test_freeze_collects_outside_the_lock():
+    locked = []
+    def callback( phase, info ):
+        if ( phase == 'start' ):
+            locked.append( parser._bulk_lock.locked() )
+    gc.callbacks.append( callback )
+    try:
+        with parser.bulk_parsing( freeze = True ):
+            kept = parser.parse_many( testdata )
+    finally:
+        gc.callbacks.remove( callback )
+        gc.unfreeze()
+    assert len( locked ) > 0 and not any( locked )
+    assert gc.isenabled() and len( kept ) == len( testdata )
+
+def test_collector_stays_off_until_the_last_thread():
+    inside = threading.Event()
+    leave = threading.Event()
+    def other():
+        with parser.bulk_parsing():
+            inside.set()
+            leave.wait()
+    thread = threading.Thread( target = other )
+    thread.start()
+    inside.wait()
+    with parser.bulk_parsing():
+        pass
+    assert not gc.isenabled()
+    leave.set()
+    thread.join()
+    assert gc.isenabled()
+
+def test_bulk_parsing_gives_the_same_trees():
+    with parser.bulk_parsing():
+        trees = parser.parse_many( testdata )
+    for line, tree in zip( testdata, trees ):
+        assert shape( tree ) == shape( parser.inst_parse( line, yacc_debug = False ) )
+
+############################################################
+# Weak parents: the same tree, no cycles, so dropping the root
+# frees the lot without the collector.
+############################################################
+def test_weak_parents_same_tree():
+    for line in testdata:
+        weak = parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( weak_parents = True ) )
+        assert shape( weak ) == shape( parser.inst_parse( line, yacc_debug = False ) ), line
+        # (The root has no parent to point at, weakly or not.)
+        for node, parent in weak.walk():
+            assert parent == None or 'parent' not in node.__dict__
+
+def test_weak_parents_freed_without_collector():
+    with parser.bulk_parsing():
+        tree = parser.inst_parse( testdata[ 17 ], yacc_debug = False,
+                                  context = parser.ParseContext( weak_parents = True ) )
+        leaf = weakref.ref( tree.children[ -1 ].children[ 0 ] )
+        tree = None
+        assert leaf() == None
+
+def test_subtree_outlives_its_parent():
+    tree = parser.inst_parse( testdata[ 0 ], yacc_debug = False, context = parser.ParseContext( weak_parents = True ) )
+    inst = tree.children[ -1 ]
+    assert inst.parent is tree
+    tree = None
+    gc.collect()
+    assert inst.parent == None
+
+def test_weak_parents_in_a_block():
+    text = '\n'.join( testdata )
+    weak = parser.block_parse( text, context = parser.ParseContext( weak_parents = True ) )
+    strong = parser.block_parse( text )
+    for line, one, two in zip( testdata, weak, strong ):
+        assert shape( one ) == shape( two ), line
+
+############################################################
+# Shared nodes hang under many trees, so weakening one tree must
+# not give them a parent in it.
+############################################################
+def test_weaken_parents_leaves_shared_nodes_alone():
+    context = parser.ParseContext( flyweights = True, type_table = parser.TypeTable() )
+    one = parser.inst_parse( '%1 = alloca [4 x i8], align 4', yacc_debug = False, context = context )
+    two = parser.inst_parse( '%2 = alloca [4 x i8], align 4', yacc_debug = False, context = context )
+    parser.weaken_parents( [ one, two ] )
+    shared = [ x for x, parent in one.walk() if x.serial == None or isinstance( x, parser.SharedType ) ]
+    assert len( shared ) > 0
+    for x in shared:
+        assert '_parent_ref' not in x.__dict__ and x.parent == None
+    assert one.locate_tree_node( 'Type' ) is two.locate_tree_node( 'Type' )
@@ -0,0 +1,46 @@
+# ============================================================
+#
+# Trees back to text (llvm_emit).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import io
+
+import pytest
+
+import llvm_instruction_parser as parser
+import llvm_emit
+
+from conftest import testdata
+
+############################################################
+# Every line goes round, and comes back exactly as written. Blank
+# lines, comments and lines that don't parse are passed over.
+############################################################
+def test_round_trip():
+    checked, same_text = llvm_emit.round_trip_test( testdata )
+    assert checked == len( testdata ) and same_text == len( testdata )
+    extra = [ '', '; a comment', '%x = add i32 1,' ]
+    assert llvm_emit.round_trip_test( extra + testdata[ :3 ] ) == ( 3, 3 )
+
+def test_ast_and_lazy_trees():
+    ast = parser.ParseContext( ast = True )
+    for line in testdata:
+        assert llvm_emit.emit( parser.inst_parse( line, yacc_debug = False, context = ast ) ) == line
+        assert llvm_emit.emit( parser.lazy_inst_parse( line ) ) == line
+
+def test_emit_many():
+    trees = [ parser.inst_parse( line, yacc_debug = False ) for line in testdata ] + [ None ]
+    for buffer_size in [ 1, 100, 1 << 20 ]:
+        out = io.StringIO()
+        llvm_emit.emit_many( trees, out, none_text = '; none', buffer_size = buffer_size )
+        assert out.getvalue() == '\n'.join( testdata + [ '; none' ] ) + '\n'
+
+def test_children_that_fit_no_production():
+    tree = parser.inst_parse( '%x = add i32 %a, 1', yacc_debug = False, context = parser.ParseContext( ast = True ) )
+    add = tree.locate_tree_node( 'AddInst' )
+    add.children = add.children[ :1 ]
+    with pytest.raises( ValueError ):
+        llvm_emit.emit( tree )
@@ -0,0 +1,71 @@
+# ============================================================
+#
+# ParseError's, and where they go.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import io
+
+import llvm_instruction_parser as parser
+
+def errors_for( line, **options ):
+    context = parser.ParseContext( error_sink = parser.discard_error, **options )
+    tree = parser.inst_parse( line, yacc_debug = False, context = context )
+    assert tree == None
+    return context.errors
+
+def test_syntax_error():
+    errors = errors_for( '%x = add i32 1, 2 )' )
+    assert len( errors ) == 1
+    error = errors[ 0 ]
+    assert ( error.kind, error.token_type, error.token_value ) == ( 'syntax', ')', ')' )
+    assert ( error.position, error.line, error.column ) == ( 18, 1, 19 )
+    assert error.expected == [ '$end', ',' ]
+    assert error.instruction == 'AddInst' and error.source == '%x = add i32 1, 2 )'
+
+def test_error_at_end():
+    error = errors_for( '%x = add i32 1,' )[ 0 ]
+    assert ( error.token_type, error.token_value, error.position, error.column ) == ( '$end', None, 15, 16 )
+    assert 'local_ident' in error.expected
+
+def test_illegal_character():
+    error = errors_for( '%x = add i32 ^ 1' )[ 0 ]
+    assert ( error.kind, error.token_value, error.position, error.column ) == ( 'illegal character', '^', 13, 14 )
+
+def test_illegal_token():
+    error = errors_for( 'entry:' )[ 0 ]
+    assert ( error.kind, error.token_type, error.token_value ) == ( 'illegal token', 'label_ident', 'entry:' )
+
+############################################################
+# The checks in the actions (p_ArrayType and friends) say which
+# token was wrong.
+############################################################
+def test_semantic_error():
+    errors = errors_for( '%x = alloca [4 y i8]' )
+    assert errors[ 0 ].kind == 'semantic'
+    assert ( errors[ 0 ].token_value, errors[ 0 ].position, errors[ 0 ].line, errors[ 0 ].column ) == ( 'y', 15, 1, 16 )
+    assert errors[ 0 ].instruction == 'AllocaInst'
+
+############################################################
+# In a block the line and column are the bad line's, and the
+# position counts from the start of the block (not the newline
+# block_parse puts in front).
+############################################################
+def test_block_error_position():
+    text = '%a = add i32 1, 2\n%b = add i32 1, )\n%c = add i32 3, 4'
+    context = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error )
+    trees = parser.block_parse( text, context = context )
+    assert [ t == None for t in trees ] == [ False, True, False ]
+    error = context.errors[ 0 ]
+    assert text[ error.position ] == ')'
+    assert ( error.line, error.column, error.source ) == ( 2, 17, '%b = add i32 1, )' )
+
+def test_write_errors_to():
+    out = io.StringIO()
+    context = parser.ParseContext( error_sink = parser.write_errors_to( out ) )
+    parser.inst_parse( '%x = add i32 1, 2 )', yacc_debug = False, context = context )
+    parser.inst_parse( '%x = add i32 ^ 1', yacc_debug = False, context = context )
+    assert out.getvalue() == ''.join( [ e.message + '\n' for e in context.errors ] )
+    assert context.number_of_errors == len( context.errors ) == 3
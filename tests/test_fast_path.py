@@ -0,0 +1,61 @@
+# ============================================================
+#
+# The fast path against the full parser.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import os
+
+import pytest
+
+import llvm_instruction_parser as parser
+import llvm_fast_path
+
+from conftest import testdata, shape
+
+def test_fast_path_agrees():
+    taken, declined = llvm_fast_path.differential_test( testdata )
+    assert taken > 0 and taken + declined == len( testdata )
+
+############################################################
+# In each mode the fast path runs the actions the parser would have,
+# so the nodes are the same right down to the order their
+# attributes were set in.
+############################################################
+@pytest.mark.parametrize( 'mode', [ {}, { 'flyweights' : True }, { 'ast' : True },
+                                    { 'ast' : True, 'flyweights' : True }, { 'hashes' : True } ] )
+def test_fast_path_modes( mode ):
+    taken = 0
+    for line in testdata:
+        fast = llvm_fast_path.fast_path_parse( line, parser.ParseContext( **mode ) )
+        if ( fast == None ):
+            continue
+        taken = taken + 1
+        full = parser.fragment_parse( 'Instruction', line, context = parser.ParseContext( **mode ) )
+        assert shape( fast ) == shape( full ), line
+        assert [ list( x.__dict__ ) for x, p in fast.walk() ] == [ list( x.__dict__ ) for x, p in full.walk() ], line
+    assert taken > 0
+
+def test_fast_path_uses_generated_actions():
+    for line in testdata:
+        llvm_fast_path.fast_path_parse( line )
+    generated = set( parser._generated_actions.values() )
+    used = [ run for ( mode, action, shape ), run in llvm_fast_path._production_actions.items()
+             if mode == None and type( shape ) is tuple ]
+    assert len( used ) > 0
+    assert all( [ run in generated or parser._plain_nodetype( run ) == None for run in used ] )
+
+############################################################
+# A line the fast path hands back goes to the full parser, which
+# must not write its debugging log.
+############################################################
+def test_fallback_writes_no_log():
+    line = testdata[ 5 ]
+    assert llvm_fast_path.fast_path_parse( line ) == None
+    if ( os.path.exists( 'parselog.txt' ) ):
+        os.remove( 'parselog.txt' )
+    tree = llvm_fast_path.fast_inst_parse( line )
+    assert tree.tree_as_string() == parser.inst_parse( line, yacc_debug = False ).tree_as_string()
+    assert not os.path.exists( 'parselog.txt' )
@@ -0,0 +1,94 @@
+# ============================================================
+#
+# Feature rows (llvm_features).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import pytest
+
+numpy = pytest.importorskip( 'numpy' )
+
+import llvm_instruction_parser as parser
+import llvm_features
+
+from conftest import testdata
+
+def named_row( features, line ):
+    row = features.row( parser.inst_parse( line, yacc_debug = False ) )
+    named = dict( zip( [ name for name, kind in llvm_features.columns ], row ) )
+    named[ 'opcode' ] = features.opcodes.names[ named[ 'opcode' ] ]
+    named[ 'result_type' ] = features.types.names[ named[ 'result_type' ] ]
+    return named
+
+def test_rows():
+    features = llvm_features.FeatureExtractor()
+    assert named_row( features, '%3 = load volatile i32, i32* %2, align 4, !tbaa !2' ) == \
+        { 'opcode': 'LoadInst', 'result_type': 'int', 'operands': 1, 'constants': 0, 'gep_indices': 0,
+          'alignment': 4, 'volatile': 1, 'atomic': 0, 'metadata': 1, 'parsed': 1 }
+    assert named_row( features, 'store atomic i32 %0, i32* %3 seq_cst, align 4' ) == \
+        { 'opcode': 'StoreInst', 'result_type': 'void', 'operands': 2, 'constants': 0, 'gep_indices': 0,
+          'alignment': 4, 'volatile': 0, 'atomic': 1, 'metadata': 0, 'parsed': 1 }
+    assert named_row( features, testdata[ 4 ] ) == \
+        { 'opcode': 'GetElementPtrInst', 'result_type': 'pointer', 'operands': 3, 'constants': 2, 'gep_indices': 2,
+          'alignment': 0, 'volatile': 0, 'atomic': 0, 'metadata': 0, 'parsed': 1 }
+    assert named_row( features, 'call void @f(i32 1, i8* %p) #13' )[ 'operands' ] == 3
+    assert named_row( features, '%c = icmp eq i32 %a, 0' )[ 'result_type' ] == 'int'
+    assert features.row( None ) == ( -1, 0, 0, 0, 0, 0, 0, 0, 0, 0 )
+    for line in testdata:
+        assert named_row( features, line )[ 'opcode' ] == parser.guess_instruction_kind( line ), line
+
+############################################################
+# The codes start out the same every time, and a new name gets the
+# next one.
+############################################################
+def test_categories():
+    codes = llvm_features.Categories( [ 'a', 'b' ] )
+    assert ( codes.code( 'b' ), codes.code( 'c' ), codes.code( 'a' ), codes.code( 'c' ) ) == ( 1, 2, 0, 2 )
+    assert codes.names == [ 'a', 'b', 'c' ] and len( codes ) == 3
+    one = llvm_features.FeatureExtractor()
+    two = llvm_features.FeatureExtractor()
+    assert one.opcodes.names == two.opcodes.names == llvm_features.instruction_kinds
+    assert one.types.names == llvm_features.type_classes
+
+############################################################
+# Text, lines and trees all give the same rows, however they were
+# chunked and however big the block had to grow.
+############################################################
+def test_add_text_and_lines( tmp_path ):
+    lines = testdata + [ '', '%x = add i32 1,' ] + testdata
+    trees = [ parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( error_sink = parser.discard_error ) )
+              for line in lines if line != '' ]
+    by_tree = llvm_features.FeatureExtractor( capacity = 4, chunk = 3 )
+    by_tree.add_many( trees )
+    by_text = llvm_features.FeatureExtractor()
+    by_text.add_text( '\n'.join( lines ) )
+    corpus = tmp_path / 'corpus.ll'
+    corpus.write_text( '\n'.join( lines ) + '\n' )
+    by_lines = llvm_features.FeatureExtractor( chunk = 5 )
+    with open( corpus ) as f:
+        by_lines.add_lines( f, buffer_lines = 7 )
+    assert len( by_tree ) == len( by_text ) == len( by_lines ) == len( trees )
+    expect = by_tree.structured()
+    assert ( by_text.structured() == expect ).all() and ( by_lines.structured() == expect ).all()
+    assert list( expect[ 'parsed' ] ) == [ tree != None for tree in trees ]
+
+def test_save( tmp_path ):
+    features = llvm_features.FeatureExtractor()
+    features.add_text( '\n'.join( testdata ) )
+    columns = features.columns()
+    assert [ str( columns[ name ].dtype ) for name, kind in llvm_features.columns ] == \
+        [ kind for name, kind in llvm_features.columns ]
+    for compressed in [ False, True ]:
+        npz = str( tmp_path / ( 'module%d.npz' % compressed ) )
+        features.save( npz, compressed )
+        with numpy.load( npz ) as saved:
+            for name, kind in llvm_features.columns:
+                assert ( saved[ name ] == columns[ name ] ).all()
+            assert list( saved[ 'opcode_names' ] ) == features.opcodes.names
+            assert list( saved[ 'result_type_names' ] ) == features.types.names
+    features.save( str( tmp_path / 'module.npy' ) )
+    assert ( numpy.load( str( tmp_path / 'module.npy' ) ) == features.structured() ).all()
+    with numpy.load( str( tmp_path / 'module_names.npz' ) ) as names:
+        assert sorted( names.files ) == [ 'opcode_names', 'result_type_names' ]
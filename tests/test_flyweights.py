@@ -0,0 +1,38 @@
+# ============================================================
+#
+# Flyweights: the leaves and (empty)s that are the same everywhere
+# are one shared node each.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata, shape
+
+############################################################
+# Flyweights have straight-line actions of their own. With hashes
+# on they go through Node() instead, so the two have to build the
+# very same trees.
+############################################################
+def test_flyweight_actions_match_node():
+    for line in testdata:
+        fast = parser.fragment_parse( 'Instruction', line, context = parser.ParseContext( flyweights = True ) )
+        slow = parser.fragment_parse( 'Instruction', line,
+                                      context = parser.ParseContext( flyweights = True, hashes = True ) )
+        assert shape( fast ) == shape( slow ), line
+
+def test_flyweights_are_shared():
+    context = parser.ParseContext( flyweights = True )
+    one = parser.inst_parse( '%x = add i32 4, 4', yacc_debug = False, context = context )
+    two = parser.inst_parse( '%y = add i32 5, 6', yacc_debug = False, context = context )
+    ones = [ x for x, parent in one.walk() if x.serial == None ]
+    twos = [ x for x, parent in two.walk() if x.serial == None ]
+    assert len( ones ) > 0
+    assert any( [ x is y for x in ones for y in twos ] )
+
+def test_flyweights_same_text():
+    for line in testdata:
+        shared = parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( flyweights = True ) )
+        assert shared.tree_as_string() == parser.inst_parse( line, yacc_debug = False ).tree_as_string(), line
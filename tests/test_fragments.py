@@ -0,0 +1,66 @@
+# ============================================================
+#
+# The fragment entry points: a Type, Constant, Value, Metadata or
+# SpecializedMDNode on its own.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import pytest
+
+import llvm_instruction_parser as parser
+
+def quiet():
+    return parser.ParseContext( error_sink = parser.discard_error )
+
+@pytest.mark.parametrize( 'parse, text, top', [
+    ( parser.parse_type, 'i32', 'FirstClassType' ),
+    ( parser.parse_type, '[4 x i8]*', 'FirstClassType' ),
+    ( parser.parse_type, '{ i32, i8* }', 'FirstClassType' ),
+    ( parser.parse_constant, '42', 'IntConst' ),
+    ( parser.parse_constant, 'zeroinitializer', 'ZeroInitializerConst' ),
+    ( parser.parse_constant, 'getelementptr inbounds ([19 x i8], [19 x i8]* @.str.1, i64 0, i64 0)', 'ConstantExpr' ),
+    ( parser.parse_value, '%x', 'LocalIdent' ),
+    ( parser.parse_value, '@g', 'Constant' ),
+    ( parser.parse_metadata, '!2', 'MetadataID' ),
+    ( parser.parse_metadata, '!{i32 1}', 'MDTuple' ),
+    ( parser.parse_metadata, '!"str"', 'MDString' ),
+    ( parser.parse_specialized_md_node, '!DILocation(line: 3, column: 7, scope: !4)', 'DILocation' ) ] )
+def test_fragment_parses( parse, text, top ):
+    context = quiet()
+    tree = parse( text, context = context )
+    assert tree != None and context.errors == []
+    assert tree.children[ 0 ].nodetype == top
+
+############################################################
+# Anything left over (or in front) is an error and no tree, even
+# where PLY could have got past it by dropping tokens.
+############################################################
+@pytest.mark.parametrize( 'parse, text', [
+    ( parser.parse_type, 'i32 )' ),
+    ( parser.parse_type, 'i32 i32' ),
+    ( parser.parse_constant, 'null extra' ),
+    ( parser.parse_constant, 'i32 5' ),
+    ( parser.parse_value, '%x %y' ),
+    ( parser.parse_metadata, '!2 !3' ),
+    ( parser.parse_specialized_md_node, '!DILocation(line: 3) x' ),
+    ( parser.parse_specialized_md_node, '!2' ) ] )
+def test_fragment_rejects( parse, text ):
+    context = quiet()
+    assert parse( text, context = context ) == None
+    assert len( context.errors ) > 0
+
+def test_instruction_rejects_leading_garbage():
+    context = quiet()
+    assert parser.inst_parse( ', %x = add i32 1, 2', yacc_debug = False, context = context ) == None
+    assert context.number_of_errors == 1
+
+############################################################
+# A fragment is the same subtree the instruction would have had.
+############################################################
+def test_fragment_matches_instruction():
+    tree = parser.inst_parse( '%p = alloca [4 x i8], align 1', yacc_debug = False )
+    alloca = tree.locate_tree_node( 'AllocaInst' )
+    kind = [ x for x in alloca.children if x.nodetype == 'Type' ][ 0 ]
+    assert parser.parse_type( '[4 x i8]' ).tree_as_string() == kind.tree_as_string()
@@ -0,0 +1,122 @@
+# ============================================================
+#
+# Graphviz output for many trees (llvm_graph).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import os
+import re
+
+import llvm_instruction_parser as parser
+import llvm_graph
+
+from conftest import testdata
+
+def parsed( line ):
+    return parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( error_sink = parser.discard_error ) )
+
+############################################################
+# The nodes (name to label) and the edges in some dot text.
+############################################################
+def nodes_and_edges( text ):
+    nodes = dict( re.findall( r'^\t\t(\w+) \[label="((?:[^"\\]|\\.)*)"', text, re.M ) )
+    edges = re.findall( r'^\t\t(\w+) -> (\w+);$', text, re.M )
+    return ( nodes, edges )
+
+def depth_of( tree ):
+    most = 0
+    work = [ ( tree, 0 ) ]
+    while ( len( work ) > 0 ):
+        node, depth = work.pop()
+        most = max( most, depth )
+        work.extend( [ ( kid, depth + 1 ) for kid in node.children ] )
+    return most
+
+def test_write_dot( tmp_path ):
+    lines = testdata[ :5 ] + [ '%x = add i32 1,' ]
+    trees = [ parsed( line ) for line in lines ]
+    filename = str( tmp_path / 'function.dot' )
+    llvm_graph.write_dot( trees, filename, labels = lines )
+    text = open( filename ).read()
+    assert text.startswith( 'digraph llvm_parse {\n' ) and text.endswith( '}\n' )
+    clusters = text.split( '\tsubgraph cluster_' )[ 1: ]
+    assert len( clusters ) == len( lines )
+    for t, ( line, tree, cluster ) in enumerate( zip( lines, trees, clusters ) ):
+        assert '\t\tlabel="' + parser.dot_escape( line ) + '";\n' in cluster
+        nodes, edges = nodes_and_edges( cluster )
+        assert all( name.startswith( 'n' + str( t ) + '_' ) for name in nodes )
+        if ( tree == None ):
+            assert list( nodes.values() ) == [ '(did not parse)' ] and edges == []
+            continue
+        walked = list( tree.walk() )
+        assert len( nodes ) == len( walked ) and len( edges ) == len( walked ) - 1
+        assert [ label.split( '\\n' )[ 0 ] for label in nodes.values() ] == \
+            [ parser.dot_escape( x.nodetype ) for x, parent in walked ]
+
+def test_write_dot_directory( tmp_path ):
+    trees = [ parsed( line ) for line in testdata[ :3 ] ]
+    directory = str( tmp_path / 'graphs' )
+    names = llvm_graph.write_dot_directory( trees, directory, first = 0 )
+    assert names == [ os.path.join( directory, 'tree_' + str( t ) + '.dot' ) for t in range( 0, 3 ) ]
+    for name, tree in zip( names, trees ):
+        nodes, edges = nodes_and_edges( open( name ).read() )
+        assert len( nodes ) == len( list( tree.walk() ) )
+    # Again, over the top of the old ones.
+    assert llvm_graph.write_dot_directory( trees[ :1 ], directory, pattern = 'tree_{}.dot', first = 0 ) == names[ :1 ]
+
+############################################################
+# Cut off at a depth: nothing below it, and a "..." for each node
+# whose children were left out.
+############################################################
+def test_max_depth( tmp_path ):
+    tree = parsed( testdata[ 17 ] )
+    filename = str( tmp_path / 'deep.dot' )
+    llvm_graph.write_dot( [ tree ], filename, max_depth = 3 )
+    nodes, edges = nodes_and_edges( open( filename ).read() )
+    kept = 0
+    cut = 0
+    work = [ ( tree, 0 ) ]
+    while ( len( work ) > 0 ):
+        node, depth = work.pop()
+        kept = kept + 1
+        if ( len( node.children ) > 0 ):
+            if ( depth >= 3 ):
+                cut = cut + 1
+            else:
+                work.extend( [ ( kid, depth + 1 ) for kid in node.children ] )
+    assert depth_of( tree ) > 3
+    assert len( nodes ) == kept + cut and len( edges ) == kept + cut - 1
+    assert list( nodes.values() ).count( '...' ) == cut
+
+def test_max_nodes( tmp_path ):
+    trees = [ parsed( line ) for line in testdata[ :2 ] ]
+    filename = str( tmp_path / 'small.dot' )
+    llvm_graph.write_dot( trees, filename, max_nodes = 5 )
+    for t, cluster in enumerate( open( filename ).read().split( '\tsubgraph cluster_' )[ 1: ] ):
+        nodes, edges = nodes_and_edges( cluster )
+        assert len( nodes ) == 6 and nodes[ 'n' + str( t ) + '_more' ] == '...'
+        assert len( edges ) == 5
+    # A limit bigger than the tree changes nothing.
+    llvm_graph.write_dot( trees, filename, max_nodes = 10000 )
+    nodes, edges = nodes_and_edges( open( filename ).read() )
+    assert '...' not in nodes.values()
+
+############################################################
+# Quotes and backslashes (as in a c"..." string) can't end the label
+# early, and '%' is escaped too.
+############################################################
+def test_dot_escape( tmp_path ):
+    assert parser.dot_escape( 'say "hi"' ) == 'say \\"hi\\"'
+    assert parser.dot_escape( 'c"a\\0A\\"' ) == 'c\\"a\\\\0A\\\\\\"'
+    assert parser.dot_escape( '%x' ) == '\\%x'
+    line = 'store [3 x i8] c"a\\22\\5C", [3 x i8]* %p, align 1'
+    tree = parsed( line )
+    filename = str( tmp_path / 'escape.dot' )
+    llvm_graph.write_dot( [ tree ], filename, labels = [ line ] )
+    nodes, edges = nodes_and_edges( open( filename ).read() )
+    unescaped = [ re.sub( r'\\(.)', r'\1', label.split( '\\n' )[ 0 ] ) for label in nodes.values() ]
+    assert '"a\\22\\5C"' in unescaped and '%p' in unescaped
+    label = re.search( r'^\t\tlabel="((?:[^"\\]|\\.)*)";$', open( filename ).read(), re.M ).group( 1 )
+    assert re.sub( r'\\(.)', r'\1', label ) == line
@@ -0,0 +1,86 @@
+# ============================================================
+#
+# Structural hashes (ParseContext( hashes = True )), same_as,
+# same_shape_as and dedup.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import pytest
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata
+
+def hashed( line, **options ):
+    return parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( hashes = True, **options ) )
+
+############################################################
+# The exact hash goes with tree_as_string, and is the same whatever
+# else the trees were parsed with.
+############################################################
+def test_exact_hash():
+    trees = [ hashed( line ) for line in testdata ]
+    for a in trees:
+        for b in trees:
+            same = ( a.tree_as_string() == b.tree_as_string() )
+            assert ( a.exact_hash == b.exact_hash ) == same
+            assert a.same_as( b ) == same
+    assert hashed( testdata[ 0 ] ).exact_hash == hashed( testdata[ 0 ], flyweights = True ).exact_hash
+
+def test_subtree_hashes():
+    tree = hashed( '%x = add i32 %y, %y' )
+    one, two = [ node for node, parent in tree.walk() if node.nodetype == 'LocalIdent' ][ 1: ]
+    assert one.exact_hash == two.exact_hash and one.same_as( two )
+
+############################################################
+# The shape hash is blind to the identifiers. Integers count
+# unless they are asked not to.
+############################################################
+def test_shape_hash_ignores_identifiers():
+    a = hashed( '%3 = add i32 %1, 4' )
+    b = hashed( '%x = add i32 %y, 4' )
+    c = hashed( '%x = add i32 %y, 12' )
+    d = hashed( '%x = sub i32 %y, 4' )
+    assert a.exact_hash != b.exact_hash and not a.same_as( b )
+    assert a.shape_hash == b.shape_hash and a.same_shape_as( b )
+    assert a.shape_hash != c.shape_hash and not a.same_shape_as( c )
+    assert a.shape_hash != d.shape_hash and not a.same_shape_as( d )
+
+def test_anonymous_literals():
+    a = hashed( '%3 = add i32 %1, 4', anonymous_literals = True )
+    c = hashed( '%x = add i32 %y, 12', anonymous_literals = True )
+    assert a.shape_hash == c.shape_hash and a.same_shape_as( c )
+    assert a.exact_hash != c.exact_hash
+    # Parsed the other way, the literal still counts.
+    assert not a.same_shape_as( hashed( '%x = add i32 %y, 12' ) )
+
+############################################################
+# The structural check is there for when two hashes are the same
+# but the trees aren't.
+############################################################
+def test_structure_checked_on_equal_hashes():
+    a = hashed( '%x = add i32 %y, 4' )
+    b = hashed( '%x = add i32 %y, 5' )
+    b.exact_hash = a.exact_hash
+    b.shape_hash = a.shape_hash
+    assert not a.same_as( b ) and not a.same_shape_as( b )
+
+def test_dedup():
+    lines = [ '%1 = add i32 %a, 4', '%1 = add i32 %a, 4', '%2 = add i32 %b, 4', '%3 = add i32 %c, 5',
+              '%4 = load i32, i32* %p, align 4' ]
+    trees = [ hashed( line ) for line in lines ]
+    assert parser.dedup( trees ) == [ trees[ 0 ], trees[ 2 ], trees[ 3 ], trees[ 4 ] ]
+    assert parser.dedup( trees, shape = True ) == [ trees[ 0 ], trees[ 3 ], trees[ 4 ] ]
+    blind = [ hashed( line, anonymous_literals = True ) for line in lines ]
+    assert parser.dedup( blind, shape = True ) == [ blind[ 0 ], blind[ 4 ] ]
+
+def test_no_hashes_is_an_error():
+    plain = parser.inst_parse( testdata[ 0 ], yacc_debug = False )
+    with pytest.raises( ValueError, match = 'hashes = True' ):
+        plain.same_as( hashed( testdata[ 0 ] ) )
+    with pytest.raises( ValueError, match = 'hashes = True' ):
+        hashed( testdata[ 0 ] ).same_shape_as( plain )
+    with pytest.raises( ValueError, match = 'hashes = True' ):
+        parser.dedup( [ plain ] )
@@ -0,0 +1,117 @@
+# ============================================================
+#
+# JSON Lines export (llvm_json_lines).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import io
+import json
+
+import llvm_instruction_parser as parser
+import llvm_json_lines
+
+from conftest import testdata
+
+############################################################
+# A full record, walked the way Node.walk() goes: nodetypes in
+# preorder, with None for an epsilon.
+############################################################
+def json_walk( tree ):
+    out = []
+    work = [ tree ]
+    while ( len( work ) > 0 ):
+        here = work.pop()
+        if ( here == None or type( here ) is str ):
+            out.append( here )
+        else:
+            out.append( here[ 0 ] )
+            work.extend( reversed( here[ 1: ] ) )
+    return out
+
+def tree_walk( tree ):
+    return [ None if x.is_epsilon else x.nodetype for x, parent in tree.walk() ]
+
+def test_full_records():
+    out = io.StringIO()
+    with llvm_json_lines.JSONLinesWriter( out ) as writer:
+        for line in testdata:
+            writer.write( parser.inst_parse( line, yacc_debug = False ), line )
+        writer.write( None )
+    records = [ json.loads( x ) for x in out.getvalue().splitlines() ]
+    assert len( records ) == len( testdata ) + 1 == writer.written
+    for line, record in zip( testdata, records ):
+        assert list( record ) == [ 'source', 'tree' ] and record[ 'source' ] == line
+        assert json_walk( record[ 'tree' ] ) == tree_walk( parser.inst_parse( line, yacc_debug = False ) ), line
+    assert records[ -1 ] == { 'tree': None }
+
+def test_summary_records():
+    writer = llvm_json_lines.JSONLinesWriter( io.StringIO(), summary = True )
+    def summary( line ):
+        return writer.record( parser.inst_parse( line, yacc_debug = False ) )
+    assert summary( '%3 = load i32, i32* %2, align 4, !tbaa !2' ) == \
+        { 'kind': 'LoadInst', 'lhs': '%3', 'types': [ 'i32', 'i32*' ], 'operands': [ '%2' ] }
+    assert summary( 'call void @f(i32 1, i8* %p) #13' ) == \
+        { 'kind': 'CallInst', 'lhs': None, 'types': [ 'void', 'i32', 'i8*' ], 'operands': [ '@f', '1', '%p' ] }
+    assert summary( 'store i32 %0, i32* %3, align 4' ) == \
+        { 'kind': 'StoreInst', 'lhs': None, 'types': [ 'i32', 'i32*' ], 'operands': [ '%0', '%3' ] }
+    assert writer.record( None, 'junk' ) == { 'source': 'junk', 'kind': None }
+    for line in testdata:
+        assert summary( line )[ 'kind' ] == parser.guess_instruction_kind( line ), line
+
+############################################################
+# The writer holds lines until it has a bufferful, and then writes
+# them all at once.
+############################################################
+class CountingFile( io.StringIO ):
+
+    def __init__( self ):
+        io.StringIO.__init__( self )
+        self.writes = 0
+
+    def write( self, text ):
+        self.writes = self.writes + 1
+        return io.StringIO.write( self, text )
+
+def test_buffered_writer():
+    tree = parser.inst_parse( testdata[ 0 ], yacc_debug = False )
+    size = len( llvm_json_lines._encoder.encode( { 'tree': llvm_json_lines.tree_as_json( tree ) } ) ) + 1
+    out = CountingFile()
+    writer = llvm_json_lines.JSONLinesWriter( out, buffer_size = size * 3 )
+    writer.write_many( [ tree ] * 2 )
+    assert out.writes == 0
+    writer.write( tree )
+    assert out.writes == 1 and len( out.getvalue() ) == size * 3
+    writer.write_many( [ tree, None ], [ 'a', 'b' ] )
+    writer.close()
+    assert out.writes == 2 and not out.closed
+    lines = out.getvalue().split( '\n' )
+    assert lines[ -1 ] == '' and len( lines ) == 6
+    assert json.loads( lines[ 4 ] ) == { 'source': 'b', 'tree': None }
+    # Closing again does nothing.
+    writer.close()
+
+############################################################
+# A whole file: blank lines and comments are left out, and a line
+# that doesn't parse is still there, with a null.
+############################################################
+def test_export_file( tmp_path ):
+    corpus = tmp_path / 'corpus.ll'
+    lines = testdata[ :4 ] + [ '', '; a comment', '%x = add i32 1,' ] + testdata[ 4: ]
+    corpus.write_text( '\n'.join( lines ) + '\n' )
+    kept = [ line for line in lines if line not in [ '', '; a comment' ] ]
+    quiet = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error )
+    out = str( tmp_path / 'corpus.ndjson' )
+    assert llvm_json_lines.export_file( str( corpus ), out, context = quiet, buffer_lines = 5 ) == len( kept )
+    with open( out ) as f:
+        records = [ json.loads( x ) for x in f ]
+    assert [ r[ 'source' ] for r in records ] == kept
+    assert [ r[ 'tree' ] == None for r in records ] == [ line == '%x = add i32 1,' for line in kept ]
+    assert quiet.number_of_errors == 1
+    summary = io.StringIO()
+    quiet = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error )
+    assert llvm_json_lines.export_file( str( corpus ), summary, summary = True, context = quiet ) == len( kept )
+    records = [ json.loads( x ) for x in summary.getvalue().splitlines() ]
+    assert [ r[ 'kind' ] for r in records ] == \
+        [ None if line == '%x = add i32 1,' else parser.guess_instruction_kind( line ) for line in kept ]
@@ -0,0 +1,59 @@
+# ============================================================
+#
+# Lazy nodes (lazy_inst_parse).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import os
+
+import pytest
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata
+
+############################################################
+# Once the lazy nodes have parsed themselves the tree is the one
+# inst_parse gives. (Not the serial numbers: the lazy pieces are
+# numbered when they get parsed.)
+############################################################
+def test_lazy_tree_matches():
+    for line in testdata:
+        lazy = parser.lazy_inst_parse( line )
+        full = parser.inst_parse( line, yacc_debug = False )
+        assert lazy.tree_as_string() == full.tree_as_string(), line
+        assert [ ( x.nodetype, x.was_terminal, x.is_epsilon ) for x, p in lazy.walk() ] == \
+            [ ( x.nodetype, x.was_terminal, x.is_epsilon ) for x, p in full.walk() ], line
+
+def test_lazy_nodes_have_text():
+    line = '%x = load i32, i32* %p, align 4, !tbaa !2'
+    tree = parser.lazy_inst_parse( line )
+    lazy = [ x for x in tree.children[ -1 ].children[ 0 ].children if isinstance( x, parser.LazyNode ) ]
+    assert len( lazy ) == 1 and lazy[ 0 ].text( line ) == None
+    for node, parent in tree.walk():
+        node.text( line )
+    assert tree.tree_as_string() == parser.inst_parse( line, yacc_debug = False ).tree_as_string()
+
+############################################################
+# A trailer that won't parse makes the whole line not parse, just
+# like it does for inst_parse, and it is reported once.
+############################################################
+@pytest.mark.parametrize( 'line', [
+    '%x = load i32, i32* %p, align 4, !tbaa',
+    '%x = load i32, i32* %p, align 4, !tbaa !2 !3',
+    '%x = load i32, i32* %p, align 4, !tbaa !2, !range',
+    'call void @f(i32 1) #13 )',
+    'call void @f(i32 1) nounwind [ "x"(i32 1) ' ] )
+def test_lazy_rejects_bad_trailer( line ):
+    context = parser.ParseContext( error_sink = parser.discard_error )
+    assert parser.lazy_inst_parse( line, context = context ) == None
+    assert context.number_of_errors == 1
+
+def test_lazy_writes_no_log():
+    if ( os.path.exists( 'parselog.txt' ) ):
+        os.remove( 'parselog.txt' )
+    parser.lazy_inst_parse( testdata[ 10 ] )
+    parser.lazy_inst_parse( testdata[ 5 ] )
+    assert not os.path.exists( 'parselog.txt' )
@@ -0,0 +1,115 @@
+# ============================================================
+#
+# Predicate pushdown (LineFilter), through parse_stream,
+# block_parse and parse_many.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata
+
+def test_kinds_go_through_opcodes():
+    calls = parser.LineFilter( kinds = [ 'call', 'StoreInst', 'load' ] )
+    assert calls.kinds == frozenset( [ 'CallInst', 'StoreInst', 'LoadInst' ] )
+    assert calls.kinds == frozenset( [ parser._opcode_kinds[ x ] for x in [ 'call', 'store', 'load' ] ] )
+    for line in testdata:
+        assert calls.keep( line ) == ( parser.guess_instruction_kind( line ) in calls.kinds ), line
+
+############################################################
+# A mention is a whole token, whether it is settled by the look at
+# the next character or (with a string or a comment in the line, or
+# a mention that isn't an identifier) by the lexer.
+############################################################
+def test_mentions_whole_tokens():
+    a = parser.LineFilter( mentions = '%a' )
+    assert a.whole != None
+    assert a.keep( '%x = add i32 %a, 1' )
+    assert a.keep( '%x = add i32 %b, %a' )
+    assert not a.keep( '%x = add i32 %ab, 1' )
+    assert not a.keep( '%x = add i32 %a.b, 1' )
+    assert not a.keep( '%x = add i32 %ab, 1 ; %a' )
+    assert a.keep( '%x = add i32 %a, 1 ; %ab' )
+    assert not a.keep( 'call void @f(i8* getelementptr ([3 x i8], [3 x i8]* @"%a", i64 0, i64 0), i32 %ab)' )
+    assert a.keep( 'call void @f(i8* getelementptr ([3 x i8], [3 x i8]* @"%ab", i64 0, i64 0), i32 %a)' )
+    nonnull = parser.LineFilter( mentions = [ 'nonnull' ] )
+    assert nonnull.whole == None
+    assert nonnull.keep( testdata[ 5 ] )
+    assert not nonnull.keep( 'call void @nonnull(i8* %0)' )
+
+def test_pattern_and_tokens():
+    wide = parser.LineFilter( pattern = r'\[\d{3} x', tokens = lambda found: ( 'int_type', 'i16' ) in
+                              [ ( kind, value ) for kind, value, pos in found ] )
+    assert [ line for line in testdata if wide.keep( line ) ] == [ testdata[ 6 ], testdata[ 7 ] ]
+    both = parser.LineFilter( kinds = [ 'getelementptr' ], mentions = '%yyvsa' )
+    assert [ line for line in testdata if both.keep( line ) ] == [ testdata[ 9 ] ]
+
+############################################################
+# Blank lines and comments are neither parsed nor skipped.
+############################################################
+def test_select_counts():
+    loads = parser.LineFilter( kinds = [ 'load' ] )
+    lines = [ '', '; a comment' ] + testdata
+    kept = loads.select( lines )
+    wanted = [ ( i, line ) for i, line in enumerate( lines ) if parser.guess_instruction_kind( line ) == 'LoadInst' ]
+    assert kept == wanted
+    assert loads.counts() == { 'parsed': len( wanted ), 'skipped': len( testdata ) - len( wanted ) }
+    loads.reset()
+    assert ( loads.parsed, loads.skipped ) == ( 0, 0 )
+
+def test_parse_stream():
+    calls = parser.LineFilter( kinds = [ 'CallInst' ] )
+    lines = [ '', '; a comment' ] + testdata + [ '', 'call void @f(i32 1,' ] + testdata
+    context = parser.ParseContext( resync_lines = True, line_filter = calls, error_sink = parser.discard_error )
+    found = list( parser.parse_stream( lines, context, buffer_lines = 5 ) )
+    wanted = [ i for i, line in enumerate( lines ) if parser.guess_instruction_kind( line ) == 'CallInst' ]
+    assert [ number for number, line, tree in found ] == wanted
+    assert [ tree == None for number, line, tree in found ] == [ lines[ i ] == 'call void @f(i32 1,' for i in wanted ]
+    for number, line, tree in found:
+        if ( tree != None ):
+            assert tree.tree_as_string() == parser.inst_parse( line, yacc_debug = False ).tree_as_string()
+    nonblank = len( [ line for line in lines if line not in [ '', '; a comment' ] ] )
+    assert calls.counts() == { 'parsed': len( wanted ), 'skipped': nonblank - len( wanted ) }
+    assert context.number_of_errors == 1
+
+def test_parse_many():
+    threes = parser.LineFilter( mentions = '%3' )
+    lines = testdata + [ '' ]
+    trees = parser.parse_many( lines, threads = 2, line_filter = threes )
+    assert len( trees ) == len( lines )
+    for line, tree in zip( lines, trees ):
+        if ( line != '' and threes.keep( line ) ):
+            assert tree.tree_as_string() == parser.inst_parse( line, yacc_debug = False ).tree_as_string()
+        else:
+            assert tree == None
+    kept = len( [ line for line in testdata if threes.keep( line ) ] )
+    assert kept > 0
+    assert threes.counts()[ 'skipped' ] == len( testdata ) - threes.counts()[ 'parsed' ] == len( testdata ) - kept
+
+############################################################
+# Through block_parse the skipped lines are blanked out, so the
+# errors on the kept lines still have the right line numbers, and
+# the spans (with spaces for the skipped lines) are still right too.
+############################################################
+def test_blank_out_keeps_lines_and_spans():
+    bad = '%bad = load i32, i32* %p, align'
+    lines = testdata[ :4 ] + [ bad ] + testdata[ 4: ]
+    text = '\n'.join( lines )
+    picked = parser.LineFilter( kinds = [ 'load', 'alloca' ] )
+    assert picked.blank_out( text ).split( '\n' ) == [ line if picked.keep( line ) else '' for line in lines ]
+    assert picked.blank_out( text, True ).split( '\n' ) == \
+        [ line if picked.keep( line ) else ' ' * len( line ) for line in lines ]
+    picked.reset()
+    context = parser.ParseContext( resync_lines = True, spans = True, line_filter = picked, error_sink = parser.discard_error )
+    trees = parser.block_parse( text, context = context )
+    kept = [ line for line in lines if picked.keep( line ) ]
+    assert len( trees ) == len( kept )
+    for line, tree in zip( kept, trees ):
+        if ( line == bad ):
+            assert tree == None
+        else:
+            assert tree.text( text ) == line
+    assert [ ( e.line, e.source ) for e in context.errors ] == [ ( 5, bad ) ]
+    assert picked.counts() == { 'parsed': len( kept ), 'skipped': len( lines ) - len( kept ) }
@@ -0,0 +1,97 @@
+# ============================================================
+#
+# The service Metrics (llvm_metrics).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import pytest
+
+import llvm_instruction_parser as parser
+import llvm_fast_path
+import llvm_metrics
+
+@pytest.fixture
+def metrics():
+    metrics = llvm_metrics.enable_metrics()
+    yield metrics
+    llvm_metrics.disable_metrics()
+
+def test_metrics_count_parses( metrics ):
+    quiet = parser.ParseContext( error_sink = parser.discard_error )
+    parser.inst_parse( '%1 = load i32, i32* %p, align 4', yacc_debug = False, context = quiet )
+    parser.inst_parse( '%2 = select i1 %c, i32 1, i32 2', yacc_debug = False, context = quiet )
+    parser.inst_parse( '%3 = select i1 %c, i32 1,', yacc_debug = False, context = quiet )
+    snap = metrics.snapshot()
+    assert snap[ 'instructions_parsed' ] == 2
+    assert snap[ 'failures' ] == { 'syntax' : 1 }
+    assert snap[ 'nodes_allocated' ] == quiet.serial
+    assert snap[ 'tokens_lexed' ] > 0
+    # Parsed or not, a select is a SelectInst.
+    assert sorted( snap[ 'latency' ] ) == [ 'LoadInst', 'SelectInst' ]
+    assert snap[ 'latency' ][ 'SelectInst' ][ 'count' ] == 2
+    assert llvm_metrics.current_metrics() is metrics
+
+def test_metrics_fast_path( metrics ):
+    llvm_fast_path.fast_inst_parse( '%1 = load i32, i32* %p, align 4', yacc_debug = False )
+    llvm_fast_path.fast_inst_parse( '%2 = select i1 %c, i32 1, i32 2', yacc_debug = False )
+    assert metrics.snapshot()[ 'fast_path' ] == { 'taken' : 1, 'declined' : 1 }
+
+def test_prometheus_output( metrics ):
+    parser.inst_parse( '%1 = load i32, i32* %p, align 4', yacc_debug = False )
+    text = metrics.prometheus()
+    lines = text.splitlines()
+    assert 'llvm_parser_instructions_parsed_total 1' in lines
+    assert '# TYPE llvm_parser_parse_seconds histogram' in lines
+    assert 'llvm_parser_parse_seconds_count{kind="LoadInst"} 1' in lines
+    assert 'llvm_parser_parse_seconds_bucket{kind="LoadInst",le="+Inf"} 1' in lines
+    # Every sample is a name (with labels), a space and a number.
+    for line in lines:
+        if ( not line.startswith( '#' ) ):
+            float( line.rsplit( ' ', 1 )[ 1 ] )
+
+def test_disabled_metrics_count_nothing( metrics ):
+    llvm_metrics.disable_metrics()
+    parser.inst_parse( '%1 = load i32, i32* %p, align 4', yacc_debug = False )
+    assert metrics.snapshot()[ 'instructions_parsed' ] == 0
+    assert llvm_metrics.current_metrics() == None
+
+############################################################
+# A block (or a bufferful of parse_stream) counts each line under
+# its own kind, and the times of the lines add up to the block's.
+############################################################
+def test_block_lines_have_their_kinds( metrics ):
+    quiet = parser.ParseContext( resync_lines = True, error_sink = parser.discard_error )
+    block = [ '%1 = load i32, i32* %p, align 4', '%2 = add i32 %1, 1', '%3 = select i1 %c, i32 1,',
+              '', '%4 = load i32, i32* %q, align 4' ]
+    trees = parser.block_parse( '\n'.join( block ), context = quiet )
+    assert [ t == None for t in trees ] == [ False, False, True, False ]
+    snap = metrics.snapshot()
+    assert snap[ 'instructions_parsed' ] == 3
+    assert snap[ 'failures' ] == { 'syntax' : 1 }
+    latency = snap[ 'latency' ]
+    assert sorted( latency ) == [ 'AddInst', 'LoadInst', 'SelectInst' ]
+    assert ( latency[ 'LoadInst' ][ 'count' ], latency[ 'AddInst' ][ 'count' ], latency[ 'SelectInst' ][ 'count' ] ) == \
+        ( 2, 1, 1 )
+    assert latency[ 'LoadInst' ][ 'sum' ] == pytest.approx( 2 * latency[ 'AddInst' ][ 'sum' ] )
+
+def test_stream_lines_have_their_kinds( metrics ):
+    lines = [ '%1 = load i32, i32* %p, align 4', '%2 = add i32 %1, 1' ] * 5
+    assert all( [ tree != None for number, line, tree in parser.parse_stream( lines, buffer_lines = 4 ) ] )
+    snap = metrics.snapshot()
+    assert snap[ 'instructions_parsed' ] == 10
+    assert { kind : h[ 'count' ] for kind, h in snap[ 'latency' ].items() } == { 'LoadInst' : 5, 'AddInst' : 5 }
+
+############################################################
+# A block that lost track of its lines is parsed again a line at a
+# time, and those parses count the lines; the block itself only
+# counts its time.
+############################################################
+def test_lost_block_counts_only_time( metrics ):
+    context = parser.ParseContext()
+    before = metrics.start( context )
+    metrics.record( 'Block', '\n%a = add i32 1, 2\n%b = add i32 3, 4\n', None, context, before, 0 )
+    snap = metrics.snapshot()
+    assert ( snap[ 'instructions_parsed' ], snap[ 'failures' ] ) == ( 0, {} )
+    assert list( snap[ 'latency' ] ) == [ 'Block' ]
@@ -0,0 +1,95 @@
+# ============================================================
+#
+# The persistent parse cache (llvm_parse_cache).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import threading
+
+import llvm_instruction_parser as parser
+import llvm_parse_cache
+
+from conftest import testdata, shape
+
+def test_cached_trees_are_parsed_trees( tmp_path ):
+    filename = str( tmp_path / 'parses.sqlite' )
+    cache = llvm_parse_cache.ParseCache( filename )
+    first = [ parser.inst_parse( t, yacc_debug = False, context = parser.ParseContext( cache = cache ) )
+              for t in testdata ]
+    assert ( cache.hits, cache.misses ) == ( 0, len( testdata ) )
+    cache.close()
+    # Next time (a new run, say) they come out of the file.
+    cache = llvm_parse_cache.ParseCache( filename )
+    assert len( cache ) == len( testdata )
+    for line, tree in zip( testdata, first ):
+        again = parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( cache = cache ) )
+        assert shape( again ) == shape( tree ), line
+    assert ( cache.hits, cache.misses ) == ( len( testdata ), 0 )
+    cache.close()
+
+def test_failures_are_not_cached( tmp_path ):
+    cache = llvm_parse_cache.ParseCache( str( tmp_path / 'parses.sqlite' ) )
+    context = parser.ParseContext( cache = cache, error_sink = parser.discard_error )
+    assert parser.inst_parse( '%x = add i32 1,', yacc_debug = False, context = context ) == None
+    cache.flush()
+    assert len( cache ) == 0
+    cache.close()
+
+def test_ast_mode_has_its_own_entries( tmp_path ):
+    cache = llvm_parse_cache.ParseCache( str( tmp_path / 'parses.sqlite' ) )
+    line = testdata[ 0 ]
+    parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( cache = cache ) )
+    tree = parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( cache = cache, ast = True ) )
+    assert cache.misses == 2
+    plain = parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( ast = True ) )
+    assert shape( tree ) == shape( plain )
+    cache.close()
+
+def test_hits_and_misses_from_threads( tmp_path ):
+    cache = llvm_parse_cache.ParseCache( str( tmp_path / 'parses.sqlite' ) )
+    for line in testdata:
+        parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( cache = cache ) )
+    cache.flush()
+    def parse():
+        for line in testdata * 5:
+            parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( cache = cache ) )
+        cache.flush()
+    threads = [ threading.Thread( target = parse ) for i in range( 0, 8 ) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.hits == 8 * 5 * len( testdata )
+    assert cache.misses == len( testdata )
+    cache.close()
+
+############################################################
+# Past max_bytes the least recently used trees go, down to 90%.
+############################################################
+def test_eviction( tmp_path ):
+    cache = llvm_parse_cache.ParseCache( str( tmp_path / 'parses.sqlite' ), max_bytes = 4000, batch = 1 )
+    for line in testdata:
+        parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( cache = cache ) )
+    assert 0 < len( cache ) < len( testdata )
+    # The last one in is the most recently used, so it stayed.
+    cache.hits = 0
+    parser.inst_parse( testdata[ -1 ], yacc_debug = False, context = parser.ParseContext( cache = cache ) )
+    assert cache.hits == 1
+    cache.vacuum()
+    cache.close()
+
+def test_changed_grammar_empties_the_cache( tmp_path ):
+    filename = str( tmp_path / 'parses.sqlite' )
+    cache = llvm_parse_cache.ParseCache( filename )
+    parser.inst_parse( testdata[ 0 ], yacc_debug = False, context = parser.ParseContext( cache = cache ) )
+    cache.close()
+    saved = llvm_parse_cache._fingerprint
+    try:
+        llvm_parse_cache._fingerprint = 'something else'
+        cache = llvm_parse_cache.ParseCache( filename )
+        assert len( cache ) == 0
+        cache.close()
+    finally:
+        llvm_parse_cache._fingerprint = saved
@@ -0,0 +1,38 @@
+# ============================================================
+#
+# The grammar Profiler (llvm_metrics).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import io
+
+import llvm_instruction_parser as parser
+import llvm_metrics
+
+def test_profiler_counts_reductions_and_tokens():
+    profiler = llvm_metrics.Profiler()
+    lines = [ '%1 = load i32, i32* %p, align 4', '%2 = load i32, i32* %q, align 4' ]
+    for line in lines:
+        parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( profiler = profiler ) )
+    assert profiler.parses() == 2
+    assert profiler.nonterminals()[ 'LoadInst' ][ 0 ] == 2
+    assert profiler.tokens()[ 'load' ] == 2
+    # The same reductions for each of the two.
+    one = llvm_metrics.Profiler()
+    parser.inst_parse( lines[ 0 ], yacc_debug = False, context = parser.ParseContext( profiler = one ) )
+    assert { key: c[ 0 ] * 2 for key, c in one.productions().items() } == \
+        { key: c[ 0 ] for key, c in profiler.productions().items() }
+    assert 'LoadInst' in profiler.table( 'nonterminal' )
+    assert len( profiler.unused() ) > 0
+    assert profiler.report().startswith( 'Parses: 2\n' )
+
+def test_profiler_collapsed_stacks():
+    profiler = llvm_metrics.Profiler()
+    parser.inst_parse( '%x = add i32 %a, %b', yacc_debug = False, context = parser.ParseContext( profiler = profiler ) )
+    out = io.StringIO()
+    profiler.write_collapsed( out )
+    for line in out.getvalue().splitlines():
+        path, us = line.rsplit( ' ', 1 )
+        assert path.startswith( 'Instruction' ) and int( us ) > 0
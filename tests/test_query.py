@@ -0,0 +1,26 @@
+# ============================================================
+#
+# Tree patterns (llvm_query).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import llvm_instruction_parser as parser
+import llvm_query
+
+############################################################
+# A match that can be reached from several nested nodes is still
+# only one match.
+############################################################
+def test_each_match_once():
+    tree = parser.inst_parse( '%1 = alloca [10 x [20 x i8]], align 1', yacc_debug = False )
+    assert len( llvm_query.query( 'Type//IntType', tree ) ) == 1
+    # Different bindings are different matches, though.
+    assert len( llvm_query.query( 'Type:outer//IntType', tree ) ) == 3
+
+def test_shared_flyweight_matches_in_each_place():
+    tree = parser.inst_parse( '%x = add i32 4, 4', yacc_debug = False,
+                              context = parser.ParseContext( flyweights = True ) )
+    # One shared "4" in two places.
+    assert len( llvm_query.query( "*//'4'", tree ) ) == 2
@@ -0,0 +1,91 @@
+# ============================================================
+#
+# Source spans (ParseContext( spans = True ) and Node.text).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import mmap
+
+import pytest
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata
+
+def spanned( line ):
+    return parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( spans = True ) )
+
+############################################################
+# The root covers the whole line, each leaf is exactly the text of
+# its token, and each node covers its children.
+############################################################
+def test_single_line():
+    for line in testdata:
+        tree = spanned( line )
+        assert tree.text( line ) == line.strip()
+        for node, parent in tree.walk():
+            if ( node.was_terminal and not node.is_epsilon ):
+                assert node.text( line ) == node.nodetype, line
+            if ( parent != None and node.span != None ):
+                assert parent.span[ 0 ] <= node.span[ 0 ] <= node.span[ 1 ] <= parent.span[ 1 ], line
+
+def test_span_base():
+    line = '%x = add i32 %a, 1'
+    tree = parser.inst_parse( line, yacc_debug = False, context = parser.ParseContext( spans = True, span_base = 100 ) )
+    assert tree.span == ( 100, 100 + len( line ) )
+
+############################################################
+# In a block the spans count from the start of the block.
+############################################################
+def test_block():
+    text = '\n'.join( testdata )
+    trees = parser.block_parse( text, context = parser.ParseContext( resync_lines = True, spans = True ) )
+    for line, tree in zip( testdata, trees ):
+        assert tree.text( text ) == line
+        assert tree.locate_tree_node( 'Type' ).text( text ) == spanned( line ).locate_tree_node( 'Type' ).text( line )
+
+############################################################
+# parse_stream hands back each line with spans that count from the
+# start of that line, however the lines fell into bufferfuls.
+############################################################
+def test_parse_stream_offsets():
+    lines = [ '', '; a comment' ] + testdata + [ '   ' ] + testdata
+    context = parser.ParseContext( resync_lines = True, spans = True )
+    found = list( parser.parse_stream( lines, context, buffer_lines = 7 ) )
+    assert [ number for number, line, tree in found ] == \
+        [ i for i, line in enumerate( lines ) if line.strip() not in [ '', '; a comment' ] ]
+    for number, line, tree in found:
+        assert tree.text( line ) == line
+        for node, parent in tree.walk():
+            if ( node.was_terminal and node.span != None ):
+                assert node.text( line ) == node.nodetype, line
+
+############################################################
+# A shared type is in the trees of many lines at once, so it can't
+# have a span.
+############################################################
+def test_no_spans_with_type_table():
+    with pytest.raises( ValueError ):
+        parser.ParseContext( spans = True, type_table = parser.TypeTable() )
+
+############################################################
+# Bytes, an mmap or a memoryview give back a memoryview, not a copy.
+############################################################
+def test_bytes_give_a_memoryview( tmp_path ):
+    line = '%x = load i32, i32* %p, align 4'
+    tree = spanned( line )
+    ident = tree.locate_tree_node( 'LocalIdent' )
+    data = line.encode()
+    for source in [ data, bytearray( data ), memoryview( data ) ]:
+        piece = ident.text( source )
+        assert type( piece ) is memoryview and bytes( piece ) == b'%x'
+    path = tmp_path / 'line.ll'
+    path.write_bytes( data )
+    with open( path, 'rb' ) as f:
+        mapped = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+        piece = tree.text( mapped )
+        assert type( piece ) is memoryview and bytes( piece ) == data
+        piece.release()
+        mapped.close()
@@ -0,0 +1,92 @@
+# ============================================================
+#
+# Corpus statistics (llvm_stats).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import json
+
+import llvm_stats
+
+from conftest import testdata
+
+sample = [ '  %x = load i32, i32* %p, align 4, !tbaa !2', '', '; a comment', 'define i32 @f() {',
+           'call void @g(i8* nonnull %0) #13', '%y = add i32 1,', 'ret i32 0', '}', 'call void %fp()' ]
+
+def test_add_lines():
+    stats = llvm_stats.CorpusStats()
+    stats.add_lines( sample )
+    assert stats.lines == 7 and stats.instructions() == 3
+    assert stats.kinds == { 'CallInst': 2, 'LoadInst': 1 }
+    assert stats.types == { 'void': 2, 'i32*': 1, 'i32': 1, 'i8*': 1 }
+    assert stats.callees == { '@g': 1, '(indirect)': 1 }
+    assert stats.attributes == { '#13': 1, 'nonnull': 1 }
+    assert stats.metadata == { '!tbaa': 1 }
+    assert stats.failures == { 'AddInst': 1 }
+    assert stats.other_lines == { 'define': 1, 'ret': 1, '}': 1 }
+
+def test_merge_and_as_dict():
+    one = llvm_stats.CorpusStats()
+    one.add_lines( sample )
+    two = llvm_stats.CorpusStats()
+    two.add_lines( testdata )
+    both = llvm_stats.CorpusStats()
+    both.add_lines( sample + testdata )
+    assert llvm_stats.CorpusStats().merge( one ).merge( two ).as_dict() == both.as_dict()
+    summary = both.as_dict()
+    assert summary[ 'lines' ] == 7 + len( testdata )
+    assert summary[ 'instructions' ] == 3 + len( testdata ) == sum( summary[ 'kinds' ].values() )
+    assert summary[ 'value_instructions' ] + summary[ 'other_instructions' ] == summary[ 'instructions' ]
+    assert summary[ 'failed' ] == 1
+    counts = list( summary[ 'kinds' ].values() )
+    assert counts == sorted( counts, reverse = True )
+    assert json.loads( json.dumps( summary ) ) == summary
+    assert 'Instruction kinds (' in both.report()
+
+############################################################
+# Each line goes to the byte range it starts in, however the
+# ranges are cut.
+############################################################
+def test_range_lines( tmp_path ):
+    filename = tmp_path / 'small.ll'
+    filename.write_text( '\n'.join( testdata[ :4 ] ) + '\n' )
+    size = filename.stat().st_size
+    whole = [ line + '\n' for line in testdata[ :4 ] ]
+    for cut in range( 0, size + 1 ):
+        first = list( llvm_stats._range_lines( str( filename ), 0, cut ) )
+        second = list( llvm_stats._range_lines( str( filename ), cut, size ) )
+        assert first + second == whole, cut
+
+############################################################
+# The pieces add up to the whole. The file has to be big enough to be
+# split (a megabyte), so the instructions are padded out with
+# comments, which are cheap, just enough that each range starts part
+# way through an instruction.
+############################################################
+def padded( width, workers ):
+    lines = []
+    for i in range( 0, ( 1 << 20 ) // ( width + 50 ) + 1 ):
+        lines.append( '; ' + 'x' * width )
+        lines.append( testdata[ i % len( testdata ) ] )
+    text = '\n'.join( lines ) + '\n'
+    step = len( text ) // workers + 1
+    for begin in range( step, len( text ), step ):
+        if ( text[ begin - 1 ] == '\n' or text[ text.rfind( '\n', 0, begin ) + 1 ] == ';' ):
+            return None
+    return ( lines, text )
+
+def test_collect_file_workers( tmp_path ):
+    workers = 3
+    width = 100
+    while ( padded( width, workers ) == None ):
+        width = width + 1
+    lines, text = padded( width, workers )
+    assert len( text ) >= ( 1 << 20 )
+    filename = tmp_path / 'big.ll'
+    filename.write_text( text )
+    one = llvm_stats.collect_file( str( filename ), workers = 1 ).as_dict()
+    many = llvm_stats.collect_file( str( filename ), workers = workers ).as_dict()
+    assert many == one
+    assert one[ 'lines' ] == len( lines ) // 2 == one[ 'instructions' ]
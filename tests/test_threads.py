@@ -0,0 +1,25 @@
+# ============================================================
+#
+# Parsing from many threads at once.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata
+
+def serials( node ):
+    return [ node.serial ] + [ s for x in node.children for s in serials( x ) ]
+
+############################################################
+# Parse from a lot of threads at once and get exactly what one
+# thread gets, serial numbers and all.
+############################################################
+def test_threaded_parse_matches():
+    expected = [ parser.inst_parse( t, yacc_debug = False ) for t in testdata ]
+    expected = [ ( r.tree_as_string(), serials( r ) ) for r in expected ]
+    trees = parser.parse_many( testdata * 20, threads = 16 )
+    for i in range( 0, len( trees ) ):
+        assert ( trees[ i ].tree_as_string(), serials( trees[ i ] ) ) == expected[ i % len( testdata ) ]
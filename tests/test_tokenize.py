@@ -0,0 +1,112 @@
+# ============================================================
+#
+# The tokenizer (tokenize, tokenize_lines and tokenize_batch)
+# against PLY's own lexer.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import collections
+
+import pytest
+
+import llvm_instruction_parser as parser
+
+from conftest import testdata
+
+malformed = [ '%x = add i32 ^ 1',
+              'entry:',
+              '$foo = comdat any',
+              '%x = add i32 1, 2 ) ^^ @',
+              '%s = load i8, i8* @"no end',
+              'call void @f(), !dbg !foo\\bar, !bar !0-9',
+              '%f = fadd double 1.5e+3, -0.25, 0xK4000, +7.',
+              'DW_TAG_base_type DIFlagPrototyped DW_OP_plus_uconst CSK_MD5',
+              '%y = $"comdat" @1 #2 !3 -4 i64',
+              '   ; just a comment',
+              '' ]
+
+lines = testdata + malformed
+
+def error_list( context ):
+    return [ ( e.kind, e.token_type, e.token_value, e.position, e.line, e.column, e.source ) for e in context.errors ]
+
+############################################################
+# What PLY's lexer makes of some text, as ( type, value, position ).
+############################################################
+def lexed( text, context, block_mode ):
+    found = []
+    with parser.using_context( context ):
+        lexer = parser._get_lexer( block_mode = block_mode )
+        lexer.input( text )
+        while True:
+            token = lexer.token()
+            if ( token == None ):
+                break
+            found.append( ( token.type, token.value, token.lexpos ) )
+    return found
+
+@pytest.mark.parametrize( 'resync', [ False, True ] )
+def test_tokenize( resync ):
+    errors = 0
+    for line in lines:
+        expect = parser.ParseContext( error_sink = parser.discard_error, resync_lines = resync )
+        got = parser.ParseContext( error_sink = parser.discard_error, resync_lines = resync )
+        assert parser.tokenize( line, got ) == lexed( line, expect, False ), line
+        assert error_list( got ) == error_list( expect ), line
+        errors = errors + expect.number_of_errors
+    assert errors >= 6
+
+############################################################
+# A lot of lines at once are one block to the lexer, and the line
+# numbers and offsets come from its newline tokens.
+############################################################
+def block_tokens( lines, context ):
+    found = []
+    number = 0
+    line_start = 0
+    for kind, value, pos in lexed( '\n'.join( lines ), context, True ):
+        if ( kind == 'newline' ):
+            number = number + len( value )
+            line_start = pos + len( value )
+        else:
+            found.append( ( number, kind, value, pos - line_start ) )
+    return found
+
+@pytest.mark.parametrize( 'resync', [ False, True ] )
+def test_tokenize_lines( resync ):
+    every = lines + list( reversed( lines ) )
+    expect = parser.ParseContext( error_sink = parser.discard_error, resync_lines = resync )
+    want = block_tokens( every, expect )
+    for buffer_lines in [ 1, 5, 4096 ]:
+        got = parser.ParseContext( error_sink = parser.discard_error, resync_lines = resync )
+        assert list( parser.tokenize_lines( every, got, buffer_lines ) ) == want
+        assert got.number_of_errors == expect.number_of_errors > 0
+        if ( buffer_lines == 4096 ):
+            # (In bufferfuls, error positions count from the start of
+            # each bufferful.)
+            assert error_list( got ) == error_list( expect )
+        else:
+            assert [ e[ :3 ] for e in error_list( got ) ] == [ e[ :3 ] for e in error_list( expect ) ]
+
+@pytest.mark.parametrize( 'resync', [ False, True ] )
+def test_tokenize_batch( resync ):
+    expect = parser.ParseContext( error_sink = parser.discard_error, resync_lines = resync )
+    want = block_tokens( lines, expect )
+    batch = parser.tokenize_batch( lines, parser.ParseContext( error_sink = parser.discard_error, resync_lines = resync ) )
+    assert len( batch ) == len( lines )
+    for i in range( 0, len( lines ) ):
+        assert batch.line( i ) == [ ( kind, value, offset ) for number, kind, value, offset in want if number == i ], lines[ i ]
+    assert batch.type_counts() == dict( collections.Counter( [ kind for number, kind, value, offset in want ] ) )
+    assert list( batch.types ) == [ parser.token_codes[ kind ] for number, kind, value, offset in want ]
+    assert batch.starts[ -1 ] == len( batch.values ) == len( want )
+
+############################################################
+# The master expression is PLY's, groups and all, without the
+# capturing.
+############################################################
+def test_without_groups():
+    assert parser._without_groups( r'(a|(b))[(]\(x(?:y)' ) == r'(?:a|(?:b))[(]\(x(?:y)'
+    assert parser._without_groups( r'[]()](c)[^](](d)' ) == r'[]()](?:c)[^](](?:d)'
+    assert parser._scan_re.groups == len( parser._scan_re.groupindex )
@@ -0,0 +1,70 @@
+# ============================================================
+#
+# The binary tree file (llvm_tree_file).
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import pytest
+
+import llvm_instruction_parser as parser
+import llvm_tree_file
+
+from conftest import testdata, shape
+
+def test_dumps_and_loads():
+    for line in testdata:
+        tree = parser.inst_parse( line, yacc_debug = False )
+        assert shape( llvm_tree_file.loads( llvm_tree_file.dumps( tree ) ) ) == shape( tree ), line
+
+def test_write_and_read_back( tmp_path ):
+    filename = str( tmp_path / 'module.trees' )
+    quiet = parser.ParseContext( error_sink = parser.discard_error )
+    lines = testdata + [ '%x = add i32 1,' ]
+    trees = [ parser.inst_parse( line, yacc_debug = False, context = quiet ) for line in lines ]
+    # A small buffer, so it gets written out more than once.
+    with llvm_tree_file.TreeWriter( filename, buffer_size = 256 ) as writer:
+        for tree in trees:
+            writer.write( tree )
+    with llvm_tree_file.TreeReader( filename ) as reader:
+        assert len( reader ) == len( lines )
+        assert reader[ -1 ] == None
+        # Out of order, one at a time.
+        for i in reversed( range( 0, len( testdata ) ) ):
+            assert reader[ i ].tree_as_string() == trees[ i ].tree_as_string()
+        # Going on from one context, the serials come out like the parse.
+        context = parser.ParseContext()
+        for i in range( 0, len( testdata ) ):
+            expect = parser.inst_parse( lines[ i ], yacc_debug = False, context = parser.ParseContext() )
+            got = reader.get( i, context )
+            assert [ x.nodetype for x, parent in got.walk() ] == [ x.nodetype for x, parent in expect.walk() ]
+        with pytest.raises( IndexError ):
+            reader.get( len( lines ) )
+
+def test_not_a_tree_file( tmp_path ):
+    filename = tmp_path / 'junk.trees'
+    filename.write_bytes( b'not a tree file at all, no, not even close' )
+    with pytest.raises( ValueError ):
+        llvm_tree_file.TreeReader( str( filename ) )
+
+def test_flyweights_on_the_way_back():
+    tree = parser.inst_parse( '%x = add i32 4, 4', yacc_debug = False )
+    back = llvm_tree_file.loads( llvm_tree_file.dumps( tree ), parser.ParseContext( flyweights = True ) )
+    same = parser.inst_parse( '%x = add i32 4, 4', yacc_debug = False, context = parser.ParseContext( flyweights = True ) )
+    assert shape( back ) == shape( same )
+
+############################################################
+# A tree deeper than Python will recurse still goes there and back.
+############################################################
+def test_deep_tree():
+    depth = 5000
+    tree = parser.make_node( 'Type', [ 'i32' ] )
+    for i in range( 0, depth ):
+        tree = parser.make_node( 'PointerType', [ tree, '*' ] )
+    back = llvm_tree_file.loads( llvm_tree_file.dumps( tree ) )
+    for i in range( 0, depth ):
+        assert back.nodetype == 'PointerType' and len( back.children ) == 2
+        assert back.children[ 1 ].nodetype == '*' and back.children[ 1 ].was_terminal
+        back = back.children[ 0 ]
+    assert back.nodetype == 'Type' and back.children[ 0 ].nodetype == 'i32'
@@ -0,0 +1,40 @@
+# ============================================================
+#
+# Types in a TypeTable are one shared instance each.
+#
+# Author:   Bill Mahoney
+#
+# ============================================================
+
+import llvm_instruction_parser as parser
+import llvm_fast_path
+
+from conftest import testdata, shape
+
+def test_type_table_shares_types():
+    context = parser.ParseContext( type_table = parser.TypeTable() )
+    one = parser.inst_parse( '%1 = alloca [4 x i8], align 1', yacc_debug = False, context = context )
+    two = parser.inst_parse( '%2 = alloca [4 x i8], align 1', yacc_debug = False, context = context )
+    assert one.locate_tree_node( 'Type' ) is two.locate_tree_node( 'Type' )
+    assert one.locate_tree_node( 'Type' ).parent == None
+    assert context.type_table.hits > 0
+
+############################################################
+# The fast path gives the same trees (and table) as the full
+# parser. A line it hands back part way leaves nothing in the table.
+############################################################
+def test_fast_path_type_table():
+    for line in testdata:
+        fast = parser.ParseContext( type_table = parser.TypeTable() )
+        full = parser.ParseContext( type_table = parser.TypeTable() )
+        tree = llvm_fast_path.fast_path_parse( line, fast )
+        if ( tree == None ):
+            continue
+        assert shape( tree ) == shape( parser.inst_parse( line, yacc_debug = False, context = full ) ), line
+        assert ( fast.serial, fast.type_table.hits, fast.type_table.misses, len( fast.type_table ) ) == \
+            ( full.serial, full.type_table.hits, full.type_table.misses, len( full.type_table ) ), line
+
+def test_fast_path_bail_out_leaves_no_types():
+    context = parser.ParseContext( type_table = parser.TypeTable() )
+    assert llvm_fast_path.fast_path_parse( '%x = alloca [4 x i8], i64 2', context ) == None
+    assert len( context.type_table ) == 0 and context.serial == 0